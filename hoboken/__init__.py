@@ -19,7 +19,10 @@ del NullHandler, logging
 
 # Imports we import into the namespace.
 from hoboken.application import HobokenBaseApplication, condition, halt, \
-    pass_route
+    pass_route, timeout, validator
+
+# Our built-in server.
+from hoboken.serving import serve
 
 # Submodules we pull in here.
 from . import matchers
@@ -31,7 +34,8 @@ from hoboken.helpers import *
 
 # Build our actual application.
 class HobokenApplication(HobokenBaseApplication, HobokenCachingMixin,
-                         HobokenRedirectMixin, HobokenRenderMixin):
+                         HobokenRedirectMixin, HobokenRenderMixin,
+                         HobokenEventStreamMixin, HobokenBatchMixin):
     pass
 
 # Create our extension module.
@@ -0,0 +1,758 @@
+"""
+An event-loop based HTTP/1.1 server, built on asyncio.
+
+The event loop owns every connection, so idle keep-alive connections cost
+only a little memory, and a single process can hold thousands of them.
+Requests are parsed incrementally on the loop, and each one is handed to the
+WSGI application on a thread pool, so a blocking application never stalls
+the loop.  This module requires Python 3.4 or later.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import socket
+import signal
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from hoboken.pool import drain_all
+from hoboken.serving import HTTPParseError, MAX_HEADERS, MAX_LINE, \
+    ResponseWriter, build_environ, error_response, parse_chunk_size, \
+    parse_header_line, parse_request_line, request_framing
+
+try:
+    import uvloop
+except ImportError:         # pragma: no cover
+    uvloop = None
+
+
+logger = logging.getLogger(__name__)
+
+# The maximum size of a request's line and headers.
+MAX_HEAD = MAX_LINE * 2
+
+# When more than this much of a request's body is buffered, waiting for the
+# application to read it, we stop reading from the client until it's
+# consumed.  The same limit applies to pipelined requests that are waiting
+# for an earlier response to finish.
+HIGH_WATER = 256 * 1024
+
+# If an application doesn't read a request's body, we discard up to this
+# much of it to keep the connection alive - beyond this, we close it.
+MAX_DISCARD = 64 * 1024
+
+
+def new_event_loop():
+    """
+    Create a new event loop, using uvloop if it's installed.
+    """
+    if uvloop is not None:      # pragma: no cover
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+class BodyReader(object):
+    """
+    The wsgi.input stream for a request on the event loop server.  The loop
+    pushes chunks of the body in as they arrive, and the application reads
+    them from its own thread, blocking until data is available.
+
+    read1() returns each received chunk as-is, without copying it into a
+    larger buffer, so that a request body can be handed straight to a
+    parser's write() method.
+    """
+    def __init__(self, on_consumed=None, on_first_read=None):
+        self.on_consumed = on_consumed
+        self.on_first_read = on_first_read
+        self.discard = False
+
+        self._cond = threading.Condition()
+        self._chunks = deque()
+        self._buffered = 0
+        self._eof = False
+        self._error = None
+
+    # Called from the event loop.
+    # --------------------------------------------------
+    @property
+    def buffered(self):
+        return self._buffered
+
+    def feed(self, data):
+        if self.discard:
+            return
+        with self._cond:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self._cond.notify()
+
+    def feed_eof(self, error=None):
+        with self._cond:
+            self._eof = True
+            self._error = error
+            self._cond.notify()
+
+    # Called from the application's thread.
+    # --------------------------------------------------
+    def _wait(self):
+        """
+        Wait until there's data to read, or the body has ended.  Must be
+        called with the condition held.
+        """
+        if self.on_first_read is not None:
+            callback, self.on_first_read = self.on_first_read, None
+            callback()
+
+        while not self._chunks and not self._eof:
+            # Before we wait for more, let the loop know what we've taken
+            # so far, in case it stopped reading because the buffer was
+            # full - otherwise, a large read() would wait forever.
+            self._consumed()
+            self._cond.wait()
+        if not self._chunks and self._error is not None:
+            raise self._error
+
+    def _take(self, size):
+        """
+        Remove and return up to size bytes from the first buffered chunk.
+        Must be called with the condition held, and data available.
+        """
+        chunk = self._chunks[0]
+        if size < 0 or size >= len(chunk):
+            self._chunks.popleft()
+        else:
+            self._chunks[0] = chunk[size:]
+            chunk = chunk[:size]
+        self._buffered -= len(chunk)
+        return chunk
+
+    def _consumed(self):
+        if self.on_consumed is not None:
+            self.on_consumed(self._buffered)
+
+    def read1(self, size=-1):
+        if size is None:
+            size = -1
+
+        with self._cond:
+            self._wait()
+            if not self._chunks:
+                return b''
+            data = self._take(size)
+
+        self._consumed()
+        return data
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+
+        parts = []
+        with self._cond:
+            while size != 0:
+                self._wait()
+                if not self._chunks:
+                    break
+                data = self._take(size)
+                parts.append(data)
+                if size > 0:
+                    size -= len(data)
+
+        self._consumed()
+        if len(parts) == 1:
+            return parts[0]
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+
+        parts = []
+        with self._cond:
+            while size != 0:
+                self._wait()
+                if not self._chunks:
+                    break
+
+                # Only take up to the end of the line, if there is one.
+                end = self._chunks[0].find(b'\n') + 1
+                if end > 0 and (size < 0 or end < size):
+                    want = end
+                else:
+                    want = size
+                data = self._take(want)
+                parts.append(data)
+                if data.endswith(b'\n'):
+                    break
+                if size > 0:
+                    size -= len(data)
+
+        self._consumed()
+        return b''.join(parts)
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+
+class _TransportSocket(object):
+    """
+    This class gives ResponseWriter, which runs in the application's thread,
+    a blocking sendall() that writes to a connection's transport on the event
+    loop.  If the transport's buffer is full, sendall() waits for it to
+    drain.
+    """
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+    def sendall(self, data):
+        protocol = self.protocol
+        protocol.can_write.wait()
+        if protocol.closed:
+            raise socket.error(32, "Connection closed")
+        protocol.loop.call_soon_threadsafe(protocol.write, data)
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """
+    This class handles a single client connection on the event loop.  Only
+    one request on a connection is processed at once; any pipelined requests
+    that arrive in the meantime are buffered until its response is
+    complete.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.loop = server.loop
+        self.transport = None
+        self.closed = False
+
+        self.can_write = threading.Event()
+        self.can_write.set()
+        self.paused = False
+
+        self.buffer = b''
+        self._scanned = 0
+        self._timer = None
+
+        # A streaming response body that's sent from the loop.
+        self.stream = None
+        self.stream_response = None
+        self._stream_timer = None
+
+        # The state of the current request.
+        self.busy = False
+        self.body = None
+        self.body_remaining = 0
+        self.chunk_state = None
+        self.discarded = 0
+
+    # asyncio callbacks
+    # --------------------------------------------------
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client_address = transport.get_extra_info('peername')
+        self.server_address = transport.get_extra_info('sockname')[:2]
+        self.server.connections.add(self)
+
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except (socket.error, AttributeError):    # pragma: no cover
+                pass
+
+        self._arm_timer()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.server.connections.discard(self)
+        self.can_write.set()
+        self._cancel_timer()
+        if self.body is not None:
+            self.body.feed_eof(IOError("Client disconnected"))
+        if self.stream is not None:
+            self._end_stream()
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+        if self.stream is not None:
+            self._pump_stream()
+
+    def data_received(self, data):
+        if self.buffer:
+            self.buffer += data
+        else:
+            self.buffer = data
+        self._process()
+
+    # Helpers
+    # --------------------------------------------------
+    def write(self, data):
+        if not self.closed:
+            self.transport.write(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.transport.close()
+
+    def _arm_timer(self):
+        self._cancel_timer()
+        if self.busy or self.closed:
+            return
+        timeout = (self.server.request_timeout if self.buffer
+                   else self.server.keepalive)
+        self._timer = self.loop.call_later(timeout, self.close)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _pause_reading(self):
+        if not self.paused and not self.closed:
+            self.paused = True
+            self.transport.pause_reading()
+
+    def _resume_reading(self):
+        if self.paused and not self.closed:
+            self.paused = False
+            self.transport.resume_reading()
+
+    def _body_consumed(self, buffered):
+        # Called from the application's thread.
+        if self.paused and buffered < HIGH_WATER // 2:
+            self.loop.call_soon_threadsafe(self._resume_reading)
+
+    def _send_error(self, status):
+        self.write(error_response(status))
+        self.close()
+
+    # Parsing
+    # --------------------------------------------------
+    def _process(self):
+        while not self.closed:
+            if self.body is not None:
+                if not self._read_body():
+                    break
+            elif self.busy:
+                # This is a pipelined request - we wait for the current
+                # response to finish before handling it.
+                if len(self.buffer) > HIGH_WATER:
+                    self._pause_reading()
+                break
+            elif not self._read_head():
+                break
+
+        self._arm_timer()
+
+    def _read_head(self):
+        """
+        Try to parse a request head from the buffer, and start handling the
+        request.  Returns False if more data is needed.
+        """
+        buf = self.buffer
+        idx = buf.find(b'\r\n\r\n', self._scanned)
+        if idx < 0:
+            if len(buf) > MAX_HEAD:
+                self._send_error(431)
+            self._scanned = max(0, len(buf) - 3)
+            return False
+
+        head = buf[:idx]
+        self.buffer = buf[idx + 4:]
+        self._scanned = 0
+
+        lines = head.split(b'\r\n')
+        while lines and not lines[0]:
+            lines.pop(0)
+        if not lines:
+            # Just some stray empty lines.
+            return True
+
+        try:
+            if len(lines[0]) > MAX_LINE:
+                raise HTTPParseError("Request line too long", status=414)
+            if len(lines) > MAX_HEADERS + 1:
+                raise HTTPParseError("Too many headers", status=431)
+
+            method, target, version = parse_request_line(lines[0])
+            headers = [parse_header_line(l) for l in lines[1:]]
+            length, chunked, keep_alive, expect_continue = \
+                request_framing(version, headers)
+        except HTTPParseError as e:
+            logger.debug("Bad request from %r: %s", self.client_address, e)
+            self._send_error(e.status)
+            return False
+
+        on_first_read = None
+        if expect_continue:
+            on_first_read = self._send_continue
+
+        body = BodyReader(self._body_consumed, on_first_read)
+        if chunked:
+            self.body = body
+            self.chunk_state = 'size'
+        elif length > 0:
+            self.body = body
+            self.body_remaining = length
+            self.chunk_state = None
+        else:
+            body.feed_eof()
+
+        environ = build_environ(method, target, version, headers, body,
+                                self.client_address, self.server_address,
+                                multithread=True)
+        response = ResponseWriter(_TransportSocket(self), version,
+                                  keep_alive, method == b'HEAD')
+
+        self.busy = True
+        self.discarded = 0
+        self._cancel_timer()
+        self.server.dispatch(self, response, environ)
+        return True
+
+    def _send_continue(self):
+        _TransportSocket(self).sendall(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+    def _feed_body(self, data):
+        if self.body.discard:
+            self.discarded += len(data)
+            if self.discarded > MAX_DISCARD:
+                self.close()
+                return
+        self.body.feed(data)
+        if self.body.buffered > HIGH_WATER:
+            self._pause_reading()
+
+    def _end_body(self):
+        self.body.feed_eof()
+        self.body = None
+
+    def _read_body(self):
+        """
+        Pass as much of the request body as possible from the buffer to the
+        application.  Returns False if more data is needed.
+        """
+        if self.chunk_state is None:
+            buf = self.buffer
+            if not buf:
+                return False
+
+            # Pass the received data through without copying it, if it's
+            # all part of the body.
+            if len(buf) <= self.body_remaining:
+                data, self.buffer = buf, b''
+            else:
+                data = buf[:self.body_remaining]
+                self.buffer = buf[self.body_remaining:]
+
+            self.body_remaining -= len(data)
+            self._feed_body(data)
+            if self.body_remaining == 0:
+                self._end_body()
+            return not self.closed
+
+        return self._read_chunked()
+
+    def _read_chunked(self):
+        while self.buffer and not self.closed:
+            buf = self.buffer
+            if self.chunk_state == 'size' or self.chunk_state == 'trailer':
+                idx = buf.find(b'\r\n')
+                if idx < 0:
+                    if len(buf) > MAX_LINE:
+                        self._send_error(400)
+                    return False
+
+                line, self.buffer = buf[:idx], buf[idx + 2:]
+                if self.chunk_state == 'trailer':
+                    if not line:
+                        self._end_body()
+                        return True
+                    continue
+
+                try:
+                    size = parse_chunk_size(line)
+                except HTTPParseError:
+                    self._send_error(400)
+                    return False
+
+                if size == 0:
+                    self.chunk_state = 'trailer'
+                else:
+                    self.chunk_state = 'data'
+                    self.body_remaining = size
+
+            elif self.chunk_state == 'data':
+                if len(buf) <= self.body_remaining:
+                    data, self.buffer = buf, b''
+                else:
+                    data = buf[:self.body_remaining]
+                    self.buffer = buf[self.body_remaining:]
+                self.body_remaining -= len(data)
+                self._feed_body(data)
+                if self.body_remaining == 0:
+                    self.chunk_state = 'crlf'
+
+            elif self.chunk_state == 'crlf':
+                if len(buf) < 2:
+                    return False
+                self.buffer = buf[2:]
+                self.chunk_state = 'size'
+
+        return False
+
+    # Streaming
+    # --------------------------------------------------
+    def start_stream(self, stream, response):
+        """
+        Send a pollable response body from the event loop, rather than
+        holding a thread while waiting for it.  The stream's set_notify()
+        is given a function that wakes us when more of it is ready.
+        """
+        self.stream = stream
+        self.stream_response = response
+        if self.closed or response.is_head:
+            self._end_stream()
+            return
+
+        loop = self.loop
+        stream.set_notify(
+            lambda: loop.call_soon_threadsafe(self._pump_stream))
+        self._pump_stream()
+
+    def _pump_stream(self):
+        stream = self.stream
+        if stream is None or self.closed or not self.can_write.is_set():
+            return
+
+        sent = False
+        while True:
+            try:
+                data = stream.poll()
+            except StopIteration:
+                self._end_stream()
+                return
+            if data is None:
+                break
+            self.write(self.stream_response._frame(data))
+            sent = True
+
+        if sent or self._stream_timer is None:
+            self._arm_stream_timer()
+
+    def _arm_stream_timer(self):
+        if self._stream_timer is not None:
+            self._stream_timer.cancel()
+            self._stream_timer = None
+
+        interval = getattr(self.stream, 'heartbeat', None)
+        if interval and hasattr(self.stream, 'idle'):
+            self._stream_timer = self.loop.call_later(interval,
+                                                      self._stream_idle)
+
+    def _stream_idle(self):
+        self._stream_timer = None
+        if self.stream is not None and not self.closed:
+            if self.can_write.is_set():
+                self.write(self.stream_response._frame(self.stream.idle()))
+            self._arm_stream_timer()
+
+    def _end_stream(self):
+        stream, self.stream = self.stream, None
+        response, self.stream_response = self.stream_response, None
+        if self._stream_timer is not None:
+            self._stream_timer.cancel()
+            self._stream_timer = None
+
+        try:
+            stream.close()
+        except Exception:
+            logger.exception("Error closing response stream")
+
+        if self.closed:
+            return
+        if response.chunked and not response.is_head:
+            self.write(b'0\r\n\r\n')
+        self.request_done(response)
+
+    # Completion
+    # --------------------------------------------------
+    def request_done(self, response):
+        """
+        Called on the event loop once the application has finished with a
+        request.
+        """
+        self.busy = False
+        if self.closed:
+            return
+
+        if not response.keep_alive:
+            self.close()
+            return
+
+        # If the application didn't read all of the body, we discard the rest
+        # as it arrives.
+        if self.body is not None:
+            self.body.discard = True
+            if self.chunk_state is None and \
+                    self.body_remaining > MAX_DISCARD:
+                self.close()
+                return
+
+        self._resume_reading()
+        self._process()
+
+
+def _is_pollable(result):
+    # Bodies that can be polled for data are sent from the event loop - see
+    # EventStream for an example.
+    return getattr(result, 'pollable', False)
+
+
+class AsyncServer(object):
+    """
+    An HTTP/1.1 server that handles connections on an asyncio event loop,
+    and runs a WSGI application on a pool of threads.  By default, the loop
+    is created with new_event_loop(), which uses uvloop if it's installed;
+    any other loop can be passed in instead.
+    """
+    def __init__(self, app, host='127.0.0.1', port=8000, threads=16,
+                 loop=None, backlog=2048, keepalive=75.0,
+                 request_timeout=30.0, graceful_timeout=30.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.threads = threads
+        self.loop = loop or new_event_loop()
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.request_timeout = request_timeout
+        self.graceful_timeout = graceful_timeout
+
+        self.address = None
+        self.socket = None
+        self.server = None
+        self.connections = set()
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+        self.busy = 0
+        self.requests = 0
+
+    def bind(self):
+        if self.socket is not None:
+            return
+
+        info = socket.getaddrinfo(self.host, self.port, 0,
+                                  socket.SOCK_STREAM)[0]
+        self.socket = socket.socket(info[0], socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(info[4])
+        self.socket.listen(self.backlog)
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+        logger.info("Listening on http://%s:%d", self.address[0],
+                    self.address[1])
+
+    def stats(self):
+        return {
+            'connections': len(self.connections),
+            'busy': self.busy,
+            'requests': self.requests,
+        }
+
+    def dispatch(self, protocol, response, environ):
+        self.busy += 1
+        self.requests += 1
+        fut = self.loop.run_in_executor(self.executor, self._call_app,
+                                        response, environ)
+
+        def done(fut):
+            self.busy -= 1
+            stream = fut.result()
+            if stream is not None:
+                protocol.start_stream(stream, response)
+            else:
+                protocol.request_done(response)
+        fut.add_done_callback(done)
+
+    def _call_app(self, response, environ):
+        try:
+            return response.run(self.app, environ, detach=_is_pollable)
+        except socket.error:
+            response.keep_alive = False
+
+    def start(self):
+        """
+        Start listening.  The server runs once the event loop does.
+        """
+        self.bind()
+        self.server = self.loop.run_until_complete(self.loop.create_server(
+            lambda: HTTPProtocol(self), sock=self.socket))
+
+    def run(self):
+        """
+        Start the server, and run the event loop until stop() is called.
+        """
+        self.start()
+        if threading.current_thread() is threading.main_thread():
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                self.loop.add_signal_handler(sig, self._stop)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            self.executor.shutdown(wait=True)
+            if not drain_all(self.graceful_timeout):
+                logger.warning("Stopping with background work still queued")
+            self.loop.close()
+            logger.info("Server stopped")
+
+    def stop(self):
+        """
+        Stop the server, letting in-progress requests finish.  This can be
+        called from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+        deadline = self.loop.time() + self.graceful_timeout
+
+        def check():
+            # Streaming responses never finish by themselves, so they're
+            # closed along with idle connections.
+            for conn in list(self.connections):
+                if not conn.busy or conn.stream is not None:
+                    conn.close()
+            if self.connections and self.loop.time() < deadline:
+                self.loop.call_later(0.1, check)
+            else:
+                for conn in list(self.connections):
+                    conn.close()
+                self.loop.stop()
+        check()
+
+
+def serve_async(app, host='127.0.0.1', port=8000, **kwargs):
+    """
+    Serve a WSGI application with an AsyncServer.  Any additional keyword
+    arguments are passed to AsyncServer.  This blocks until the server is
+    stopped.
+    """
+    AsyncServer(app, host=host, port=port, **kwargs).run()
@@ -0,0 +1,194 @@
+"""
+Sampling of the memory allocated while handling requests.  When the
+ALLOCATION_SAMPLE_RATE config value is set, a fraction of requests are
+handled with tracemalloc tracing, and the memory they retain is recorded for
+the route that handled them.  Routes that retain more memory on every sample
+are flagged, since that usually points to a leak.
+
+tracemalloc is only available on Python 3.4 and above; elsewhere, requests
+are never sampled.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import random
+import logging
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    import tracemalloc
+except ImportError:         # pragma: no cover
+    tracemalloc = None
+
+from hoboken.metrics import ROUTE_KEY, route_label
+
+
+logger = logging.getLogger(__name__)
+
+
+class RouteAllocations(object):
+    """
+    The memory retained by sampled requests to a single route.
+    """
+    def __init__(self, label):
+        self.label = label
+        self.samples = 0
+        self.retained = 0
+        self.streak = 0
+        self.growing = False
+        self.sites = {}
+
+    def add(self, retained, sites, growth_bytes, growth_samples, top):
+        self.samples += 1
+        self.retained += retained
+        if retained > growth_bytes:
+            self.streak += 1
+        else:
+            self.streak = 0
+
+        flagged = not self.growing and self.streak >= growth_samples
+        self.growing = self.streak >= growth_samples
+
+        for site, size in sites:
+            self.sites[site] = self.sites.get(site, 0) + size
+        if len(self.sites) > top * 4:
+            self.sites = dict(self.top_sites(top * 2))
+        return flagged
+
+    def top_sites(self, limit):
+        """
+        Return the (site, bytes) pairs that have retained the most memory.
+        """
+        return sorted(self.sites.items(), key=lambda i: -i[1])[:limit]
+
+    def __repr__(self):
+        return ("RouteAllocations({0!r}, samples={1}, retained={2}, "
+                "growing={3})".format(self.label, self.samples, self.retained,
+                                      self.growing))
+
+
+class AllocationSampler(object):
+    """
+    Samples the memory retained by requests.  The settings are read from a
+    mapping (normally the application's config):
+      - ALLOCATION_SAMPLE_RATE: the fraction of requests to sample.
+      - ALLOCATION_TOP_SITES: the number of allocation sites to keep for
+        each route.
+      - ALLOCATION_GROWTH_BYTES, ALLOCATION_GROWTH_SAMPLES: a route is
+        flagged as growing when this many consecutive samples have each
+        retained more than this many bytes.
+
+    Tracing is process-wide, so only one request is sampled at a time, and
+    memory allocated by other threads in the meantime is included.
+    """
+    def __init__(self, settings, registry, logger=logger):
+        self.settings = settings
+        self.logger = logger
+        self.routes = {}
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+        self.sampled = registry.counter(
+            'hoboken_allocation_samples_total',
+            'Requests sampled for memory allocations.', ('route',))
+        self.retained = registry.gauge(
+            'hoboken_allocation_retained_bytes',
+            'Memory retained by the last sampled request.', ('route',))
+        self.flagged = registry.counter(
+            'hoboken_allocation_growth_flags_total',
+            'Times a route was flagged for retaining memory on every sample.',
+            ('route',))
+
+    def _sample(self):
+        rate = self.settings.get('ALLOCATION_SAMPLE_RATE')
+        return (tracemalloc is not None and rate and
+                random.random() < rate and self._active.acquire(False))
+
+    def call(self, environ, func):
+        """
+        Call func, which handles the request with the given environ, sampling
+        its allocations if it's chosen.
+        """
+        if not self._sample():
+            return func()
+
+        try:
+            # If something else is already tracing, we compare against a
+            # snapshot.  Otherwise, everything that's traced was allocated
+            # during the request.
+            started = not tracemalloc.is_tracing()
+            before = None
+            if started:
+                tracemalloc.start()
+            else:
+                before = tracemalloc.take_snapshot()
+
+            try:
+                return func()
+            finally:
+                after = tracemalloc.take_snapshot()
+                if started:
+                    tracemalloc.stop()
+                try:
+                    self._record(environ, before, after)
+                except Exception:
+                    self.logger.exception("Error recording allocations")
+        finally:
+            self._active.release()
+
+    def _record(self, environ, before, after):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__)]
+        after = after.filter_traces(ignore)
+        if before is None:
+            stats = after.statistics('lineno')
+            sites = [(stat.traceback, stat.size) for stat in stats]
+        else:
+            stats = after.compare_to(before.filter_traces(ignore), 'lineno')
+            sites = [(stat.traceback, stat.size_diff) for stat in stats]
+
+        retained = sum(size for _, size in sites)
+        top = self.settings.get('ALLOCATION_TOP_SITES', 10)
+        sites = [(str(site), size) for site, size in sites[:top]]
+
+        label = route_label(environ.get(ROUTE_KEY))
+        with self._lock:
+            route = self.routes.get(label)
+            if route is None:
+                route = self.routes[label] = RouteAllocations(label)
+            flagged = route.add(
+                retained, sites,
+                self.settings.get('ALLOCATION_GROWTH_BYTES', 1024),
+                self.settings.get('ALLOCATION_GROWTH_SAMPLES', 5), top)
+
+        # The top sites aren't exported, since each one would need its own
+        # label value; they're in the report and the growth warning instead.
+        self.sampled.inc((label,))
+        self.retained.set((label,), retained)
+        if flagged:
+            self.flagged.inc((label,))
+            self.logger.warning(
+                "Route %s has retained memory in each of its last %d "
+                "samples (%d bytes in total); top sites: %s", label,
+                route.streak, route.retained,
+                ', '.join('{0} ({1} bytes)'.format(site, size)
+                          for site, size in route.top_sites(3)))
+
+    def growing_routes(self):
+        with self._lock:
+            return sorted(label for label, route in self.routes.items()
+                          if route.growing)
+
+    def report(self, limit=10):
+        """
+        Return a dictionary with the samples, retained bytes, growth flag and
+        top allocation sites for each sampled route.
+        """
+        with self._lock:
+            return dict((label, {
+                'samples': route.samples,
+                'retained': route.retained,
+                'growing': route.growing,
+                'top_sites': route.top_sites(limit),
+            }) for label, route in self.routes.items())
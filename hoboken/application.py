@@ -5,6 +5,7 @@ from __future__ import with_statement, absolute_import, print_function
 import os
 import sys
 import re
+import time
 import logging
 import traceback
 from datetime import datetime
@@ -12,18 +13,34 @@ try:
     import threading
 except:                     # pragma: no cover
     import dummy_threading as threading
+try:
+    import queue
+except ImportError:         # pragma: no cover
+    import Queue as queue
 
 # In-package dependencies
 from hoboken.exceptions import *
 from hoboken.matchers import *
 from hoboken.objects import WSGIFullRequest as Request
 from hoboken.objects import WSGIFullResponse as Response
+from hoboken.objects.mixins.deadline import set_current_request
+from hoboken.objects.util import ClosingIterator
 from hoboken.config import ConfigProperty, ConfigDict
 from hoboken.log import DebugLogger, InjectingFilter
+from hoboken.pool import ThreadPool, Task, PoolFull, TaskTimeout
+from hoboken.timing import TIMER_KEY, PhaseTimer, TimedBody, clock
+from hoboken.metrics import (ROUTE_KEY, MetricsRegistry, RequestMetrics,
+                             route_label)
+from hoboken.profiling import PROFILER_KEY, RouteProfiler
+from hoboken.watchdog import Watchdog
+from hoboken.allocations import AllocationSampler
+from hoboken.tracing import TRACE_KEY, NullSpan, Tracer
+from hoboken.gcpolicy import GCPolicy
+from hoboken.introspection import Introspector
 
 # Compatibility.
 from hoboken.six import (with_metaclass, text_type, binary_type, string_types,
-                         callable, iteritems)
+                         callable, iteritems, reraise)
 
 
 # Get a logger.
@@ -59,6 +76,52 @@ def condition(condition_func):
     return internal_decorator
 
 
+def validator(validator_func):
+    """
+    This decorator adds a validator to a route.  Validators are called with
+    the request and response after the route has matched and its conditions
+    have passed, but before the route function itself is called.  They can
+    call halt() - e.g. with a 304 Not Modified - to skip the route function
+    entirely.
+    """
+    def internal_decorator(func):
+        # As with conditions, either add this validator to the route directly,
+        # or store it on the function until the route is created.
+        add_validator = get_func_attr(func, 'hoboken.add_validator')
+        if add_validator is not None:
+            add_validator(validator_func)
+            return func
+
+        validators_arr = get_func_attr(func, 'hoboken.validators', default=[])
+        validators_arr.append(validator_func)
+        set_func_attr(func, 'hoboken.validators', validators_arr)
+
+        return func
+
+    return internal_decorator
+
+
+def timeout(seconds):
+    """
+    This decorator gives a route a deadline: once it has matched, the request
+    must finish within the given number of seconds (or by the request's
+    existing deadline, if that's sooner).  Deadlines are checked before each
+    condition and validator, and before the route function is called; the
+    route function can check it with request.check_deadline(), or use
+    request.time_remaining().
+    """
+    def internal_decorator(func):
+        set_timeout = get_func_attr(func, 'hoboken.set_timeout')
+        if set_timeout is not None:
+            set_timeout(seconds)
+        else:
+            set_func_attr(func, 'hoboken.timeout', seconds)
+
+        return func
+
+    return internal_decorator
+
+
 def halt(code=None, body=None, headers=None):
     """
     This function halts routing, and returns immediately.  If the code, body
@@ -82,14 +145,24 @@ class Route(object):
     This class is an abstraction around a URL route.  It encapsulates:
       - The request method.
       - Any conditions defined for the route.
+      - Any validators defined for the route, which run before the route
+        function and can halt the request early.
+      - An optional timeout, which sets the request's deadline once the
+        route matches.
       - A matcher that determines if the route matches a request, and also
         returns any parameters from the request.
       - And finally, the route function itself.
     """
-    def __init__(self, matcher, func, conditions=None):
+    def __init__(self, matcher, func, conditions=None, validators=None):
         self.matcher = matcher
         self.func = func
         self.conditions = conditions or []
+        self.validators = validators or []
+        self.timeout = None
+
+        # After filters always run, even once the deadline has passed, so
+        # they don't check it.
+        self.check_deadline = True
 
         self._method = None
 
@@ -104,14 +177,22 @@ class Route(object):
     def add_condition(self, condition):
         self.conditions.append(condition)
 
+    def add_validator(self, validator):
+        self.validators.append(validator)
+
+    def set_timeout(self, seconds):
+        self.timeout = seconds
+
     def reverse(self, *args, **kwargs):
         return self.matcher.reverse(args, kwargs)
 
-    def __call__(self, request, response):
+    def __call__(self, request, response, timer=None):
         """
         Call this route.  This function will return True or False, depending on
         whether the route matched and was processed.  It will also catch any
-        ContinueRoutingExceptions and return False.
+        ContinueRoutingExceptions and return False.  If a PhaseTimer is given,
+        the time spent matching, checking conditions and validators, and in
+        the route function is added to it.
         """
         # self.logger.debug("Processing route: {0}".format(repr(route_tuple)))
 
@@ -120,25 +201,67 @@ class Route(object):
         request.urlvars = {}
 
         # Do the match.
+        if timer is not None:
+            start = clock()
         does_match, args, kwargs = self.matcher.match(request)
+        if timer is not None:
+            now = clock()
+            timer.add('match', now - start)
+            timer.count('routes_tried')
+            start, phase = now, 'conditions'
+
         if not does_match:
             return False, None
         else:
             request.urlargs = tuple(args)
             request.urlvars = kwargs
 
+        check = self.check_deadline
         try:
             for cond in self.conditions:
+                if check:
+                    request.check_deadline()
                 if not cond(request):
                     raise ContinueRoutingException
 
+            # The route's timeout only applies once it's known to be the
+            # route that handles the request.  Filters have no method, and
+            # don't handle the request.
+            if self._method is not None:
+                request.environ[ROUTE_KEY] = self
+            if self.timeout is not None:
+                request.set_timeout(self.timeout)
+
+            # Validators are cheap checks (e.g. of a resource's ETag) that
+            # can halt the request without calling the route function.
+            for validate in self.validators:
+                if check:
+                    request.check_deadline()
+                validate(request, response)
+
             # We remove the optional "_captures" kwarg, if it exists.
             kwargs.pop('_captures', None)
-            ret = self.func(*args, **kwargs)
+            if check:
+                request.check_deadline()
+
+            if timer is not None:
+                now = clock()
+                timer.add(phase, now - start)
+                start, phase = now, 'handler'
+
+            profiler = request.environ.get(PROFILER_KEY)
+            if profiler is not None and self._method is not None:
+                ret = profiler.call(self, self.func, args, kwargs)
+            else:
+                ret = self.func(*args, **kwargs)
 
         except ContinueRoutingException:
             return False, None
 
+        finally:
+            if timer is not None:
+                timer.add(phase, clock() - start)
+
         return True, ret
 
 
@@ -189,6 +312,56 @@ class SimpleNamespace(object):
         return "{}({})".format(type(self).__name__, ", ".join(items))
 
 
+class MountTable(object):
+    """
+    A table of WSGI applications mounted at path prefixes.  It's stored as a
+    trie of path segments, so finding the application for a path takes time
+    proportional to the number of segments in the path, however many
+    applications are mounted.
+    """
+    def __init__(self):
+        self.root = ({}, [None])
+        self.count = 0
+
+    def add(self, prefix, app):
+        if not prefix.startswith('/'):
+            raise ValueError("Mount prefixes must start with '/'")
+        segments = prefix.rstrip('/').split('/')[1:]
+        if not segments:
+            raise ValueError("Cannot mount an application at the root")
+
+        node = self.root
+        for segment in segments:
+            node = node[0].setdefault(segment, ({}, [None]))
+        if node[1][0] is None:
+            self.count += 1
+        node[1][0] = app
+
+    def match(self, path):
+        """
+        Find the application mounted at the longest prefix of the given
+        path.  Returns the application and the length of the prefix, or
+        (None, 0) if there isn't one.
+        """
+        found = (None, 0)
+        if not path.startswith('/'):
+            return found
+
+        node = self.root
+        length = 0
+        for segment in path.split('/')[1:]:
+            node = node[0].get(segment)
+            if node is None:
+                break
+            length += len(segment) + 1
+            if node[1][0] is not None:
+                found = (node[1][0], length)
+        return found
+
+    def __len__(self):
+        return self.count
+
+
 class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
     # These are the supported HTTP methods.  They can be overridden in
     # subclasses to add additional methods (e.g. "TRACE", "CONNECT", etc.)
@@ -199,6 +372,33 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
         'DEBUG': False,
         'APPLICATION_FILE': None,
         'SERIALIZE_REQUESTS': False,
+        'TRACK_VARY': False,
+        'AUTO_ETAG': False,
+        'AUTO_ETAG_DIGEST_SIZE': 16,
+        'AUTO_ETAG_MAX_SIZE': 1024 * 1024,
+        'BACKGROUND_THREADS': 4,
+        'BACKGROUND_QUEUE_SIZE': 1024,
+        'TASK_THREADS': 16,
+        'TASK_QUEUE_SIZE': 1024,
+        'REQUEST_TIMEOUT': None,
+        'REQUEST_TIMING': False,
+        'SERVER_TIMING_HEADER': False,
+        'METRICS': False,
+        'PROFILE_RATE': 0,
+        'PROFILE_ROUTES': {},
+        'PROFILE_BUDGET': 0.05,
+        'SLOW_REQUEST_THRESHOLD': None,
+        'SLOW_REQUEST_HISTORY': 50,
+        'ALLOCATION_SAMPLE_RATE': 0,
+        'ALLOCATION_TOP_SITES': 10,
+        'ALLOCATION_GROWTH_BYTES': 1024,
+        'ALLOCATION_GROWTH_SAMPLES': 5,
+        'TRACING': False,
+        'TRACE_FILE': None,
+        'GC_FREEZE': False,
+        'GC_THRESHOLDS': None,
+        'GC_DEFER': False,
+        'GC_DEFER_LIMIT': 10,
     }
 
     # The application's debug setting.
@@ -263,15 +463,52 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
         self.before_filters = []
         self.after_filters = []
 
+        # Applications mounted with mount().
+        self.mounts = MountTable()
+
+        # Metrics, which are recorded for each request if the METRICS config
+        # value is set.
+        self.metrics = MetricsRegistry()
+        self.request_metrics = RequestMetrics(self.metrics,
+                                              self.SUPPORTED_METHODS)
+
+        # Profiles a sample of calls to route functions, if the PROFILE_RATE
+        # or PROFILE_ROUTES config values are set.
+        self.profiler = RouteProfiler(self.config)
+
         # Create logger.
         self.logger = self.create_logger()
 
+        # Reports requests that take longer than the SLOW_REQUEST_THRESHOLD
+        # config value, if it's set.
+        self.watchdog = Watchdog(self.config, self.logger)
+
+        # Samples the memory retained by requests, if the
+        # ALLOCATION_SAMPLE_RATE config value is set.
+        self.allocations = AllocationSampler(self.config, self.metrics,
+                                             self.logger)
+
+        # Traces requests, if the TRACING config value is set.
+        self.tracer = Tracer(self.name, self.config)
+
+        # Manages the garbage collector, if the GC_FREEZE, GC_THRESHOLDS or
+        # GC_DEFER config values are set, and records its pauses.
+        self.gc_policy = GCPolicy(self.config, self.metrics)
+
+        # Reports the worker's live state, when it's mounted as a route.
+        self.introspector = Introspector(self)
+
         # Create a lock which we might use to serialize requests.  Originally,
         # this was only created if the appropriate config value was set, but
         # this caused problems if the config value was then set after the
         # application was created.
         self.lock = threading.Lock()
 
+        # The thread pools are created when they're first used.
+        self._background = None
+        self._tasks = None
+        self._pool_lock = threading.Lock()
+
         # Call other __init__ functions - this is needed for mixins to work.
         super(HobokenBaseApplication, self).__init__()
 
@@ -327,22 +564,239 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
     def g(self):
         self._locals.vars = SimpleNamespace()
 
-    def delegate(self, app, catch_exceptions=False):
+    def span(self, name, **attributes):
+        """
+        Start a span, with the given attributes, in the current request's
+        trace.  It should be used as a context manager:
+
+            with app.span('load_user', user_id=id) as span:
+                ...
+
+        If the request isn't being traced, this does nothing.
+        """
+        request = self.request
+        trace = None if request is None else request.environ.get(TRACE_KEY)
+        if trace is None:
+            return NullSpan()
+        return trace.span(name, **attributes)
+
+    def delegate(self, app, catch_exceptions=False, stream=False):
         """
         Delegates processing of the current request to another WSGI
         application.  Will set the current response to the response that was
-        recieved from the other application.
+        recieved from the other application.  If stream is true, the other
+        application's body is passed through as it's produced, rather than
+        being read into memory first - see Request.stream_application().
         """
         if self.request is None:
             return False
 
-        # Make the request on the subapp.
-        resp = self.request.get_response(app, catch_exc_info=catch_exceptions)
+        # Make the request on the subapp.  If the deadline passes while we
+        # wait for it, the other application is the one that's too slow, so
+        # we return a 504 Gateway Timeout.
+        self.request.check_deadline(code=504)
+        environ = self.request.environ
+        route = environ.get(ROUTE_KEY)
+        try:
+            resp = self.request.get_response(
+                app, catch_exc_info=catch_exceptions, stream=stream)
+        finally:
+            # The other application shares our environ, so if it's a Hoboken
+            # application, it will have recorded its own route.
+            if route is not None:
+                environ[ROUTE_KEY] = route
+        try:
+            self.request.check_deadline(code=504)
+        except DeadlineExceededException:
+            resp.close()
+            raise
 
-        # Set our response.
+        # Set our response, keeping any work queued with after_response().
+        resp._close_callbacks = self.response._close_callbacks
         self.response = resp
         return True
 
+    def _get_pool(self, attr, prefix):
+        if getattr(self, attr) is None:
+            with self._pool_lock:
+                if getattr(self, attr) is None:
+                    setattr(self, attr, ThreadPool(
+                        threads=self.config[prefix + '_THREADS'],
+                        queue_size=self.config[prefix + '_QUEUE_SIZE'],
+                        name='hoboken-{0}-{1}'.format(prefix.lower(),
+                                                      self.name)))
+        return getattr(self, attr)
+
+    @property
+    def background(self):
+        """
+        The ThreadPool that runs work queued with after_response().  Its
+        size is set by the BACKGROUND_THREADS and BACKGROUND_QUEUE_SIZE
+        config values.
+        """
+        return self._get_pool('_background', 'BACKGROUND')
+
+    @property
+    def tasks(self):
+        """
+        The ThreadPool that runs work that a request waits on, such as the
+        sub-requests of a batch request.  Its size is set by the
+        TASK_THREADS and TASK_QUEUE_SIZE config values.
+        """
+        return self._get_pool('_tasks', 'TASK')
+
+    def after_response(self, func, *args, **kwargs):
+        """
+        Queue a call to func(*args, **kwargs) that runs in the background
+        once the current response has been sent to the client.  Note that
+        the function runs on another thread, so the current request and
+        response aren't available to it.
+        """
+        self.response.call_on_close(
+            lambda: self.background.submit(func, *args, **kwargs))
+
+    def _with_context(self, func):
+        """
+        Wrap func so that, on whichever thread it's called, the current
+        request, response and g are those of this thread when it was wrapped.
+        """
+        request, response, g = self.request, self.response, self.g
+
+        def call():
+            saved = dict(self._locals.__dict__)
+            self._locals.request = request
+            self._locals.response = response
+            self._locals.vars = g
+            previous = set_current_request(request)
+            try:
+                return func()
+            finally:
+                set_current_request(previous)
+                self._locals.__dict__.clear()
+                self._locals.__dict__.update(saved)
+
+        return call
+
+    def gather(self, *funcs, **kwargs):
+        """
+        Call each of the given functions (with no arguments) concurrently,
+        on the tasks pool, and return a list of their results in order.  The
+        functions see the current request, response and g (which is shared,
+        not copied), and messages they log are tagged with the request.
+
+        When called from a thread of the tasks pool itself (e.g. by a
+        sub-request of a batch request), the functions are called one by one
+        on this thread instead, since waiting for the pool from one of its
+        own threads could deadlock.
+
+        If any function raises an exception, the first one (in order) is
+        re-raised once they have all finished.  If cancel_on_error is true,
+        it's re-raised as soon as it happens instead, and any functions that
+        haven't started yet are cancelled - those that are already running
+        can't be interrupted, and finish in the background.
+
+        The timeout defaults to the time remaining before the request's
+        deadline.  If it expires, the functions that haven't started are
+        cancelled, and TaskTimeout is raised - or, if the request's deadline
+        has passed, the request ends with a 504 Gateway Timeout.
+
+        The time each function took is appended to the request environ's
+        'hoboken.gather_timings' list, as a (name, seconds) tuple, where
+        seconds is None for functions that didn't finish.
+        """
+        timeout = kwargs.pop('timeout', None)
+        cancel_on_error = kwargs.pop('cancel_on_error', False)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {0}".format(
+                ', '.join(sorted(kwargs))))
+
+        request = self.request
+        if timeout is None and request is not None:
+            timeout = request.time_remaining()
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        finished = queue.Queue()
+
+        def notify_when_done(i, func):
+            def call():
+                try:
+                    return func()
+                finally:
+                    finished.put(i)
+            return call
+
+        tasks = []
+        inline = []
+        nested = self.tasks.in_worker()
+        for i, func in enumerate(funcs):
+            call = notify_when_done(i, self._with_context(func))
+            task = None
+            if not nested:
+                try:
+                    task = self.tasks.run(call)
+                except PoolFull:
+                    pass
+
+            if task is None:
+                # There's no room to queue it (or we're on the pool), so we
+                # call it on this thread once the others are queued.
+                task = Task(call, (), {})
+                inline.append(task)
+            tasks.append(task)
+
+        error = None
+        try:
+            for task in inline:
+                if timeout is not None and time.time() >= deadline:
+                    break
+                task._run()
+
+            for count in range(len(tasks)):
+                try:
+                    if timeout is None:
+                        i = finished.get()
+                    else:
+                        i = finished.get(timeout=max(0, deadline -
+                                                     time.time()))
+                except queue.Empty:
+                    break
+
+                # The task is marked as done just after it notifies us.
+                tasks[i].wait()
+                if tasks[i].exc_info is not None and cancel_on_error:
+                    error = tasks[i].exc_info
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._record_gather_timings(funcs, tasks)
+
+        if error is None:
+            for task in tasks:
+                if task.exc_info is not None:
+                    error = task.exc_info
+                    break
+                if not task.done() or task.cancelled:
+                    if request is not None:
+                        request.check_deadline(code=504)
+                    raise TaskTimeout("Gathered functions did not finish "
+                                      "within {0} seconds".format(timeout))
+
+        if error is not None:
+            reraise(*error)
+        return [task.value for task in tasks]
+
+    def _record_gather_timings(self, funcs, tasks):
+        request = self.request
+        if request is None:
+            return
+
+        timings = request.environ.setdefault('hoboken.gather_timings', [])
+        for func, task in zip(funcs, tasks):
+            name = getattr(func, '__name__', None) or repr(func)
+            timings.append((name, task.elapsed))
+
     def _make_route(self, match, func):
         if isinstance(match, string_types):
             matcher = HobokenRouteMatcher(match)
@@ -443,21 +897,40 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
                                   str(method),
                                   func.__name__)
 
+            def add_validator(validator_func):
+                route = self.find_route(func)
+                route.add_validator(validator_func)
+
+            def set_timeout(seconds):
+                route = self.find_route(func)
+                route.set_timeout(seconds)
+
             # Add the route.
             self.add_route(method, match, func)
 
-            # Add each of the existing conditions.
+            # Add each of the existing conditions and validators.
             conditions = get_func_attr(func, 'hoboken.conditions', default=[],
                                        delete=True)
             for c in conditions:
                 add_condition(c)
 
+            validators = get_func_attr(func, 'hoboken.validators', default=[],
+                                       delete=True)
+            for v in validators:
+                add_validator(v)
+
+            seconds = get_func_attr(func, 'hoboken.timeout', delete=True)
+            if seconds is not None:
+                set_timeout(seconds)
+
             # Mark this function as a route.
             set_func_attr(func, 'hoboken.route', True)
 
             # Add a function to add future conditions. This is so the order
             # of conditions being added doesn't matter.
             set_func_attr(func, 'hoboken.add_condition', add_condition)
+            set_func_attr(func, 'hoboken.add_validator', add_validator)
+            set_func_attr(func, 'hoboken.set_timeout', set_timeout)
             return func
 
         return internal_decorator
@@ -478,6 +951,7 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
 
     def add_after_filter(self, match, func):
         filter_tuple = self._make_route(match, func)
+        filter_tuple.check_deadline = False
         self.after_filters.append(filter_tuple)
 
     def after(self, match=None):
@@ -508,6 +982,25 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
         # Flag stating whether we've acquired our lock.  Defaults to False,
         # since we (by default) do not serialize requests.
         locked = False
+        current_set = False
+
+        metrics = None
+        if self.config['METRICS']:
+            metrics = self.request_metrics
+            metrics.started()
+            started = clock()
+
+        watched = None
+        if self.config['SLOW_REQUEST_THRESHOLD']:
+            watched = self.watchdog.register(environ)
+
+        root_span = None
+        if self.config['TRACING']:
+            root_span = self.tracer.begin(environ)
+
+        gc_finished = None
+        if self.gc_policy.active:
+            gc_finished = self.gc_policy.request_started()
 
         try:
             if self.config['SERIALIZE_REQUESTS']:
@@ -517,8 +1010,27 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
                 self.lock.acquire()
                 locked = True
 
-            # Create our request object.
+            # Create our request object, timing this and the following phases
+            # if we've been asked to.
+            timer = None
+            if self.config['REQUEST_TIMING']:
+                timer = environ[TIMER_KEY] = PhaseTimer()
             self.request = Request(environ)
+            if watched is not None:
+                watched.request = self.request
+            if timer is not None:
+                timer.add('request', clock() - timer.start)
+            if self.config['PROFILE_RATE'] or self.config['PROFILE_ROUTES']:
+                environ[PROFILER_KEY] = self.profiler
+            if self.config['TRACK_VARY']:
+                self.request.track_vary()
+
+            # Set the request's deadline, and make it the current request on
+            # this thread, so sub-requests inherit the deadline.
+            if self.config['REQUEST_TIMEOUT']:
+                self.request.set_timeout(self.config['REQUEST_TIMEOUT'])
+            previous_request = set_current_request(self.request)
+            current_set = True
 
             # Create an empty response.
             self.response = Response()
@@ -530,10 +1042,31 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
             self._prepare_response()
 
             # Actually handle this request.
-            self._handle_request()
+            if self.config['ALLOCATION_SAMPLE_RATE']:
+                self.allocations.call(environ, self._handle_request)
+            else:
+                self._handle_request()
+
+            # Do any final processing of the response.
+            self._finalize_response()
 
             # Finally, given our response, we finish the WSGI request.
-            return self.response(environ, start_response)
+            if timer is None:
+                body = self.response(environ, start_response)
+            else:
+                if self.config['SERVER_TIMING_HEADER']:
+                    self.response.headers['Server-Timing'] = \
+                        timer.server_timing()
+                body = TimedBody(self.response(environ, start_response),
+                                 timer,
+                                 lambda timer: self.on_request_timed(environ,
+                                                                     timer))
+
+            # A deferred collection runs once the response has been sent.
+            if gc_finished is not None:
+                body = ClosingIterator(body, [gc_finished])
+                gc_finished = None
+            return body
         finally:
             # Note that we don't automatically release, since there might be
             # an error with accessing self.config, above, and so we might not
@@ -541,6 +1074,32 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
             if locked:
                 self.lock.release()
 
+            if current_set:
+                set_current_request(previous_request)
+
+            if metrics is not None:
+                response = self.response
+                status = 500 if response is None else response.status_int
+                metrics.finished(environ.get('REQUEST_METHOD'),
+                                 environ.get(ROUTE_KEY), status,
+                                 clock() - started)
+
+            if watched is not None:
+                self.watchdog.unregister(watched)
+
+            # If we didn't get as far as returning a body, the request has
+            # finished now.
+            if gc_finished is not None:
+                gc_finished()
+
+            if root_span is not None:
+                route = environ.get(ROUTE_KEY)
+                response = self.response
+                self.tracer.end(root_span, environ.get('REQUEST_METHOD'),
+                                None if route is None else route_label(route),
+                                500 if response is None else
+                                response.status_int)
+
             # After each request, we remove the request and response objects.
             del self.request
             del self.response
@@ -553,16 +1112,52 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
         if hasattr(self.response, 'date'):
             self.response.date = datetime.utcnow()
 
-    def _run_routes(self, method):
+    def _finalize_response(self):
+        # If the request tracked which of its headers were read, we add them
+        # to the response's Vary header.
+        varied = getattr(self.request, 'varied_headers', None)
+        if varied and hasattr(self.response, 'add_vary'):
+            self.response.add_vary(*sorted(varied))
+
+        if self.config['AUTO_ETAG']:
+            self._auto_etag()
+
+    def _auto_etag(self):
+        """
+        This function sets an ETag on successful responses that don't have
+        one by hashing the body, and then turns the response into an empty
+        304 Not Modified if the request's If-None-Match header matches it.
+        """
+        request = self.request
+        response = self.response
+        if (request.method not in ('GET', 'HEAD') or
+                response.status_int != 200 or
+                not hasattr(response, 'add_body_etag')):
+            return
+
+        set_etag = response.add_body_etag(
+            digest_size=self.config['AUTO_ETAG_DIGEST_SIZE'],
+            max_size=self.config['AUTO_ETAG_MAX_SIZE'])
+        if set_etag and response.etag[0] in request.if_none_match:
+            response.status_int = 304
+            response.headers.pop('Content-Length', None)
+            response.response_iter = []
+
+    def _run_routes(self, method, timer=None):
         # Since these are thread-locals, we grab them as locals.
         request = self.request
         response = self.response
 
         # For each route of the specified type, try to match it.
         for route in self.routes[method]:
-            matches, ret = route(request, response)
+            matches, ret = route(request, response, timer)
             if ret is not None:
-                self.on_returned_body(request, response, ret)
+                if timer is None:
+                    self.on_returned_body(request, response, ret)
+                else:
+                    start = clock()
+                    self.on_returned_body(request, response, ret)
+                    timer.add('returned_body', clock() - start)
 
             if matches:
                 return True
@@ -586,19 +1181,31 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
             response.status_int = 405
             return
 
+        timer = request.environ.get(TIMER_KEY)
+        trace = request.environ.get(TRACE_KEY)
+
         matched = False
         try:
             # Call before filters.
+            if timer is not None:
+                start = clock()
+            if trace is not None:
+                span = trace.start('before_filters')
             for filter in self.before_filters:
                 filter(request, response)
+            if timer is not None:
+                timer.add('before_filters', clock() - start)
+            if trace is not None:
+                span.end()
+                span = trace.start('routes')
 
             # For each route of the specified type, try to match it.
-            matched = self._run_routes(request.method)
+            matched = self._run_routes(request.method, timer)
 
             # We special-case the HEAD method to fallback to GET.
             if request.method == 'HEAD' and not matched:
                 # Run our routes against the 'GET' method.
-                matched = self._run_routes('GET')
+                matched = self._run_routes('GET', timer)
 
         except HaltRoutingException as ex:
             # Set the various parameters.
@@ -627,16 +1234,55 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
             matched = True
 
         finally:
-            # Call our after filters
+            # Call our after filters.  If a filter or route halted, the span
+            # for its phase (and any spans within it) is still open.
+            if timer is not None:
+                start = clock()
+            if trace is not None:
+                span.end()
+                span = trace.start('after_filters')
             for route in self.after_filters:
                 route(request, response)
+            if timer is not None:
+                timer.add('after_filters', clock() - start)
+            if trace is not None:
+                span.end()
 
         if not matched:
             self.on_route_missing()
 
+    def mount(self, prefix, app):
+        """
+        Mount a WSGI application (which can be another Hoboken application)
+        at the given path prefix, such as '/api'.  Requests for the prefix,
+        or any path below it, are passed straight to that application, before
+        any of this application's filters or routes are run.  The prefix is
+        moved from PATH_INFO to SCRIPT_NAME in the request's environ.  If
+        applications are mounted at nested prefixes, the longest matching
+        one is used.
+        """
+        self.mounts.add(prefix, app)
+
     def __call__(self, environ, start_response):
+        if self.mounts:
+            path = environ.get('PATH_INFO', '')
+            app, length = self.mounts.match(path)
+            if app is not None:
+                environ['SCRIPT_NAME'] = (environ.get('SCRIPT_NAME', '') +
+                                          path[:length])
+                environ['PATH_INFO'] = path[length:]
+                return app(environ, start_response)
+
         return self.wsgi_entrypoint(environ, start_response)
 
+    def on_request_timed(self, environ, timer):
+        """
+        This function is called with a request's environ and its PhaseTimer,
+        when the REQUEST_TIMING config value is set, once the response has
+        been sent.  Override this function to record the timings somewhere.
+        """
+        pass
+
     def on_route_missing(self):
         """
         This function is called when a route to handle a request is not found.
@@ -665,7 +1311,7 @@ class HobokenBaseApplication(with_metaclass(HobokenMetaclass)):
         This method lets you start a test server for development purposes.
         Note: There is deliberately no option to set the address to listen on.
               The server will always listen on 'localhost', and should never
-              be used in production.
+              be used in production - use hoboken.serve for that.
         """
 
         self.logger.info("Starting test server on port %d", port)
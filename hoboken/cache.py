@@ -0,0 +1,239 @@
+from __future__ import with_statement, absolute_import, print_function
+
+import sys
+import time
+import logging
+from collections import OrderedDict
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import reraise
+
+
+logger = logging.getLogger(__name__)
+
+# This is saved here so we can patch it during our tests.
+_time = time.time
+
+
+class CacheEntry(object):
+    """
+    This class represents a single cached value, along with the information
+    needed to decide whether it's fresh, stale-but-usable or expired.  The
+    freshness windows mirror the HTTP Cache-Control directives of the same
+    names:
+      - max_age: the entry is fresh, and can be served as-is.
+      - stale_while_revalidate: the entry can be served, but should be
+        regenerated in the background.
+      - stale_if_error: the entry can be served if regenerating it fails.
+    """
+    def __init__(self, value, max_age, stale_while_revalidate=0,
+                 stale_if_error=0, created=None, key=None, vary=()):
+        self.value = value
+        self.key = key
+        self.vary = tuple(vary)
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate or 0
+        self.stale_if_error = stale_if_error or 0
+        self.created = _time() if created is None else created
+
+    @property
+    def age(self):
+        return max(0, _time() - self.created)
+
+    @property
+    def lifetime(self):
+        """
+        The total number of seconds this entry is useful for.  Backends can
+        use this to expire entries.
+        """
+        return self.max_age + max(self.stale_while_revalidate,
+                                  self.stale_if_error)
+
+    @property
+    def is_fresh(self):
+        return self.age < self.max_age
+
+    @property
+    def can_revalidate(self):
+        return self.age < self.max_age + self.stale_while_revalidate
+
+    @property
+    def can_serve_on_error(self):
+        return self.age < self.max_age + self.stale_if_error
+
+    def __repr__(self):
+        return "CacheEntry(max_age={0!r}, age={1!r})".format(self.max_age,
+                                                             self.age)
+
+
+def vary_key(base_key, header_names, headers):
+    """
+    Build a cache key from a base key and the values of the request headers
+    that a response varies on, so that each representation of a resource is
+    stored separately.  Header names are compared case-insensitively, and a
+    missing header is treated the same as an empty one.
+    """
+    if not header_names:
+        return base_key
+
+    parts = [base_key]
+    for name in sorted(set(n.lower() for n in header_names)):
+        parts.append(name + b':' + (headers.get(name) or b''))
+    return b'\n'.join(parts)
+
+
+class BaseCache(object):
+    """
+    This class defines the interface that all cache backends must follow.
+    Keys are bytestrings, and values are arbitrary (picklable) objects.
+    """
+    def get(self, key):                         # pragma: no cover
+        """
+        Return the value stored for the given key, or None if there is no
+        such value (or it has expired).
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, timeout=None):    # pragma: no cover
+        """
+        Store a value for the given key.  If a timeout (in seconds) is given,
+        the value will expire after this long.
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):                      # pragma: no cover
+        raise NotImplementedError()
+
+    def clear(self):                            # pragma: no cover
+        raise NotImplementedError()
+
+
+class MemoryCache(BaseCache):
+    """
+    A simple, thread-safe, in-process cache.  When more than max_entries
+    values are stored, the least-recently-used value is evicted.
+    """
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or (item[1] is not None and item[1] <= _time()):
+                self.misses += 1
+                return None
+
+            # Re-insert, so this is now the most-recently-used value.
+            self._data[key] = item
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, timeout=None):
+        expires = None if timeout is None else _time() + timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "MemoryCache(entries={0}, max_entries={1})".format(
+            len(self._data), self.max_entries)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """
+    This class coalesces concurrent calls that share a key onto a single
+    in-flight computation.  The first caller for a key runs the function,
+    and every other caller that arrives before it finishes waits for, and
+    shares, its result (or exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call the given function, unless a call with the same key is already
+        in flight, in which case we wait for that call to finish instead.
+        Returns a tuple of (result, shared), where shared is True if the
+        result came from another caller's computation.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.exc_info is not None:
+                reraise(*call.exc_info)
+            return call.result, True
+
+        self._run(key, call, func, args, kwargs)
+        if call.exc_info is not None:
+            reraise(*call.exc_info)
+        return call.result, False
+
+    def spawn(self, key, func, *args, **kwargs):
+        """
+        Run the given function in a background thread, unless a call with
+        the same key is already in flight.  Returns whether a new thread was
+        started.
+        """
+        with self._lock:
+            if key in self._calls:
+                return False
+            call = self._calls[key] = _Call()
+
+        def runner():
+            self._run(key, call, func, args, kwargs)
+            if call.exc_info is not None:
+                logger.error("Background call for %r failed", key,
+                             exc_info=call.exc_info)
+
+        thread = threading.Thread(target=runner)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _run(self, key, call, func, args, kwargs):
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception:
+            call.exc_info = sys.exc_info()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
@@ -0,0 +1,374 @@
+"""
+Capture of live traffic, so that it can be replayed later (see
+hoboken.replay).  CaptureMiddleware wraps a WSGI application and appends
+each request it sees - a sanitised copy of the environ, along with the
+body - to a capture file, e.g.:
+
+    app = CaptureMiddleware(app, '/var/tmp/traffic.capture')
+
+A capture file has one JSON object per line, so it can be appended to from
+several processes, and read back a request at a time.
+
+Credentials are kept out of the capture: headers such as Authorization and
+Cookie are dropped, and the values of fields such as "password" and "token"
+are redacted from query strings and from form and JSON bodies.  Form bodies
+aren't captured at all unless capture_body is set, since they're the most
+likely to hold personal data.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import json
+import time
+import base64
+import random
+import logging
+from io import BytesIO
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    from urllib.parse import unquote_plus
+except ImportError:         # pragma: no cover
+    from urllib import unquote_plus
+
+from hoboken.six import PY3
+
+
+logger = logging.getLogger(__name__)
+
+# The environ keys, other than HTTP headers, that are captured.
+CAPTURED_KEYS = (
+    'REQUEST_METHOD', 'SCRIPT_NAME', 'PATH_INFO', 'QUERY_STRING',
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'SERVER_NAME', 'SERVER_PORT',
+    'SERVER_PROTOCOL', 'wsgi.url_scheme',
+)
+
+# Headers that carry credentials, and so are never captured by default.
+REDACTED_HEADERS = (
+    'HTTP_AUTHORIZATION', 'HTTP_PROXY_AUTHORIZATION', 'HTTP_COOKIE',
+    'HTTP_X_API_KEY', 'HTTP_X_CSRF_TOKEN', 'HTTP_X_XSRF_TOKEN',
+)
+
+# Query parameters and form or JSON fields whose values are redacted by
+# default.  Names are compared case-insensitively.
+REDACTED_FIELDS = (
+    'password', 'passwd', 'secret', 'client_secret', 'token', 'access_token',
+    'refresh_token', 'api_key', 'apikey',
+)
+
+# What redacted values are replaced with.
+REDACTED_VALUE = 'REDACTED'
+
+# Bodies of these content types are only captured if capture_body is set.
+FORM_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+def redact_query(query, fields=REDACTED_FIELDS):
+    """
+    Replace the values of the named fields in a query string (or a form
+    body, as a native string).  Everything else is left exactly as it was.
+    """
+    fields = frozenset(f.lower() for f in fields)
+    parts = query.split('&')
+    for i, part in enumerate(parts):
+        name, sep, value = part.partition('=')
+        if sep and unquote_plus(name).lower() in fields:
+            parts[i] = name + '=' + REDACTED_VALUE
+    return '&'.join(parts)
+
+
+def redact_json(value, fields=REDACTED_FIELDS):
+    """
+    Return a copy of a decoded JSON value, with the values of the named
+    fields replaced at any depth.
+    """
+    fields = frozenset(f.lower() for f in fields)
+
+    def redact(value):
+        if isinstance(value, dict):
+            return dict((k, REDACTED_VALUE if k.lower() in fields
+                         else redact(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [redact(v) for v in value]
+        return value
+
+    return redact(value)
+
+
+def _media_type(environ):
+    return environ.get('CONTENT_TYPE', '').split(';', 1)[0].strip().lower()
+
+
+def sanitise_environ(environ, redact=REDACTED_HEADERS,
+                     fields=REDACTED_FIELDS):
+    """
+    Return the parts of an environ that are worth replaying: the request
+    line, with the named fields redacted from its query string, and any
+    headers that aren't redacted.  Server-specific values - the client's
+    address, and anything added by middleware - are dropped.
+    """
+    captured = {}
+    for key, value in environ.items():
+        if key in CAPTURED_KEYS or (key.startswith('HTTP_') and
+                                    key not in redact):
+            if isinstance(value, str):
+                captured[key] = value
+
+    if captured.get('QUERY_STRING') and fields:
+        captured['QUERY_STRING'] = redact_query(captured['QUERY_STRING'],
+                                                fields)
+    return captured
+
+
+class CapturedRequest(object):
+    """
+    A request read back from a capture file.  The time is when it was
+    captured, in seconds since the epoch.
+    """
+    def __init__(self, time, environ, body=b'', truncated=False):
+        self.time = time
+        self.environ = environ
+        self.body = body
+        self.truncated = truncated
+
+    def make_environ(self):
+        """
+        Build a complete WSGI environ from the captured one, which can be
+        passed to an application.
+        """
+        environ = dict(self.environ)
+        environ.setdefault('SCRIPT_NAME', '')
+        environ.setdefault('SERVER_NAME', 'localhost')
+        environ.setdefault('SERVER_PORT', '80')
+        environ.setdefault('SERVER_PROTOCOL', 'HTTP/1.1')
+        environ.update({
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': environ.pop('wsgi.url_scheme', 'http'),
+            'wsgi.input': BytesIO(self.body),
+            'wsgi.errors': BytesIO(),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        })
+        # A truncated or chunked body is sent with its captured length.
+        if self.truncated or 'HTTP_TRANSFER_ENCODING' in environ:
+            environ.pop('HTTP_TRANSFER_ENCODING', None)
+            environ['CONTENT_LENGTH'] = str(len(self.body))
+        return environ
+
+    def to_json(self):
+        record = {'t': self.time, 'environ': self.environ}
+        if self.body:
+            record['body'] = base64.b64encode(self.body).decode('ascii')
+        if self.truncated:
+            record['truncated'] = True
+        return json.dumps(record, separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def from_json(klass, line):
+        record = json.loads(line)
+        environ = record['environ']
+        if not PY3:             # pragma: no cover
+            environ = dict((str(k), v.encode('latin-1'))
+                           for k, v in environ.items())
+        body = base64.b64decode(record.get('body', ''))
+        return klass(record['t'], environ, body, record.get('truncated', False))
+
+    def __repr__(self):
+        return "CapturedRequest({0} {1})".format(
+            self.environ.get('REQUEST_METHOD'), self.environ.get('PATH_INFO'))
+
+
+class CaptureFile(object):
+    """
+    An append-only capture file.  Each record is written as a single line,
+    with a single write to a file that's opened, unbuffered, in append mode,
+    so that several processes can share one file without their records
+    being interleaved.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def write(self, request):
+        line = (request.to_json() + '\n').encode('utf-8')
+        with self._lock:
+            if self._pid != os.getpid():
+                self._file = open(self.path, 'ab', 0)
+                self._pid = os.getpid()
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+
+def read_capture(path):
+    """
+    Yield the CapturedRequests in a capture file, in order.  A line that
+    can't be parsed (e.g. because the process was killed while writing it)
+    is skipped.
+    """
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield CapturedRequest.from_json(line.decode('utf-8'))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping unreadable record in %s", path)
+
+
+class CaptureMiddleware(object):
+    """
+    Records a sample of the requests to a WSGI application.  Request bodies
+    up to max_body bytes are captured in full; larger ones are cut short,
+    and the request is marked as truncated.  The headers named in redact
+    aren't captured, and the values of the fields named in redact_fields
+    are replaced in query strings, and in form and JSON bodies.
+
+    If capture_body is None, bodies are captured unless they're forms (see
+    FORM_TYPES); if it's true or false, every body is or isn't captured.
+    A body that isn't captured, or can't be redacted (e.g. a multipart form,
+    or truncated JSON), is recorded as empty, and truncated.
+    """
+    def __init__(self, app, path, sample_rate=1.0, max_body=64 * 1024,
+                 redact=REDACTED_HEADERS, redact_fields=REDACTED_FIELDS,
+                 capture_body=None):
+        self.app = app
+        self.file = path if isinstance(path, CaptureFile) else \
+            CaptureFile(path)
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.redact = frozenset(redact)
+        self.redact_fields = tuple(redact_fields)
+        self.capture_body = capture_body
+
+    def _should_capture_body(self, environ):
+        if self.capture_body is None:
+            return _media_type(environ) not in FORM_TYPES
+        return bool(self.capture_body)
+
+    def _redact_body(self, environ, body):
+        """
+        Redact the fields of a form or JSON body, returning None if that
+        isn't possible.
+        """
+        media_type = _media_type(environ)
+        if not self.redact_fields or not body:
+            return body
+        if media_type == 'application/x-www-form-urlencoded':
+            return redact_query(body.decode('latin-1'),
+                                self.redact_fields).encode('latin-1')
+        if media_type == 'application/json' or media_type.endswith('+json'):
+            try:
+                data = json.loads(body.decode('utf-8'))
+            except ValueError:
+                return None
+            data = redact_json(data, self.redact_fields)
+            return json.dumps(data).encode('utf-8')
+        if media_type == 'multipart/form-data':
+            return None
+        return body
+
+    def _has_body(self, environ):
+        return environ.get('CONTENT_LENGTH', '') not in ('', '0') or \
+            'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '')
+
+    def _read_body(self, environ):
+        length = environ.get('CONTENT_LENGTH')
+        if length:
+            try:
+                length = int(length)
+            except ValueError:
+                return b'', False
+        elif 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', ''):
+            # We don't know how long the body is, so we read one more byte
+            # than we'd capture, to find out whether it fits.
+            length = None
+        else:
+            return b'', False
+
+        stream = environ['wsgi.input']
+        if length is None:
+            body = stream.read(self.max_body + 1)
+            complete = len(body) <= self.max_body
+        else:
+            body = stream.read(min(length, self.max_body))
+            complete = length <= self.max_body
+
+        if complete:
+            # We've read the whole body, so the application reads our copy.
+            environ['wsgi.input'] = BytesIO(body)
+            return body, False
+
+        # The application still needs the whole body, so it reads what we've
+        # read, followed by the rest of the original stream.
+        environ['wsgi.input'] = _PrefixedStream(body, stream)
+        return body[:self.max_body], True
+
+    def __call__(self, environ, start_response):
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            try:
+                captured = sanitise_environ(environ, self.redact,
+                                            self.redact_fields)
+                body, truncated = b'', False
+                if self._should_capture_body(environ):
+                    body, truncated = self._read_body(environ)
+
+                    redacted = self._redact_body(environ, body)
+                    if redacted is None:
+                        body, truncated = b'', True
+                    elif redacted is not body:
+                        body = redacted
+                        if not truncated:
+                            captured['CONTENT_LENGTH'] = str(len(body))
+                elif self._has_body(environ):
+                    truncated = True
+
+                self.file.write(CapturedRequest(time.time(), captured, body,
+                                                truncated))
+            except Exception:
+                logger.exception("Error capturing request")
+        return self.app(environ, start_response)
+
+
+class _PrefixedStream(object):
+    """
+    A readable stream that returns some bytes we've already read from a
+    stream, followed by the rest of that stream.
+    """
+    def __init__(self, prefix, stream):
+        self._prefix = BytesIO(prefix)
+        self._stream = stream
+
+    def read(self, size=-1):
+        data = self._prefix.read(size)
+        if size is None or size < 0:
+            return data + self._stream.read()
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def readline(self, size=-1):
+        line = self._prefix.readline(size)
+        if line.endswith(b'\n') or (size is not None and 0 <= size <=
+                                    len(line)):
+            return line
+        rest = -1 if size is None or size < 0 else size - len(line)
+        return line + self._stream.readline(rest)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
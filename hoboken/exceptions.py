@@ -48,3 +48,14 @@ class HaltRoutingException(HobokenUserException):
         self.body = body
         self.headers = headers
         super(HaltRoutingException, self).__init__()
+
+
+class DeadlineExceededException(HaltRoutingException):
+    """
+    This exception is raised when a request has passed its deadline.  It
+    halts routing with a 503 Service Unavailable response, or a 504 Gateway
+    Timeout if the deadline passed while waiting on another application.
+    """
+    def __init__(self, code=503):
+        super(DeadlineExceededException, self).__init__(
+            code, b'Request deadline exceeded', None)
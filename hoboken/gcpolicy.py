@@ -0,0 +1,293 @@
+"""
+Management of the cyclic garbage collector for long-running workers.  A
+collection pauses every thread, and, under load, the pauses land in the
+middle of requests and show up in the tail latency.  A GCPolicy, which is
+configured with the application's config, can:
+
+  - GC_FREEZE: move every object that exists once the application has been
+    set up into the permanent generation with gc.freeze(), so they're never
+    scanned again.  The prefork server does this before forking workers,
+    which also keeps collections in the workers from writing to pages that
+    they share with the master.  Otherwise, it's done before the first
+    request.
+  - GC_THRESHOLDS: set the collector's thresholds (see gc.set_threshold).
+  - GC_DEFER: defer collections until a request has finished and its
+    response has been sent.  While requests are in flight, the first
+    threshold is raised by the GC_DEFER_LIMIT factor; once there are none,
+    any collection that the normal thresholds call for is run.  Under
+    constant load with many threads there may never be a moment with no
+    requests, in which case the raised threshold still bounds the garbage.
+
+Once any of these or the METRICS config value is set, the time each
+collection takes is recorded for every generation from the first request
+on, and, if METRICS is set, exported in the hoboken_gc_pause_seconds
+histogram.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import gc
+import os
+import logging
+import weakref
+from collections import deque
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.timing import clock
+
+
+logger = logging.getLogger(__name__)
+
+# Buckets for GC pauses, which are usually far shorter than requests: from
+# 10 microseconds to about a third of a second.
+GC_BUCKETS = tuple(0.00001 * 2 ** i for i in range(16))
+
+# The most GC pauses that are kept until they're added to the metrics.
+MAX_PENDING_PAUSES = 1024
+
+
+class GCPauses(object):
+    """
+    Counts the garbage collector's collections, and the time they take, for
+    each generation.  Only Python 3.3 and above can report collections, so
+    elsewhere the counts stay at zero.  Listeners, which are only weakly
+    referenced, have their gc_pause(generation, seconds) method called after
+    each collection.
+    """
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.total = [0.0, 0.0, 0.0]
+        self.longest = 0.0
+        self.installed = False
+        self._start = None
+        self._listeners = weakref.WeakSet()
+
+    def install(self):
+        callbacks = getattr(gc, 'callbacks', None)
+        if callbacks is not None and self._callback not in callbacks:
+            callbacks.append(self._callback)
+            self.installed = True
+
+    def uninstall(self):
+        callbacks = getattr(gc, 'callbacks', None)
+        if callbacks is not None and self._callback in callbacks:
+            callbacks.remove(self._callback)
+        self.installed = False
+
+    def add_listener(self, listener):
+        self._listeners.add(listener)
+
+    def _callback(self, phase, info):
+        # Collections can't overlap, so there's only one start time.
+        if phase == 'start':
+            self._start = clock()
+        elif self._start is not None:
+            elapsed = clock() - self._start
+            self._start = None
+            generation = info.get('generation', 0)
+            self.collections[generation] += 1
+            self.total[generation] += elapsed
+            if elapsed > self.longest:
+                self.longest = elapsed
+
+            for listener in list(self._listeners):
+                try:
+                    listener.gc_pause(generation, elapsed)
+                except Exception:
+                    logger.exception("Error in GC pause listener %r",
+                                     listener)
+
+    def stats(self):
+        return {
+            'collections': list(self.collections),
+            'pause_seconds': list(self.total),
+            'total_pause_seconds': sum(self.total),
+            'longest_pause_seconds': self.longest,
+        }
+
+
+# The process's GC pauses.  They're counted once a GCPolicy is active, or
+# once an Introspector has been asked for its report.
+gc_pauses = GCPauses()
+
+
+class GCPolicy(object):
+    """
+    Applies an application's GC settings (see above) to the process.  The
+    settings are read from a mapping (normally the application's config)
+    when the first request arrives, or when freeze() or apply() is called.
+
+    Pauses are reported from inside the collector, where taking a lock could
+    deadlock with the thread that the collection interrupted, so they're
+    queued, and added to the histogram as requests start and finish.
+    """
+    def __init__(self, settings, registry):
+        self.settings = settings
+        self.pauses = registry.histogram(
+            'hoboken_gc_pause_seconds',
+            "Time spent in garbage collections, by generation.",
+            labels=('generation',), buckets=GC_BUCKETS)
+        self.deferred_collections = registry.counter(
+            'hoboken_gc_deferred_collections_total',
+            "Garbage collections run between requests, by generation.",
+            labels=('generation',))
+
+        self.frozen = False
+        self.thresholds = None
+        self._applied_pid = None
+        self._original = None
+        self._in_flight = 0
+        self._pending = deque(maxlen=MAX_PENDING_PAUSES)
+        self._lock = threading.Lock()
+
+        gc_pauses.add_listener(self)
+
+    @property
+    def active(self):
+        """
+        Whether any of the GC settings, or METRICS, is set.
+        """
+        settings = self.settings
+        return bool(settings['GC_FREEZE'] or settings['GC_THRESHOLDS'] or
+                    settings['GC_DEFER'] or settings['METRICS'])
+
+    @property
+    def deferring(self):
+        return bool(self.settings['GC_DEFER'])
+
+    def freeze(self):
+        """
+        Freeze every object that currently exists, if GC_FREEZE is set and
+        this Python has gc.freeze() (3.7 and above).  This should be called
+        once the application has been set up, and before forking.
+        """
+        if not self.settings['GC_FREEZE'] or self.frozen:
+            return False
+        if not hasattr(gc, 'freeze'):       # pragma: no cover
+            logger.warning("GC_FREEZE is set, but gc.freeze() isn't "
+                           "available")
+            return False
+
+        gc.freeze()
+        self.frozen = True
+        logger.debug("Froze %d objects", gc.get_freeze_count())
+        return True
+
+    def apply(self):
+        """
+        Set the thresholds, raising the first one if collections are being
+        deferred.  This is done once in each process.
+        """
+        with self._lock:
+            if self._applied_pid == os.getpid():
+                return
+            self._applied_pid = os.getpid()
+            self._in_flight = 0
+            if self.active:
+                gc_pauses.install()
+
+            if self._original is None:
+                self._original = gc.get_threshold()
+            thresholds = self.settings['GC_THRESHOLDS'] or self._original
+            self.thresholds = tuple(thresholds)
+
+            if self.deferring and self.thresholds[0]:
+                limit = self.settings['GC_DEFER_LIMIT']
+                gc.set_threshold(int(self.thresholds[0] * limit),
+                                 *self.thresholds[1:])
+            else:
+                gc.set_threshold(*self.thresholds)
+
+    def restore(self):
+        """
+        Undo the policy: restore the thresholds that were in effect before
+        it was applied, and unfreeze the objects it froze.
+        """
+        with self._lock:
+            if self._original is not None:
+                gc.set_threshold(*self._original)
+            if self.frozen:
+                gc.unfreeze()
+            self.frozen = False
+            self.thresholds = None
+            self._applied_pid = None
+            self._original = None
+            self._in_flight = 0
+
+    def request_started(self):
+        """
+        Called as a request starts.  Returns a function to call once it's
+        finished (i.e. once its response has been sent) if collections are
+        being deferred, or None.
+        """
+        if self._applied_pid != os.getpid():
+            self.freeze()
+            self.apply()
+        self.record_pauses()
+
+        if not self.deferring:
+            return None
+        with self._lock:
+            self._in_flight += 1
+        return self.request_finished
+
+    def request_finished(self):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight > 0:
+                return
+        self.collect_if_due()
+        self.record_pauses()
+
+    def collect_if_due(self):
+        """
+        Run the collection that the thresholds call for, if any: the oldest
+        generation whose count has reached its threshold.  Returns the
+        generation collected, or None.
+        """
+        thresholds = self.thresholds
+        if thresholds is None or not thresholds[0]:
+            return None
+
+        counts = gc.get_count()
+        if counts[0] < thresholds[0]:
+            return None
+
+        generation = 0
+        for g in (2, 1):
+            if g < len(thresholds) and counts[g] >= thresholds[g]:
+                generation = g
+                break
+
+        gc.collect(generation)
+        self.deferred_collections.inc((str(generation),))
+        return generation
+
+    def gc_pause(self, generation, seconds):
+        # Called by the collector - appending to a deque doesn't take a lock.
+        if self.settings['METRICS']:
+            self._pending.append((generation, seconds))
+
+    def record_pauses(self):
+        """
+        Add the pauses that have been queued since the last call to the
+        pause histogram.
+        """
+        pending = self._pending
+        while pending:
+            try:
+                generation, seconds = pending.popleft()
+            except IndexError:
+                break
+            self.pauses.observe(seconds, (str(generation),))
+
+    def stats(self):
+        return {
+            'frozen': self.frozen,
+            'deferring': self.deferring,
+            'thresholds': None if self.thresholds is None else
+            list(self.thresholds),
+            'in_flight': self._in_flight,
+        }
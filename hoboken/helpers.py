@@ -1,22 +1,136 @@
 from __future__ import with_statement, absolute_import, print_function
 
+import sys
+import json
 import time
+import base64
+import logging
 import datetime
+import functools
+from io import BytesIO
+from collections import deque
 
-from hoboken.six import iteritems
-from hoboken.application import halt
+from hoboken.six import iteritems, reraise, string_types
+from hoboken.application import halt, validator, Request
+from hoboken.cache import CacheEntry, MemoryCache, SingleFlight, vary_key
+from hoboken.exceptions import HobokenUserException
+from hoboken.sse import EventStream
 from hoboken.objects.mixins.etag import MatchAnyEtag, MatchNoneEtag
+from hoboken.pool import PoolFull
+
+
+logger = logging.getLogger(__name__)
 
 # These are saved here so we can patch them during our tests.
 _now = datetime.datetime.now
 _utcnow = datetime.datetime.utcnow
 
 
+def _check_last_modified(request, response, date):
+    if date is None:
+        return
+
+    # Python's time functions are stupid. We do everything with unix times.
+    timestamp = time.mktime(date.timetuple())
+    response.last_modified = timestamp
+
+    # We don't do anything if there's an ETag.
+    if request.if_none_match is not MatchNoneEtag:
+        return
+
+    if (response.status_int == 200 and
+            request.if_modified_since is not None):
+        time_val = time.mktime(request.if_modified_since.timetuple())
+        if time_val >= timestamp:
+            halt(code=304)
+
+    if ((response.is_success or response.status_int == 412) and
+            request.if_unmodified_since is not None):
+        time_val = time.mktime(request.if_unmodified_since.timetuple())
+        if time_val < timestamp:
+            halt(code=412)
+
+
+def _check_etag(request, response, etag, new_resource=False, weak=False):
+    response.etag = (etag, not weak)
+
+    # We assume the request is a new resource if it is a POST.
+    new_resource = new_resource or request.method == "POST"
+
+    # An etag will match a 'If-*-Match' header in two cases:
+    #  - If it's not a new resource, and the header specifies 'anything'
+    #    (i.e. '*')
+    #  - Otherwise, if it's an exact match.
+    def etag_matches(value):
+        if value is MatchAnyEtag:
+            return not new_resource
+        return etag in value
+
+    if response.is_success or response.status_int == 304:
+        if (request.if_none_match is not MatchNoneEtag and
+                etag_matches(request.if_none_match)):
+            if request.is_safe:
+                halt(code=304)
+            else:
+                halt(code=412)
+        elif (request.if_match is not MatchAnyEtag and
+                not etag_matches(request.if_match)):
+            halt(code=412)
+
+
+def conditional(etag=None, last_modified=None, new_resource=False,
+                weak=False):
+    """
+    This decorator lets a route declare cheap functions that return its
+    current ETag and/or last-modified date, given the request (e.g. from a
+    version number or a file's mtime).  They're called as soon as the route
+    matches, and if the request's conditional headers show that the client's
+    copy is current (or that a precondition failed), the request is halted
+    with a 304 or 412 without calling the route function at all.  Either
+    function can return None to skip its check.
+
+        @app.get("/feed/:name")
+        @conditional(etag=lambda req: feed_version(req.urlvars['name']))
+        def feed(name=None):
+            ...
+    """
+    def validate(request, response):
+        # The ETag takes precedence, so we check it first.
+        if etag is not None:
+            value = etag(request)
+            if value is not None:
+                _check_etag(request, response, value,
+                            new_resource=new_resource, weak=weak)
+
+        if last_modified is not None:
+            _check_last_modified(request, response, last_modified(request))
+
+    return validator(validate)
+
+
 class HobokenCachingMixin(object):
     """
     This class defines a mixin that one can combine with the base
     HobokenApplication to add some handy helpers for dealing with caching.
     """
+    # Only responses with these status codes are stored by cached().
+    CACHEABLE_STATUSES = (200, 203, 300, 301, 404, 410)
+
+    # These headers are never stored in a cached response - the Date header
+    # is set freshly on each request, and cookies are per-client.
+    UNCACHED_HEADERS = ('Date', 'Set-Cookie')
+
+    def __init__(self, *args, **kwargs):
+        super(HobokenCachingMixin, self).__init__(*args, **kwargs)
+
+        # The backend that cached() stores responses in.  This can be set
+        # with the 'RESPONSE_CACHE' config value.
+        self.response_cache = self.config.get('RESPONSE_CACHE')
+        if self.response_cache is None:
+            self.response_cache = MemoryCache()
+
+        self._cache_flights = SingleFlight()
+
     def check_last_modified(self, date):
         """
         This function will check if one of a given request's last modified
@@ -25,58 +139,14 @@ class HobokenCachingMixin(object):
         will call halt() to abort the current request with a 304 Not Modified
         status.
         """
-        if date is None:
-            return
-
-        # Python's time functions are stupid. We do everything with unix times.
-        timestamp = time.mktime(date.timetuple())
-        self.response.last_modified = timestamp
-
-        # We don't do anything if there's an ETag.
-        if self.request.if_none_match is not MatchNoneEtag:
-            return
-
-        if (self.response.status_int == 200 and
-                self.request.if_modified_since is not None):
-            time_val = time.mktime(self.request.if_modified_since.timetuple())
-            if time_val >= timestamp:
-                halt(code=304)
-
-        if ((self.response.is_success or self.response.status_int == 412) and
-                self.request.if_unmodified_since is not None):
-            time_val = time.mktime(
-                self.request.if_unmodified_since.timetuple())
-            if time_val < timestamp:
-                halt(code=412)
+        _check_last_modified(self.request, self.response, date)
 
     def check_etag(self, etag, new_resource=False, weak=False):
         """
         As per check_if_modified(), except checks the ETag header instead.
         """
-        self.response.etag = (etag, not weak)
-
-        # We assume the request is a new resource if it is a POST.
-        new_resource = new_resource or self.request.method == "POST"
-
-        # An etag will match a 'If-*-Match' header in two cases:
-        #  - If it's not a new resource, and the header specifies 'anything'
-        #    (i.e. '*')
-        #  - Otherwise, if it's an exact match.
-        def etag_matches(value):
-            if value is MatchAnyEtag:
-                return not new_resource
-            return etag in value
-
-        if self.response.is_success or self.response.status_int == 304:
-            if (self.request.if_none_match is not MatchNoneEtag and
-                    etag_matches(self.request.if_none_match)):
-                if self.request.is_safe:
-                    halt(code=304)
-                else:
-                    halt(code=412)
-            elif (self.request.if_match is not MatchAnyEtag and
-                    not etag_matches(self.request.if_match)):
-                halt(code=412)
+        _check_etag(self.request, self.response, etag,
+                    new_resource=new_resource, weak=weak)
 
     def set_cache_control(self, **kwargs):
         for key, val in iteritems(kwargs):
@@ -98,6 +168,197 @@ class HobokenCachingMixin(object):
         self.response.cache_control.max_age = max_age
         self.response.expires = amount
 
+    def cached(self, max_age=None, stale_while_revalidate=None,
+               stale_if_error=None):
+        """
+        This decorator caches the response of a route on the server.  Any
+        of the freshness values that aren't given are taken from the
+        Cache-Control header that the route sets on its response, and if
+        there's no max-age at all, the response isn't cached.
+
+        Once a response is stale, but still within its stale-while-revalidate
+        window, the stale copy is served immediately while a single
+        background thread regenerates it.  If regenerating a response raises
+        an exception and we're within the stale-if-error window, the stale
+        copy is served instead.  Concurrent misses for the same key are
+        coalesced onto a single call of the route function.
+
+        Note that this should be placed below the route decorator:
+
+            @app.get("/expensive")
+            @app.cached(max_age=60, stale_while_revalidate=30)
+            def expensive():
+                ...
+        """
+        policy = (max_age, stale_while_revalidate, stale_if_error)
+
+        def internal_decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self._serve_cached(policy, func, args, kwargs)
+            return wrapper
+        return internal_decorator
+
+    def cache_key(self, request):
+        """
+        Return the key that a response to the given request is cached under.
+        Override this in a subclass to customize how responses are cached.
+        Note that the values of any headers the response varies on are added
+        to this key.
+        """
+        return request.url
+
+    def _serve_cached(self, policy, func, args, kwargs):
+        request = self.request
+
+        # We only ever cache the responses to GET and HEAD requests.
+        if request.method not in ('GET', 'HEAD'):
+            return func(*args, **kwargs)
+
+        # Record which headers the route reads, so that we only share cached
+        # responses between requests that agree on them.
+        if hasattr(request, 'track_vary'):
+            request.track_vary()
+
+        # The headers that this resource varied on when it was last cached
+        # are stored alongside it, and are part of the full key.
+        base_key = self.cache_key(request)
+        varied = self.response_cache.get(base_key + b'#vary')
+        key = vary_key(base_key, varied, request.headers)
+
+        # This is a background regeneration, started below.
+        if request.environ.get('hoboken.cache.refresh'):
+            self._generate_cached(base_key, policy, func, args, kwargs)
+            return None
+
+        entry = self.response_cache.get(key)
+        if entry is not None:
+            if entry.is_fresh:
+                self._apply_cached(entry)
+                return None
+
+            if entry.can_revalidate:
+                self._refresh_cached(key, request)
+                self._apply_cached(entry)
+                return None
+
+        # We have no usable entry, so we regenerate it.  Halts and passes
+        # depend on this particular request (e.g. a 304 from check_etag()),
+        # so they're neither cached nor shared with any other waiters.
+        halted = []
+
+        def generate():
+            try:
+                return self._generate_cached(base_key, policy, func, args,
+                                             kwargs)
+            except HobokenUserException:
+                halted.append(sys.exc_info())
+                return None
+
+        try:
+            new_entry, shared = self._cache_flights.do(key, generate)
+        except Exception:
+            if entry is not None and entry.can_serve_on_error:
+                self.logger.exception("Serving stale response for %r", key)
+                self._apply_cached(entry)
+                return None
+            raise
+
+        if halted:
+            reraise(*halted[0])
+
+        if not shared:
+            return None
+
+        # If the computation we waited on was halted, returned a response we
+        # can't store, or produced a representation for different header
+        # values than ours, we have to call the route ourselves.
+        if (new_entry is None or
+                vary_key(base_key, new_entry.vary, request.headers) !=
+                new_entry.key):
+            return func(*args, **kwargs)
+
+        self._apply_cached(new_entry)
+        return None
+
+    def _generate_cached(self, base_key, policy, func, args, kwargs):
+        request = self.request
+        response = self.response
+
+        ret = func(*args, **kwargs)
+        if ret is not None:
+            self.on_returned_body(request, response, ret)
+
+        # Determine our cache policy.  Explicitly-given values win over the
+        # ones in the response's Cache-Control header.
+        cc = response.cache_control
+        max_age, swr, sie = policy
+        if max_age is None:
+            max_age = cc.s_max_age or cc.max_age
+        if swr is None:
+            swr = cc.stale_while_revalidate
+        if sie is None:
+            sie = cc.stale_if_error
+
+        # Merge the headers the route read into the response's Vary header,
+        # so that the cached copy carries them too.
+        varied = getattr(request, 'varied_headers', None)
+        if varied:
+            response.add_vary(*sorted(varied))
+        vary = response.vary or ()
+
+        # Make sure this response can actually be stored.
+        if (not isinstance(max_age, int) or
+                response.status_int not in self.CACHEABLE_STATUSES or
+                cc.no_store or cc.private or b'*' in vary or
+                'Set-Cookie' in response.headers):
+            return None
+
+        # Read the body into memory, and put it back on the response, since
+        # reading it will have consumed the underlying iterator.
+        body = response.body
+        response.body = body
+
+        headers = [(k, v) for k, v in response.headers.iteritems()
+                   if k not in self.UNCACHED_HEADERS]
+        key = vary_key(base_key, vary, request.headers)
+        entry = CacheEntry((response.status_int, headers, body), max_age,
+                           stale_while_revalidate=swr, stale_if_error=sie,
+                           key=key, vary=vary)
+
+        self.response_cache.set(base_key + b'#vary', entry.vary,
+                                timeout=entry.lifetime)
+        self.response_cache.set(key, entry, timeout=entry.lifetime)
+        return entry
+
+    def _apply_cached(self, entry):
+        status_int, headers, body = entry.value
+
+        response = self.response
+        response.status_int = status_int
+        for header in set(k for k, _ in headers):
+            response.headers.remove(header)
+        for k, v in headers:
+            response.headers.add(k, v)
+
+        response.headers['Age'] = str(int(entry.age))
+        response.body = body
+
+    def _refresh_cached(self, key, request):
+        # We regenerate the response by calling ourselves with a copy of this
+        # request, minus any conditional headers that would stop the route
+        # from producing a full response.
+        environ = dict(request.environ)
+        for header in ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE'):
+            environ.pop(header, None)
+        environ['REQUEST_METHOD'] = 'GET'
+        environ['hoboken.cache.refresh'] = True
+
+        def refresh():
+            Request(environ).get_response(self)
+
+        self._cache_flights.spawn(('refresh', key), refresh)
+
 
 class HobokenRedirectMixin(object):
     def redirect_back(self, *args, **kwargs):
@@ -135,3 +396,220 @@ class HobokenRenderMixin(object):
     def load_template(self, template_file):
         template = self._shift.new(template_file)
         return template
+
+
+class HobokenEventStreamMixin(object):
+    def event_stream(self, source, heartbeat=15.0, retry=None):
+        """
+        Make the current response a stream of Server-Sent Events from the
+        given source - either a Subscription from a Broker, or an iterable of
+        events.  For example:
+
+            broker = Broker()
+
+            @app.get("/updates")
+            def updates():
+                app.event_stream(broker.subscribe('updates'))
+        """
+        response = self.response
+        response.headers['Content-Type'] = 'text/event-stream'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers.pop('Content-Length', None)
+
+        # Stop nginx from buffering the stream.
+        response.headers['X-Accel-Buffering'] = 'no'
+
+        response.response_iter = EventStream(source, heartbeat=heartbeat,
+                                             retry=retry)
+
+
+class HobokenBatchMixin(object):
+    """
+    This mixin adds a batch endpoint, which lets a client make several
+    requests to the application in a single round trip.
+    """
+    # These parts of a batch request's environ are copied to each of its
+    # sub-requests, along with its headers (other than those describing its
+    # body).
+    BATCH_INHERITED_ENVIRON = ('REMOTE_ADDR', 'SERVER_PROTOCOL', 'SCRIPT_NAME',
+                               'wsgi.url_scheme', 'wsgi.errors',
+                               'hoboken.deadline')
+
+    def add_batch_route(self, match='/batch', max_requests=20,
+                        max_body=1024 * 1024, concurrency=4, timeout=30):
+        """
+        Add a POST route that runs a batch of sub-requests through this
+        application, concurrently, on the application's task pool.  The body
+        of the request is a JSON list of sub-requests (or an object with the
+        list as its 'requests' key), each of which looks like:
+
+            {"method": "GET", "path": "/users/1?fields=name",
+             "headers": {"Accept": "application/json"}, "body": "..."}
+
+        Only the path is required.  The response is a JSON object whose
+        'responses' key holds, in the same order, the status, headers and
+        body of each sub-request.  A body that isn't valid UTF-8 is base64
+        encoded, and the response has an 'encoding' of 'base64'.
+
+        At most max_requests sub-requests, and max_body bytes of JSON, are
+        accepted in a batch, and at most concurrency sub-requests from a
+        batch are run at once.  Sub-requests that haven't finished after
+        timeout seconds (or by the request's deadline, if that's sooner) get
+        a 504 status; if timeout is None, only the deadline applies.
+        """
+        def batch():
+            return self.run_batch(max_requests=max_requests,
+                                  max_body=max_body, concurrency=concurrency,
+                                  timeout=timeout)
+
+        self.post(match)(batch)
+        return batch
+
+    def run_batch(self, max_requests=20, max_body=1024 * 1024,
+                  concurrency=4, timeout=30):
+        """
+        Run the current request as a batch request - see add_batch_route().
+        """
+        request = self.request
+        if request.environ.get('hoboken.batch'):
+            halt(code=400, body=b'Batch requests cannot be nested')
+
+        length = request.content_length
+        if length is not None and length > max_body:
+            halt(code=413, body=b'Batch request is too large')
+        data = request.input_stream.read(max_body + 1 if length is None
+                                         else length)
+        if len(data) > max_body:
+            halt(code=413, body=b'Batch request is too large')
+
+        try:
+            items = json.loads(data.decode('utf-8'))
+            if isinstance(items, dict):
+                items = items['requests']
+            if not isinstance(items, list):
+                raise ValueError("The batch must be a list")
+            subrequests = [self._build_subrequest(item) for item in items]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            halt(code=400, body='Invalid batch request: {0}'.format(e))
+
+        if len(subrequests) > max_requests:
+            halt(code=413, body='A batch can contain at most {0} '
+                                'requests'.format(max_requests))
+
+        # The sub-requests share a deadline, so that they can stop early
+        # once the batch has given up on them.
+        deadline = request.deadline
+        if timeout is not None:
+            deadline = min(deadline or float('inf'), time.time() + timeout)
+        if deadline is not None:
+            for sub in subrequests:
+                sub.deadline = deadline
+
+        results = self._run_subrequests(subrequests, concurrency, deadline)
+
+        self.response.content_type = 'application/json'
+        return json.dumps({'responses': results})
+
+    def _build_subrequest(self, item):
+        path, _, query = item['path'].partition('?')
+        if not path.startswith('/'):
+            raise ValueError("Sub-request paths must start with '/'")
+
+        environ = self.request.environ
+        sub = Request.build(path,
+                            method=item.get('method', 'GET').upper(),
+                            query_string=query,
+                            server_name=environ.get('SERVER_NAME'),
+                            server_port=environ.get('SERVER_PORT'))
+
+        sub_environ = sub.environ
+        for key, value in iteritems(environ):
+            if key.startswith('HTTP_') and key not in ('HTTP_CONTENT_TYPE',
+                                                       'HTTP_CONTENT_LENGTH'):
+                sub_environ[key] = value
+        for key in self.BATCH_INHERITED_ENVIRON:
+            if key in environ:
+                sub_environ[key] = environ[key]
+
+        headers = item.get('headers') or {}
+        for name, value in iteritems(headers):
+            if not isinstance(value, string_types):
+                raise ValueError("Header values must be strings")
+            sub.headers[name] = value
+
+        body = item.get('body')
+        if body is None:
+            body = b''
+        elif isinstance(body, string_types):
+            body = body.encode('utf-8')
+        else:
+            raise ValueError("Sub-request bodies must be strings")
+        sub_environ['wsgi.input'] = BytesIO(body)
+        sub_environ['CONTENT_LENGTH'] = str(len(body))
+
+        # Stop sub-requests from starting batches of their own.
+        sub_environ['hoboken.batch'] = True
+        return sub
+
+    def _run_subrequests(self, subrequests, concurrency, deadline=None):
+        results = [None] * len(subrequests)
+        pending = deque(enumerate(subrequests))
+
+        # Each task runs sub-requests until there are none left, so at most
+        # 'concurrency' of them run at once.  Note that sub-requests are
+        # never run on this thread, since they would replace the current
+        # request.
+        def worker():
+            while True:
+                try:
+                    i, sub = pending.popleft()
+                except IndexError:
+                    return
+                results[i] = self._run_subrequest(sub)
+
+        tasks = []
+        for i in range(min(concurrency, len(subrequests))):
+            try:
+                tasks.append(self.tasks.run(worker))
+            except PoolFull:
+                break
+        if subrequests and not tasks:
+            halt(code=503, body=b'Too busy to run batch request')
+
+        for task in tasks:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, deadline - time.time())
+            task.wait(timeout)
+
+        # Anything that didn't finish by the deadline is abandoned.
+        pending.clear()
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {'status': 504, 'headers': [], 'body': ''}
+        return results
+
+    def _run_subrequest(self, sub):
+        try:
+            resp = sub.get_response(self)
+            body = resp.body
+        except Exception:
+            logger.exception("Error running batch sub-request %s %s",
+                             sub.method, sub.path_info)
+            return {'status': 500, 'headers': [], 'body': ''}
+
+        headers = [[_to_native(k), _to_native(v)]
+                   for k, v in resp.headers.iteritems()]
+        result = {'status': resp.status_int, 'headers': headers}
+        try:
+            result['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            result['body'] = base64.b64encode(body).decode('ascii')
+            result['encoding'] = 'base64'
+        return result
+
+
+def _to_native(value):
+    if isinstance(value, bytes) and str is not bytes:
+        return value.decode('latin-1')
+    return value
@@ -0,0 +1,231 @@
+"""
+A report on the live state of a worker: the requests it's handling, its
+thread pools, caches and routes, the garbage collector, and the process
+itself.  Everything is collected when the report is requested, so handling
+other requests costs nothing extra.  An Introspector is a WSGI application
+that serves the report as JSON, so it can be mounted on an application,
+e.g.:
+
+    app.mount('/_status', app.introspector)
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import gc
+import os
+import re
+import sys
+import json
+import time
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    import resource
+except ImportError:         # pragma: no cover
+    resource = None
+
+from hoboken.gcpolicy import GCPauses, gc_pauses
+from hoboken.metrics import ROUTE_KEY, route_label
+from hoboken.pool import all_pools
+from hoboken.timing import TIMER_KEY, clock
+
+
+# When this process started, as near as we can tell.  This is reset in a
+# forked child.
+_started = time.time()
+
+
+def _after_fork():
+    global _started
+    _started = time.time()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class Introspector(object):
+    """
+    Reports the live state of an application's worker.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def in_flight(self):
+        """
+        Find the requests that the application is handling, by looking for
+        its wsgi_entrypoint() in each thread's stack.  Their age is known if
+        the request is being timed, watched or measured - i.e. if the
+        REQUEST_TIMING, SLOW_REQUEST_THRESHOLD or METRICS config values are
+        set.
+        """
+        now = time.time()
+        watched = dict((id(entry.environ), entry)
+                       for entry in self.app.watchdog.in_flight())
+
+        requests = []
+        for thread_id, frame in sys._current_frames().items():
+            while frame is not None:
+                code = frame.f_code
+                if code.co_name == 'wsgi_entrypoint' and \
+                        frame.f_locals.get('self') is self.app:
+                    break
+                frame = frame.f_back
+            if frame is None:
+                continue
+
+            local_vars = frame.f_locals
+            environ = local_vars.get('environ') or {}
+            age = None
+            entry = watched.get(id(environ))
+            timer = environ.get(TIMER_KEY)
+            if entry is not None:
+                age = now - entry.started
+            elif timer is not None:
+                age = timer.total
+            elif local_vars.get('started') is not None:
+                age = clock() - local_vars['started']
+
+            route = environ.get(ROUTE_KEY)
+            requests.append({
+                'thread_id': thread_id,
+                'method': environ.get('REQUEST_METHOD'),
+                'path': (environ.get('SCRIPT_NAME', '') +
+                         environ.get('PATH_INFO', '')),
+                'route': None if route is None else route_label(route),
+                'age': age,
+            })
+        return requests
+
+    def pools(self):
+        return [dict(pool.stats(), name=pool.name) for pool in all_pools()]
+
+    def caches(self):
+        caches = {}
+        response_cache = getattr(self.app, 'response_cache', None)
+        if response_cache is not None:
+            caches['response_cache'] = cache_stats(response_cache)
+
+        # The re module's cache of compiled patterns, which the matchers
+        # and request parsing rely on.
+        re_cache = getattr(re, '_cache', None)
+        if re_cache is not None:
+            caches['re'] = {'type': 're', 'entries': len(re_cache),
+                            'max_entries': getattr(re, '_MAXCACHE', None)}
+        return caches
+
+    def routes(self):
+        app = self.app
+        by_method = dict((method, len(routes))
+                         for method, routes in app.routes.items())
+        all_routes = [route for routes in app.routes.values()
+                      for route in routes]
+        compiled = sum(1 for route in all_routes if _is_compiled(route))
+        return {
+            'count': len(all_routes),
+            'by_method': by_method,
+            'compiled': compiled,
+            'before_filters': len(app.before_filters),
+            'after_filters': len(app.after_filters),
+            'mounts': len(app.mounts),
+        }
+
+    def gc(self):
+        # Pauses are only counted from the first report on, so that they
+        # cost nothing unless something is looking at them.
+        gc_pauses.install()
+        self.app.gc_policy.record_pauses()
+        stats = {
+            'enabled': gc.isenabled(),
+            'counts': list(gc.get_count()),
+            'thresholds': list(gc.get_threshold()),
+            'pauses': gc_pauses.stats(),
+            'policy': self.app.gc_policy.stats(),
+        }
+        if hasattr(gc, 'get_stats'):
+            stats['generations'] = gc.get_stats()
+        if hasattr(gc, 'get_freeze_count'):
+            stats['frozen'] = gc.get_freeze_count()
+        return stats
+
+    def process(self):
+        return {
+            'pid': os.getpid(),
+            'uptime': time.time() - _started,
+            'threads': threading.active_count(),
+            'rss_bytes': current_rss(),
+            'max_rss_bytes': max_rss(),
+        }
+
+    def collect(self):
+        return {
+            'app': self.app.name,
+            'in_flight': self.in_flight(),
+            'pools': self.pools(),
+            'caches': self.caches(),
+            'routes': self.routes(),
+            'gc': self.gc(),
+            'process': self.process(),
+        }
+
+    def __call__(self, environ, start_response):
+        body = json.dumps(self.collect(), indent=2, sort_keys=True,
+                          default=repr).encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Cache-Control', 'no-cache'),
+        ])
+        return [body]
+
+
+def cache_stats(cache):
+    """
+    Report a cache's size and hit rate, as far as it keeps track of them.
+    """
+    stats = {'type': type(cache).__name__}
+    try:
+        stats['entries'] = len(cache)
+    except TypeError:
+        pass
+
+    for attr in ('max_entries', 'hits', 'misses'):
+        value = getattr(cache, attr, None)
+        if value is not None:
+            stats[attr] = value
+
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    if lookups:
+        stats['hit_rate'] = float(stats['hits']) / lookups
+    return stats
+
+
+def _is_compiled(route):
+    matcher = route.matcher
+    return any(hasattr(getattr(matcher, attr, None), 'match')
+               for attr in ('match_re', 're'))
+
+
+def current_rss():
+    """
+    Return the process's resident set size, in bytes, or None if it can't be
+    found (only Linux is supported).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss():
+    """
+    Return the process's peak resident set size, in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, and macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,277 @@
+"""
+An in-process load generator.  Requests are generated from templates, with
+parameters drawn from distributions, and sent straight to a WSGI
+application - there are no sockets involved, so what's measured is the
+framework and the application, without the network stack.  For example:
+
+    templates = [
+        RequestTemplate('/users/{id}', params={'id': integers(1, 1000)},
+                        weight=9),
+        RequestTemplate('/search', query={'q': '{term}'},
+                        params={'term': zipf(['a', 'b', 'c', 'd'])}),
+        RequestTemplate('/users', method='POST', body=json.dumps,
+                        params={'name': choice(['alice', 'bob'])}),
+    ]
+    report = run(app, templates, requests=10000, threads=4)
+    print(report.format(histogram=True))
+
+The requests can be sent from a number of threads and, where os.fork() is
+available, a number of processes.
+"""
+from __future__ import with_statement, absolute_import, division, \
+    print_function
+
+import os
+import json
+import random
+from io import BytesIO
+from bisect import bisect_right
+try:
+    from urllib.parse import urlencode
+except ImportError:         # pragma: no cover
+    from urllib import urlencode
+
+from hoboken.objects import WSGIFullRequest as Request
+from hoboken.replay import LoadReport, WSGITarget, run_load
+from hoboken.timing import clock
+from hoboken.six import iteritems, string_types, text_type
+
+
+def choice(values, weights=None):
+    """
+    A distribution that picks one of the values, either uniformly or in
+    proportion to the given weights.
+    """
+    values = list(values)
+    if weights is None:
+        return lambda rng: rng.choice(values)
+    return _Weighted(values, weights)
+
+
+def integers(low, high):
+    """
+    A distribution of integers between low and high, inclusive.
+    """
+    return lambda rng: rng.randint(low, high)
+
+
+def zipf(values, s=1.0):
+    """
+    A distribution that picks one of the values with a Zipf (power law)
+    skew: the nth value is picked in proportion to 1 / n ** s.  This is
+    useful for modelling a few hot keys among many cold ones.
+    """
+    values = list(values)
+    return _Weighted(values, [1.0 / (n ** s)
+                              for n in range(1, len(values) + 1)])
+
+
+class _Weighted(object):
+    def __init__(self, values, weights):
+        if len(values) != len(weights) or not values:
+            raise ValueError("There must be one weight for each value")
+        self.values = values
+        self.cumulative = []
+        total = 0.0
+        for weight in weights:
+            total += weight
+            self.cumulative.append(total)
+        self.total = total
+
+    def __call__(self, rng):
+        i = bisect_right(self.cumulative, rng.random() * self.total)
+        return self.values[min(i, len(self.values) - 1)]
+
+
+def _sample(value, rng):
+    return value(rng) if callable(value) else value
+
+
+class RequestTemplate(object):
+    """
+    A kind of request to send.  The path, and the values of the query,
+    headers and body, may contain '{name}' fields, which are filled in with
+    values drawn from the params - a mapping of names to either constants
+    or distributions (a function that takes a random.Random).  The body may
+    also be a function, which is given the values and returns the body.
+    Templates are picked in proportion to their weights.
+    """
+    def __init__(self, path, method='GET', query=None, headers=None,
+                 body=None, params=None, weight=1):
+        self.path = path
+        self.method = method
+        self.query = query or {}
+        self.headers = headers or {}
+        self.body = body
+        self.params = params or {}
+        self.weight = weight
+
+    def _body(self, values):
+        body = self.body
+        if callable(body):
+            body = body(values)
+        elif isinstance(body, string_types):
+            body = body.format(**values)
+        if isinstance(body, text_type):
+            body = body.encode('utf-8')
+        return body
+
+    def build(self, rng):
+        """
+        Build a WSGI environ for a request, using the given random.Random to
+        draw the parameters.
+        """
+        values = dict((name, _sample(value, rng))
+                      for name, value in iteritems(self.params))
+
+        def fill(s):
+            return s.format(**values) if isinstance(s, string_types) else s
+
+        query = urlencode(sorted((k, fill(v))
+                                 for k, v in iteritems(self.query)))
+        headers = dict((k, fill(v)) for k, v in iteritems(self.headers))
+        req = Request.build(fill(self.path), method=self.method,
+                            query_string=query, headers=headers)
+
+        body = self._body(values)
+        if body is not None:
+            req.environ['wsgi.input'] = BytesIO(body)
+            req.environ['CONTENT_LENGTH'] = str(len(body))
+        else:
+            req.environ['wsgi.input'] = BytesIO()
+        return req.environ
+
+    def __repr__(self):
+        return "RequestTemplate({0} {1})".format(self.method, self.path)
+
+
+class LoadGenerator(object):
+    """
+    Generates environs from a list of RequestTemplates.  Given a seed, the
+    same requests are generated each time.
+    """
+    def __init__(self, templates, seed=None):
+        if not templates:
+            raise ValueError("At least one template is required")
+        self.templates = list(templates)
+        self.seed = seed
+        self._pick = _Weighted(self.templates,
+                               [t.weight for t in self.templates])
+
+    def environs(self, requests=None, duration=None, seed=None):
+        """
+        Yield environs until the given number of requests have been
+        generated, or the given number of seconds have passed since the
+        first one.  The iterator isn't thread-safe, so run_load() takes a
+        lock around it.
+        """
+        if requests is None and duration is None:
+            raise ValueError("Either a number of requests or a duration "
+                             "must be given")
+        return self._environs(requests, duration,
+                              self.seed if seed is None else seed)
+
+    def _environs(self, requests, duration, seed):
+        rng = random.Random(seed)
+
+        deadline = None
+        count = 0
+        while requests is None or count < requests:
+            if duration is not None:
+                now = clock()
+                if deadline is None:
+                    deadline = now + duration
+                elif now >= deadline:
+                    return
+            count += 1
+            yield self._pick(rng).build(rng)
+
+
+def run(app, templates, requests=None, duration=None, threads=1,
+        processes=1, rate=None, seed=None):
+    """
+    Send generated requests to a WSGI application, and return a LoadReport.
+    Either a number of requests or a duration (in seconds) must be given;
+    the requests are split between the processes, and the rate - the total
+    number of requests per second, if given - is split between them too.
+    The templates may be a LoadGenerator, or a list of RequestTemplates.
+    """
+    generator = templates if isinstance(templates, LoadGenerator) else \
+        LoadGenerator(templates, seed)
+    if requests is None and duration is None:
+        raise ValueError("Either a number of requests or a duration must be "
+                         "given")
+    target = WSGITarget(app)
+
+    def run_one(requests, rate, seed):
+        items = ((environ, None) for environ in
+                 generator.environs(requests, duration, seed))
+        return run_load(items, target.send, threads=threads, rate=rate)
+
+    if processes <= 1:
+        return run_one(requests, rate, None)
+
+    if not hasattr(os, 'fork'):     # pragma: no cover
+        raise ValueError("Running in several processes requires os.fork()")
+
+    report = LoadReport()
+    report.start()
+    children = []
+    for i in range(processes):
+        share = None
+        if requests is not None:
+            share = requests // processes + (i < requests % processes)
+        child_seed = None if generator.seed is None else generator.seed + i
+        child_rate = rate / processes if rate else None
+
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            status = 1
+            try:
+                child = run_one(share, child_rate, child_seed)
+                with os.fdopen(w, 'wb') as f:
+                    f.write(_dump_report(child))
+                status = 0
+            finally:
+                os._exit(status)
+
+        os.close(w)
+        children.append((pid, r))
+
+    failed = 0
+    for pid, r in children:
+        with os.fdopen(r, 'rb') as f:
+            data = f.read()
+        _, status = os.waitpid(pid, 0)
+        if status != 0 or not data:
+            failed += 1
+        else:
+            report.merge(_load_report(data))
+
+    report.finish()
+    if failed:
+        raise RuntimeError("{0} of {1} load processes failed".format(
+            failed, processes))
+    return report
+
+
+def _dump_report(report):
+    data = {
+        'latencies': report.latencies,
+        'statuses': list(report.statuses.items()),
+        'errors': list(report.errors.items()),
+    }
+    return json.dumps(data).encode('utf-8')
+
+
+def _load_report(data):
+    data = json.loads(data.decode('utf-8'))
+    report = LoadReport()
+    report.latencies = data['latencies']
+    report.statuses = dict((int(status), count)
+                           for status, count in data['statuses'])
+    report.errors = dict((str(error), count)
+                         for error, count in data['errors'])
+    return report
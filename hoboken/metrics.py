@@ -0,0 +1,331 @@
+"""
+A small metrics registry - counters, gauges and histograms - that can be
+rendered in the Prometheus text format.
+
+Updates are recorded in a shard that belongs to the current thread, so
+recording a value never waits on a lock.  The shards are merged when the
+metrics are collected, and a thread's shard is folded into a retired total
+when the thread exits.  A registry is itself a WSGI application that serves
+its metrics, so it can be mounted on an application, e.g.:
+
+    app.mount('/metrics', app.metrics)
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import weakref
+from bisect import bisect_left
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import binary_type, text_type
+
+
+# Latency buckets, in seconds, each double the last: from 0.5ms up to about
+# 16 seconds.
+DEFAULT_BUCKETS = tuple(0.0005 * 2 ** i for i in range(16))
+
+# The environ key that holds the Route that handled a request.
+ROUTE_KEY = 'hoboken.route'
+
+# The label used for requests that didn't match any route.
+UNMATCHED = '<unmatched>'
+
+# The label used for request methods that the application doesn't support,
+# since clients can send anything there.
+OTHER_METHOD = 'other'
+
+
+class _ThreadMarker(object):
+    # Kept in a thread-local, so it's released when its thread exits.
+    pass
+
+
+class Metric(object):
+    """
+    The base class for metrics.  Each thread records into its own shard,
+    which is only ever written to by that thread.  Once the thread exits,
+    its shard is merged into the retired values, so that short-lived
+    threads don't leave shards behind.
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._markers = set()
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+
+            # A thread's locals are cleared when it exits, which releases
+            # the marker and retires the shard.
+            marker = self._local.marker = _ThreadMarker()
+            with self._lock:
+                self._shards.append(shard)
+                self._markers.add(weakref.ref(
+                    marker, lambda ref: self._retire(ref, shard)))
+            return shard
+
+    def _retire(self, ref, shard):
+        with self._lock:
+            self._markers.discard(ref)
+            self._shards.remove(shard)
+            self._merge(self._retired, shard)
+
+    def _snapshots(self):
+        # Copying a dict is atomic, so this is safe while other threads are
+        # recording into their shards.  Retired values are only changed
+        # under the lock.
+        with self._lock:
+            retired = self._retired.copy()
+            shards = list(self._shards)
+        return [retired] + [shard.copy() for shard in shards]
+
+    def _merge(self, merged, shard):
+        for labels, value in shard.items():
+            merged[labels] = merged.get(labels, 0) + value
+
+    def collect(self):
+        """
+        Return a dictionary mapping each tuple of label values to the merged
+        value for those labels.
+        """
+        merged = {}
+        for shard in self._snapshots():
+            self._merge(merged, shard)
+        return merged
+
+    def samples(self):
+        """
+        Return (suffix, labels, value) tuples for rendering, where labels is
+        a list of (name, value) pairs.
+        """
+        return [('', list(zip(self.labels, labels)), value)
+                for labels, value in sorted(self.collect().items())]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down, such as the number of requests in
+    progress.  Each shard holds the changes made on its thread, so the
+    total is correct even if it's increased and decreased on different
+    threads.
+    """
+    kind = 'gauge'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, labels=(), value=0):
+        """
+        Set the value for the given labels, by recording the difference from
+        the current total in this thread's shard.  Changes made on other
+        threads at the same time are added on top of it.
+        """
+        current = self.collect().get(labels, 0)
+        self.inc(labels, value - current)
+
+
+class Histogram(Metric):
+    """
+    Counts observed values in buckets with fixed upper bounds, along with
+    their sum and count.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        data = shard.get(labels)
+        if data is None:
+            # One count per bucket, one for +Inf, and then the sum.
+            data = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def _merge(self, merged, shard):
+        # The merged lists are always new, so that they're never shared
+        # with a shard, or with the retired values.
+        for labels, data in shard.items():
+            total = merged.get(labels)
+            if total is None:
+                merged[labels] = list(data)
+            else:
+                merged[labels] = [a + b for a, b in zip(total, data)]
+
+    def samples(self):
+        samples = []
+        bounds = [_format_value(b) for b in self.buckets] + ['+Inf']
+        for labels, data in sorted(self.collect().items()):
+            labels = list(zip(self.labels, labels))
+            cumulative = 0
+            for bound, count in zip(bounds, data):
+                cumulative += count
+                samples.append(('_bucket', labels + [('le', bound)],
+                                cumulative))
+            samples.append(('_sum', labels, data[-1]))
+            samples.append(('_count', labels, cumulative))
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    A collection of metrics, which can be rendered in the Prometheus text
+    format.  Calling it as a WSGI application serves the rendered metrics.
+    """
+    def __init__(self):
+        self.metrics = []
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def _add(self, klass, name, *args, **kwargs):
+        with self._lock:
+            metric = self._by_name.get(name)
+            if metric is None:
+                metric = self._by_name[name] = klass(name, *args, **kwargs)
+                self.metrics.append(metric)
+            elif not isinstance(metric, klass):
+                raise ValueError("Metric {0!r} is already registered as a "
+                                 "{1}".format(name, metric.kind))
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help, labels, buckets=buckets)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format, as bytes.
+        """
+        lines = []
+        for metric in list(self.metrics):
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                lines.append('{0}{1}{2} {3}'.format(
+                    metric.name, suffix, _format_labels(labels),
+                    _format_value(value)))
+
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+    def __call__(self, environ, start_response):
+        body = self.render()
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+
+class RequestMetrics(object):
+    """
+    The standard metrics that an application records for each request, when
+    the METRICS config value is set.  Requests are labelled with the pattern
+    of the route that handled them, rather than their path, so that the
+    number of label values stays bounded.  For the same reason, methods
+    other than the given ones are labelled as "other".
+    """
+    def __init__(self, registry, methods=()):
+        self.methods = frozenset(methods)
+        self.requests = registry.counter(
+            'hoboken_requests_total', 'Requests handled.',
+            ('method', 'route'))
+        self.responses = registry.counter(
+            'hoboken_responses_total', 'Responses sent, by status class.',
+            ('route', 'status'))
+        self.in_flight = registry.gauge(
+            'hoboken_requests_in_flight', 'Requests being handled.')
+        self.latency = registry.histogram(
+            'hoboken_request_duration_seconds',
+            'Time taken to handle requests, until the body is returned.',
+            ('route',))
+
+    def started(self):
+        self.in_flight.inc()
+
+    def finished(self, method, route, status, seconds):
+        label = route_label(route)
+        if method not in self.methods:
+            method = OTHER_METHOD
+        self.in_flight.dec()
+        self.requests.inc((method, label))
+        self.responses.inc((label, '{0}xx'.format(status // 100)))
+        self.latency.observe(seconds, (label,))
+
+
+def route_label(route):
+    """
+    Return the label for a route: its pattern, where there is one.
+    """
+    if route is None:
+        return UNMATCHED
+
+    matcher = route.matcher
+    for attr in ('original_route', 'path'):
+        value = getattr(matcher, attr, None)
+        if value is not None:
+            return _to_text(value)
+
+    regex = getattr(matcher, 're', None)
+    if regex is not None:
+        return _to_text(regex.pattern)
+    return type(matcher).__name__
+
+
+def _to_text(value):
+    if isinstance(value, binary_type):
+        return value.decode('utf-8', 'replace')
+    return text_type(value)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return (value.replace('\\', '\\\\').replace('\n', '\\n')
+                 .replace('"', '\\"'))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(_to_text(value)))
+                          for name, value in labels) + '}'
@@ -4,6 +4,7 @@ import codecs
 import logging
 
 from hoboken.objects.datastructures import ImmutableList
+from hoboken.objects.mixins.cache import note_vary
 from hoboken.six import text_type, binary_type, PY3
 
 
@@ -135,21 +136,25 @@ class WSGIAcceptMixin(object):
 
     @property
     def accept_mimetypes(self):
+        note_vary(self, b'Accept')
         vals = AcceptList.parse(self.headers.get('Accept'))
         return MIMEAccept(vals)
 
     @property
     def accept_charsets(self):
+        note_vary(self, b'Accept-Charset')
         vals = AcceptList.parse(self.headers.get('Accept-Charset'))
         return CharsetAccept(vals)
 
     @property
     def accept_encodings(self):
+        note_vary(self, b'Accept-Encoding')
         vals = AcceptList.parse(self.headers.get('Accept-Encoding'))
         return AcceptList(vals)
 
     @property
     def accept_languages(self):
+        note_vary(self, b'Accept-Language')
         vals = AcceptList.parse(self.headers.get('Accept-Language'))
         return LanguageAccept(vals)
 
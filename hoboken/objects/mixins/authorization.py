@@ -4,6 +4,7 @@ import re
 import logging
 
 from hoboken.six import binary_type, iteritems
+from hoboken.objects.mixins.cache import note_vary
 
 
 logger = logging.getLogger(__name__)
@@ -62,6 +63,7 @@ class WSGIRequestAuthorizationMixin(object):
 
     @property
     def authorization(self):
+        note_vary(self, b'Authorization')
         return parse_auth(self.headers.get(b'Authorization'))
 
     @authorization.setter
@@ -3,7 +3,7 @@ from __future__ import with_statement, absolute_import, print_function
 import re
 import logging
 from numbers import Number
-from hoboken.six import text_type
+from hoboken.six import binary_type, text_type
 from hoboken.objects.util import cached_property
 from hoboken.objects.oproperty import property_overriding, oproperty
 
@@ -172,6 +172,8 @@ class ResponseCacheObject(CacheObject):
     #   - s_max_age + value
     #   - must_revalidate
     #   - proxy_revalidate
+    #   - stale_while_revalidate + value (RFC 5861)
+    #   - stale_if_error + value (RFC 5861)
 
     public = _boolean_property(b'public')
     no_store = _boolean_property(b'no-store')
@@ -184,6 +186,8 @@ class ResponseCacheObject(CacheObject):
     max_age = _value_property(b'max-age')
     s_max_age = _value_property(b's-maxage')
     s_maxage = s_max_age
+    stale_while_revalidate = _value_property(b'stale-while-revalidate')
+    stale_if_error = _value_property(b'stale-if-error')
 
 
 @property_overriding
@@ -258,5 +262,83 @@ class WSGIResponseOtherCachesMixin(object):
         self.headers['Age'] = val
 
 
-# TODO:
-#   - The 'Vary' HTTP header
+def _header_name(name):
+    if isinstance(name, text_type):
+        name = name.encode('latin-1')
+    return name.strip()
+
+
+def note_vary(http_obj, header):
+    """
+    This function records that a value derived from the given request header
+    was read.  It does nothing unless the request is tracking its Vary
+    headers (see WSGIRequestVaryMixin).
+    """
+    varied = getattr(http_obj, 'varied_headers', None)
+    if varied is not None:
+        varied.add(_header_name(header))
+
+
+class WSGIRequestVaryMixin(object):
+    """
+    This mixin lets a request record which of its headers were read by the
+    properties that parse them (e.g. accept_mimetypes), so that a response
+    can declare them in its Vary header.  Tracking is disabled until
+    track_vary() is called.
+    """
+    def __init__(self, *args, **kwargs):
+        super(WSGIRequestVaryMixin, self).__init__(*args, **kwargs)
+        self.varied_headers = None
+
+    def track_vary(self):
+        if self.varied_headers is None:
+            self.varied_headers = set()
+
+
+class WSGIResponseVaryMixin(object):
+    def __init__(self, *args, **kwargs):
+        super(WSGIResponseVaryMixin, self).__init__(*args, **kwargs)
+
+    @property
+    def vary(self):
+        """
+        The Vary header, as a tuple of header names, or None if it's not set.
+        """
+        val = self.headers.get('Vary')
+        if val is None:
+            return None
+
+        return tuple(x.strip() for x in val.split(b',') if x.strip())
+
+    @vary.setter
+    def vary(self, val):
+        if val is None:
+            self.headers.pop('Vary', None)
+            return
+
+        if isinstance(val, (binary_type, text_type)):
+            val = [val]
+        self.headers['Vary'] = b', '.join(_header_name(x) for x in val)
+
+    @vary.deleter
+    def vary(self):
+        self.headers.pop('Vary', None)
+
+    def add_vary(self, *headers):
+        """
+        Add the given header names to the Vary header, ignoring any that are
+        already present.
+        """
+        current = list(self.vary or ())
+        if b'*' in current:
+            return
+
+        seen = set(x.lower() for x in current)
+        for header in headers:
+            header = _header_name(header)
+            if header.lower() not in seen:
+                seen.add(header.lower())
+                current.append(header)
+
+        if current:
+            self.vary = current
@@ -9,6 +9,7 @@ from datetime import date, datetime, timedelta
 
 from hoboken.six import iteritems, PY3, text_type
 from hoboken.objects.util import caching_property
+from hoboken.objects.mixins.cache import note_vary
 from hoboken.objects.datastructures import (
     CallbackMultiDictMixin,
     TranslatingMultiDict,
@@ -316,8 +317,13 @@ class WSGIRequestCookiesMixin(object):
         return (self.__cookies_header is not None and
                 self.__cookies_header is self.headers.get('Cookie'))
 
-    @caching_property(__cookie_cache_func)
+    @property
     def cookies(self):
+        note_vary(self, b'Cookie')
+        return self._parsed_cookies
+
+    @caching_property(__cookie_cache_func)
+    def _parsed_cookies(self):
         val = self.headers.get('Cookie')
         if not val:
             return {}
@@ -0,0 +1,104 @@
+from __future__ import with_statement, absolute_import, print_function
+
+import time
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.exceptions import DeadlineExceededException
+
+
+# The environ key that holds a request's deadline, as a time.time() value.
+DEADLINE_KEY = 'hoboken.deadline'
+
+# The request currently being handled on each thread, so that sub-requests
+# can inherit its deadline.
+_current = threading.local()
+
+
+def set_current_request(request):
+    """
+    Set the request being handled on this thread, returning the previous
+    one, which should be restored once the request is finished.
+    """
+    previous = getattr(_current, 'request', None)
+    _current.request = request
+    return previous
+
+
+def current_request():
+    """
+    Return the request being handled on this thread, or None.
+    """
+    return getattr(_current, 'request', None)
+
+
+def current_deadline():
+    """
+    Return the deadline of the request being handled on this thread, or
+    None if there isn't one.
+    """
+    request = current_request()
+    if request is None:
+        return None
+    return request.environ.get(DEADLINE_KEY)
+
+
+class WSGIRequestDeadlineMixin(object):
+    """
+    This mixin gives a request a deadline, after which the work done for it
+    should stop.  Deadlines are cooperative: the framework calls
+    check_deadline() at points where it's safe to stop, and long-running
+    handlers can do the same, or use time_remaining() to set timeouts on
+    their own calls.
+    """
+    def __init__(self, *args, **kwargs):
+        super(WSGIRequestDeadlineMixin, self).__init__(*args, **kwargs)
+
+    # Hook for time.time - makes testing easier.
+    _time = staticmethod(time.time)
+
+    def _deadline_getter(self):
+        return self.environ.get(DEADLINE_KEY)
+
+    def _deadline_setter(self, value):
+        if value is None:
+            self.environ.pop(DEADLINE_KEY, None)
+        else:
+            self.environ[DEADLINE_KEY] = float(value)
+
+    deadline = property(_deadline_getter, _deadline_setter, doc="""
+        The time (as a time.time() value) by which this request should be
+        finished, or None if it has no deadline.
+        """)
+    del _deadline_getter, _deadline_setter
+
+    def set_timeout(self, seconds):
+        """
+        Require that this request finish within the given number of seconds
+        from now.  This only ever brings the deadline forward.
+        """
+        deadline = self._time() + seconds
+        current = self.deadline
+        if current is None or deadline < current:
+            self.deadline = deadline
+
+    def time_remaining(self):
+        """
+        Return the number of seconds until this request's deadline (which
+        will be 0 if it has passed), or None if it has no deadline.
+        """
+        deadline = self.deadline
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self._time())
+
+    def check_deadline(self, code=503):
+        """
+        Raise a DeadlineExceededException, which ends the request with the
+        given status code, if the deadline has passed.
+        """
+        deadline = self.environ.get(DEADLINE_KEY)
+        if deadline is not None and self._time() >= deadline:
+            raise DeadlineExceededException(code)
@@ -1,8 +1,17 @@
 from __future__ import with_statement, absolute_import, print_function
 
 import re
+import hashlib
 import logging
 from hoboken.six import binary_type
+from hoboken.objects.util import ChainedIterator, iter_close
+
+# We use BLAKE2 to hash response bodies when it's available, since it's fast
+# and allows for a configurable digest size.
+try:
+    from hashlib import blake2b
+except ImportError:         # pragma: no cover
+    blake2b = None
 
 
 logger = logging.getLogger(__name__)
@@ -151,3 +160,45 @@ class WSGIResponseEtagMixin(object):
                 new_val = b'W/"' + val.replace(b'"', b'\\"') + b'"'
 
         self.headers['Etag'] = new_val
+
+    def add_body_etag(self, digest_size=16, max_size=1024 * 1024):
+        """
+        This function hashes the response body, and sets a strong ETag from
+        the hash, unless an ETag has already been set.  Bodies larger than
+        max_size are not hashed, so that streamed responses aren't buffered;
+        any chunks that were read are placed back in front of the remainder
+        of the body.  Bodies marked as streaming (with a true 'streaming'
+        attribute) are never read.  Returns whether an ETag was set.
+        """
+        if self.headers.get('Etag') is not None:
+            return False
+        if getattr(self.response_iter, 'streaming', False) is True:
+            return False
+
+        # If we know the body is too large, we don't read any of it.
+        length = self.headers.get('Content-Length')
+        if length is not None and int(length) > max_size:
+            return False
+
+        if blake2b is not None:
+            h = blake2b(digest_size=digest_size)
+        else:               # pragma: no cover
+            h = hashlib.sha1()
+
+        body_iter = self.response_iter
+        chunks = []
+        size = 0
+        for chunk in body_iter:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_size:
+                self.response_iter = ChainedIterator(chunks, body_iter)
+                return False
+            h.update(chunk)
+
+        # We've consumed the whole body, so we close it and replace it with
+        # the chunks we read.
+        iter_close(body_iter)
+        self.response_iter = chunks
+        self.etag = (h.hexdigest().encode('ascii'), True)
+        return True
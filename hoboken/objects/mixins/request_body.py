@@ -2,6 +2,7 @@ from __future__ import with_statement, absolute_import, print_function
 
 from hoboken.objects.http import quote, unquote, parse_options_header
 from hoboken.objects.util import missing
+from hoboken.timing import TIMER_KEY, clock
 from hoboken.six import (
     binary_type,
     text_type,
@@ -1642,16 +1643,32 @@ class RequestBodyMixin(object):
         # Get a form parser.
         fp = self.form_parser(on_field, on_file)
 
+        # If the input stream supports it, we use read1(), which can return
+        # data as it was received, rather than joining it into a larger
+        # block first.
+        read = getattr(self.input_stream, 'read1', self.input_stream.read)
+
+        # We stop reading a slow upload once the request's deadline passes.
+        check_deadline = getattr(self, 'check_deadline', None)
+
+        timer = getattr(self, 'environ', {}).get(TIMER_KEY)
+        if timer is not None:
+            start = clock()
+
         # Feed with data.
         try:
             while True:
-                data = self.input_stream.read(blocksize)
+                if check_deadline is not None:
+                    check_deadline()
+                data = read(blocksize)
                 fp.write(data)
                 if len(data) == 0:
                     break
             fp.finalize()
         finally:
             fp.close()
+            if timer is not None:
+                timer.add('parse_body', clock() - start)
 
         self.__post_fields = fields
         self.__files = files
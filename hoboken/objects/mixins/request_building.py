@@ -1,10 +1,131 @@
 from __future__ import with_statement, absolute_import, print_function
 
-from hoboken.six import binary_type, iteritems, PY3, reraise, text_type
+import sys
+try:
+    import queue
+except ImportError:         # pragma: no cover
+    import Queue as queue
+
+from hoboken.six import (advance_iterator, binary_type, iteritems, PY3,
+                         reraise, text_type)
+from hoboken.objects.mixins.deadline import (DEADLINE_KEY, current_deadline,
+                                             current_request)
+from hoboken.objects.util import iter_close
+from hoboken.pool import PoolFull, ThreadPool
+from hoboken.tracing import TRACE_KEY, KIND_CLIENT, format_traceparent
 
 # NOTE: much of the following code is taken from WebOb - an inspiration for
 # this functionality.  Thanks, guys!
 
+# The most applications that stream_application() calls on other threads at
+# once.  Once they're all busy, applications are called inline.
+STREAM_THREADS = 16
+
+_stream_pool = ThreadPool(threads=STREAM_THREADS, queue_size=STREAM_THREADS,
+                          name='hoboken-stream')
+
+
+def _no_start_response():
+    return AssertionError("The application returned without calling "
+                          "start_response()")
+
+
+class _Finished(object):
+    """
+    Placed on a _StreamedBody's queue by the thread that calls the
+    application, once it has returned (or raised an exception).
+    """
+    def __init__(self, result=None, exc_info=None):
+        self.result = result
+        self.exc_info = exc_info
+
+
+class _StreamedBody(object):
+    """
+    The body of an application's response, as returned by
+    stream_application(): any chunks passed to write(), which are read from
+    a bounded queue, followed by the application's own iterable.  Closing
+    this closes the application's iterable, and makes any later call to
+    write() fail.
+    """
+    def __init__(self, max_queued):
+        self.closed = False
+        self._queue = queue.Queue(max_queued)
+        self._head = []
+        self._iter = None
+        self._result = None
+
+    def _unbounded(self):
+        # For an application called inline, which can't wait for its
+        # writes to be read.
+        self._queue = queue.Queue()
+
+    def write(self, data):
+        if self.closed:
+            raise IOError("The response has been closed")
+        self._queue.put(data)
+
+    def _finish(self, finished):
+        # Called on the application's thread.  Once the body is closed,
+        # nothing reads the queue, so we make room rather than waiting
+        # forever - which would also tie up one of the stream threads.
+        while True:
+            try:
+                self._queue.put(finished, timeout=0.1)
+                break
+            except queue.Full:
+                if self.closed:
+                    self._drain()
+        if self.closed:
+            self._drain()
+
+    def _read(self):
+        """
+        Wait for the next chunk passed to write().  Returns None once the
+        application has returned, after which its iterable is used.
+        """
+        item = self._queue.get()
+        if not isinstance(item, _Finished):
+            return item
+
+        if item.exc_info is not None:
+            reraise(*item.exc_info)
+        self._result = item.result
+        self._iter = iter(item.result)
+        return None
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._head:
+            return self._head.pop(0)
+        while self._iter is None:
+            data = self._read()
+            if data is not None:
+                return data
+        return advance_iterator(self._iter)
+
+    # For Python 3.X
+    __next__ = next
+
+    def _drain(self):
+        # Unblock the application's thread if it's waiting to write, and
+        # close its iterable if it's already returned.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, _Finished) and item.result is not None:
+                iter_close(item.result)
+
+    def close(self):
+        self.closed = True
+        if self._result is not None:
+            iter_close(self._result)
+        self._drain()
+
 
 class WSGIRequestBuilderMixin(object):
     """
@@ -86,6 +207,8 @@ class WSGIRequestBuilderMixin(object):
             # The write() callable should append to our output list.
             return output.append
 
+        self._inherit_deadline()
+
         # Actually call the application.
         app_iter = wsgi_app(self.environ, start_response)
 
@@ -99,29 +222,139 @@ class WSGIRequestBuilderMixin(object):
                     app_iter.close()
             app_iter = output
 
+        if not captured:
+            raise _no_start_response()
+
         # Return the appropriate information.
         if catch_exc_info:
             return (captured[0], captured[1], app_iter, captured[2])
         else:
             return (captured[0], captured[1], app_iter)
 
-    def get_response(self, wsgi_app, catch_exc_info=False):
+    def _inherit_deadline(self):
+        # A sub-request made while handling another request shares its
+        # deadline, unless it already has an earlier one.
+        deadline = current_deadline()
+        if deadline is not None:
+            mine = self.environ.get(DEADLINE_KEY)
+            if mine is None or deadline < mine:
+                self.environ[DEADLINE_KEY] = deadline
+
+    def _start_span(self):
+        # A sub-request that was created while handling another request joins
+        # its trace.  Unless it shares the other request's environ (as with
+        # delegate()), the application it calls is also told about the trace
+        # in a traceparent header.
+        current = current_request()
+        shared = current is not None and current.environ is self.environ
+        trace = self.environ.get(TRACE_KEY)
+        if trace is None and current is not None and not shared:
+            trace = current.environ.get(TRACE_KEY)
+            if trace is not None:
+                self.environ[TRACE_KEY] = trace
+        if trace is None:
+            return None
+
+        span = trace.start('get_response', {
+            'http.method': self.environ.get('REQUEST_METHOD'),
+            'http.target': self.environ.get('PATH_INFO'),
+        }, KIND_CLIENT)
+        if not shared:
+            self.environ['HTTP_TRACEPARENT'] = format_traceparent(span)
+        return span
+
+    def stream_application(self, wsgi_app, catch_exc_info=False,
+                           max_queued=16):
         """
-        This function will use the above call_application to call an app, and
-        then return a response object.
+        This function is like call_application, except that the body isn't
+        read: the application's iterable is passed through, along with its
+        close() method, so that large responses can be proxied without
+        being held in memory.  So that the application can also use the
+        write() callable, it's called on another thread, and write() blocks
+        while there are max_queued chunks waiting to be read.  The threads
+        come from a pool of STREAM_THREADS; if none is idle, the application
+        is called on this thread, and anything it writes is buffered.
         """
-        # Ignore exception info here.
+        self._inherit_deadline()
+
+        captured = []
+        body = _StreamedBody(max_queued)
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and not catch_exc_info:
+                reraise(*exc_info)
+            captured[:] = [status, headers, exc_info]
+            return body.write
+
+        def run():
+            try:
+                result = wsgi_app(self.environ, start_response)
+            except Exception:
+                body._finish(_Finished(exc_info=sys.exc_info()))
+            else:
+                body._finish(_Finished(result))
+
+        try:
+            _stream_pool.run_now(run)
+        except PoolFull:
+            body._unbounded()
+            run()
+
+        # Wait until either the application has written something, or it's
+        # returned.  If it hasn't called start_response by then, it will do
+        # so when we read the first chunk of its iterable.
+        data = body._read()
+        if data is not None:
+            body._head.append(data)
+        elif not captured:
+            try:
+                body._head.append(advance_iterator(body._iter))
+            except StopIteration:
+                pass
+            except Exception:
+                body.close()
+                raise
+
+        if not captured:
+            body.close()
+            raise _no_start_response()
+
+        # Return the appropriate information.
         if catch_exc_info:
-            status, headers, app_iter, exc_info = self.call_application(
-                wsgi_app, catch_exc_info=True)
-            del exc_info
+            return (captured[0], captured[1], body, captured[2])
         else:
-            status, headers, app_iter = self.call_application(
-                wsgi_app, catch_exc_info=False)
+            return (captured[0], captured[1], body)
+
+    def get_response(self, wsgi_app, catch_exc_info=False, stream=False):
+        """
+        This function will use the above call_application (or, if stream is
+        true, stream_application) to call an app, and then return a response
+        object.
+        """
+        call = self.stream_application if stream else self.call_application
+
+        # If the request is being traced, the call gets a span.  (For a
+        # streamed response, it ends when the response starts.)
+        span = self._start_span()
+        try:
+            # Ignore exception info here.
+            if catch_exc_info:
+                status, headers, app_iter, exc_info = call(
+                    wsgi_app, catch_exc_info=True)
+                del exc_info
+            else:
+                status, headers, app_iter = call(wsgi_app,
+                                                 catch_exc_info=False)
+            if span is not None:
+                span.set_attribute('http.status_code', int(status[:3]))
+        finally:
+            if span is not None:
+                span.end()
 
-        # Set values on response and return.
+        # Set values on response and return.  The headers are copied once,
+        # into the response's own headers object.
         resp = self.ResponseClass()
         resp.status = status
-        resp.headers = list(headers)
+        resp.headers = headers
         resp.response_iter = app_iter
         return resp
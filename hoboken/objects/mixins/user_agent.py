@@ -5,6 +5,7 @@ import re
 import yaml
 
 from hoboken.six import binary_type, text_type
+from hoboken.objects.mixins.cache import note_vary
 
 
 def _e(val):                    # pragma: no cover
@@ -253,6 +254,7 @@ class WSGIUserAgentMixin(object):
 
     @property
     def user_agent(self):
+        note_vary(self, b'User-Agent')
         val = self.headers.get(b"User-Agent")
         if val is None:
             return None
@@ -200,8 +200,9 @@ class RequestVarsMixin(object):
 
 from .mixins.accept import WSGIAcceptMixin
 from .mixins.authorization import WSGIRequestAuthorizationMixin
-from .mixins.cache import WSGIRequestCacheMixin
+from .mixins.cache import WSGIRequestCacheMixin, WSGIRequestVaryMixin
 from .mixins.date import WSGIRequestDateMixin
+from .mixins.deadline import WSGIRequestDeadlineMixin
 from .mixins.etag import WSGIRequestEtagMixin
 from .mixins.request_building import WSGIRequestBuilderMixin
 from .mixins.user_agent import WSGIUserAgentMixin
@@ -211,5 +212,6 @@ class WSGIFullRequest(WSGIAcceptMixin, WSGIRequestAuthorizationMixin,
                       WSGIRequestCacheMixin, RequestVarsMixin,
                       WSGIRequestEtagMixin, WSGIRequestDateMixin,
                       WSGIRequestBuilderMixin, WSGIUserAgentMixin,
+                      WSGIRequestVaryMixin, WSGIRequestDeadlineMixin,
                       WSGIRequest):
     pass
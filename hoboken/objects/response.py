@@ -5,7 +5,7 @@ import collections
 from hoboken.objects.base import BaseResponse
 from hoboken.objects.headers import ResponseHeaders
 from hoboken.objects.constants import status_reasons, status_generic_reasons
-from hoboken.objects.util import iter_close
+from hoboken.objects.util import iter_close, ChainedIterator, ClosingIterator
 
 
 class EmptyResponse(object):
@@ -94,25 +94,48 @@ class WSGIBaseResponse(BaseResponse):
                              "iterable, not {0!s}".format(type(val))
                              )
 
+        # If we're given an iterable that isn't its own iterator, we need
+        # to keep it around so that it can still be closed.
+        if hasattr(val, 'close') and not (hasattr(val, '__next__') or
+                                          hasattr(val, 'next')):
+            val = ChainedIterator((), val)
         self._response_iter = iter(val)
 
     def close(self):
         """Close the underlying iterator, if we need to."""
         iter_close(self._response_iter)
 
+    _close_callbacks = None
+
+    def call_on_close(self, func):
+        """
+        Register a function to be called, with no arguments, once the body
+        returned from __call__ has been exhausted or closed - that is, once
+        the response has been sent.
+        """
+        if self._close_callbacks is None:
+            self._close_callbacks = []
+        self._close_callbacks.append(func)
+        return func
+
     def __call__(self, environ, start_response):
         header_list = list(self.headers.iteritems())
         start_response(self.status, header_list)
 
+        response_iter = self.response_iter
+        if self._close_callbacks:
+            response_iter = ClosingIterator(response_iter,
+                                            self._close_callbacks)
+
         # We special-case the HEAD method to return an empty response.
         if environ['REQUEST_METHOD'] == 'HEAD':
-            return EmptyResponse(self.response_iter)
+            return EmptyResponse(response_iter)
 
-        return self.response_iter
+        return response_iter
 
 
 from .mixins.authorization import WSGIResponseAuthorizationMixin
-from .mixins.cache import WSGIResponseCacheMixin
+from .mixins.cache import WSGIResponseCacheMixin, WSGIResponseVaryMixin
 from .mixins.date import WSGIResponseDateMixin
 from .mixins.etag import WSGIResponseEtagMixin
 from .mixins.response_body import ResponseBodyMixin
@@ -120,5 +143,6 @@ from .mixins.response_body import ResponseBodyMixin
 
 class WSGIFullResponse(ResponseBodyMixin, WSGIResponseAuthorizationMixin,
                        WSGIResponseCacheMixin, WSGIResponseEtagMixin,
-                       WSGIResponseDateMixin, WSGIBaseResponse):
+                       WSGIResponseDateMixin, WSGIResponseVaryMixin,
+                       WSGIBaseResponse):
     pass
@@ -1,13 +1,17 @@
 from __future__ import with_statement, absolute_import, print_function
+import logging
 from io import RawIOBase
 
 from hoboken.six import advance_iterator, callable
 
 __all__ = ['missing', '_environ_prop', '_environ_converter', '_int_parser',
            '_int_serializer', 'cached_property', 'caching_property',
-           'iter_close', 'BytesIteratorFile'
+           'iter_close', 'BytesIteratorFile', 'ChainedIterator',
+           'ClosingIterator'
            ]
 
+logger = logging.getLogger(__name__)
+
 
 class MissingObject(object):
     def __repr__(self):
@@ -124,6 +128,79 @@ def iter_close(iter):
         iter.close()
 
 
+class ChainedIterator(object):
+    """
+    An iterator that yields some chunks that have already been read from an
+    underlying iterator, followed by the rest of that iterator.  Calling
+    close() will close the underlying iterator, so this can replace it as a
+    WSGI response.
+    """
+    def __init__(self, head, rest):
+        self.head = list(head)
+        self.rest = iter(rest)
+        self._underlying = rest
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.head:
+            return self.head.pop(0)
+        return advance_iterator(self.rest)
+
+    # For Python 3.X
+    __next__ = next
+
+    def close(self):
+        iter_close(self._underlying)
+
+
+class ClosingIterator(object):
+    """
+    An iterator that wraps a WSGI response, and calls each of the given
+    callbacks once the response has been exhausted or closed, whichever
+    happens first.  Other attributes are looked up on the underlying
+    iterator, so that e.g. a streaming response is still recognized as one.
+    """
+    def __init__(self, iterable, callbacks):
+        self._underlying = iterable
+        self._iter = iter(iterable)
+        self._callbacks = list(callbacks)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return advance_iterator(self._iter)
+        except StopIteration:
+            self._run_callbacks()
+            raise
+
+    # For Python 3.X
+    __next__ = next
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._underlying, name)
+
+    def _run_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Error in response close callback %r",
+                                 callback)
+
+    def close(self):
+        try:
+            iter_close(self._underlying)
+        finally:
+            self._run_callbacks()
+
+
 class BytesIteratorFile(RawIOBase):
     def __init__(self, i):
         self.__iter = iter(i)
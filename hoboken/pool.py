@@ -0,0 +1,384 @@
+"""
+A small, bounded thread pool for running work in the background - for
+example, the functions an application queues with after_response(), or the
+sub-requests of a batch request.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import sys
+import time
+import atexit
+import logging
+import weakref
+from collections import deque
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import reraise
+
+
+logger = logging.getLogger(__name__)
+
+# All pools that have been created, so that they can be drained when the
+# process exits.
+_pools = weakref.WeakSet()
+
+# How long to wait for background work when the interpreter exits.  Work
+# that's still running after this is abandoned, rather than stopping the
+# process from exiting.
+EXIT_DRAIN_TIMEOUT = 10.0
+
+# The pool whose thread this is, if any.
+_current = threading.local()
+
+
+class PoolClosed(RuntimeError):
+    """
+    Raised when work is submitted to a pool that has been shut down.
+    """
+    pass
+
+
+class PoolFull(RuntimeError):
+    """
+    Raised by ThreadPool.run() when the pool's queue is full.
+    """
+    pass
+
+
+class TaskTimeout(RuntimeError):
+    """
+    Raised by Task.result() when the task doesn't finish in time.
+    """
+    pass
+
+
+class Task(object):
+    """
+    A function call that's been queued with ThreadPool.run().  The caller can
+    wait for its result, or cancel it if it hasn't started yet.
+    """
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.value = None
+        self.exc_info = None
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _run(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.started = time.time()
+
+        try:
+            self.value = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        finally:
+            self.finished = time.time()
+            self._done.set()
+
+    def cancel(self):
+        """
+        Stop the task from running, if it hasn't started yet.  Returns whether
+        it was cancelled.
+        """
+        with self._lock:
+            if self.started is not None:
+                return False
+            self.cancelled = True
+
+        self._done.set()
+        return True
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the task to finish, returning False if the timeout expired
+        first.
+        """
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    @property
+    def elapsed(self):
+        """
+        The time, in seconds, that the task took to run, or None if it hasn't
+        finished.
+        """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def result(self, timeout=None):
+        """
+        Wait for, and return, the task's result, re-raising any exception it
+        raised.
+        """
+        if not self.wait(timeout):
+            raise TaskTimeout("Task did not finish within {0} seconds".format(
+                timeout))
+        if self.cancelled:
+            raise TaskTimeout("Task was cancelled")
+        if self.exc_info is not None:
+            reraise(*self.exc_info)
+        return self.value
+
+    def __repr__(self):
+        return "Task(func={0!r}, done={1})".format(self.func, self.done())
+
+
+class ThreadPool(object):
+    """
+    A fixed number of threads that run submitted functions, in order, from a
+    bounded queue.  If the queue is full, new work is rejected (and counted)
+    rather than blocking the caller.  Failures are logged and counted, and
+    never propagate.
+
+    The threads are started when work is first submitted, and are restarted
+    in a forked child - work queued in the parent is not run twice.
+    """
+    def __init__(self, threads=4, queue_size=1024, name='hoboken-pool'):
+        self.num_threads = threads
+        self.queue_size = queue_size
+        self.name = name
+
+        self._init_locks()
+        self._reset()
+        _pools.add(self)
+
+    def _init_locks(self):
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._tasks = deque()
+        self._threads = []
+        self._closed = False
+
+        self.busy = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _start(self):
+        # Must be called with the lock held.
+        for i in range(self.num_threads):
+            t = threading.Thread(target=self._run,
+                                 name='{0}-{1}'.format(self.name, i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def _enqueue(self, func, args, kwargs, immediate=False):
+        """
+        Add a call to the queue, returning False (and counting the rejection)
+        if the queue is full - or, if immediate is true, if there's no idle
+        thread to start it straight away.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._closed:
+                raise PoolClosed("Cannot submit work to a closed pool")
+
+            if immediate:
+                full = self.busy + len(self._tasks) >= self.num_threads
+            else:
+                full = len(self._tasks) >= self.queue_size
+            if full:
+                self.rejected += 1
+                return False
+
+            if not self._threads:
+                self._start()
+
+            self._tasks.append((func, args, kwargs))
+            self.submitted += 1
+            self._work.notify()
+            return True
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a call to func(*args, **kwargs).  Returns False if the queue is
+        full, and the work was dropped.
+        """
+        if not self._enqueue(func, args, kwargs):
+            logger.warning("Background queue for %s is full, dropping call "
+                           "to %r", self.name, func)
+            return False
+        return True
+
+    def run(self, func, *args, **kwargs):
+        """
+        Queue a call to func(*args, **kwargs), returning a Task that can be
+        used to wait for its result.  Raises PoolFull if the queue is full.
+        """
+        task = Task(func, args, kwargs)
+        if not self._enqueue(task._run, (), {}):
+            raise PoolFull("The queue for {0} is full".format(self.name))
+        return task
+
+    def in_worker(self):
+        """
+        Return True if this is one of the pool's threads.  Work that runs on
+        the pool shouldn't wait for other work on the same pool, since every
+        thread could end up waiting.
+        """
+        return getattr(_current, 'pool', None) is self
+
+    def run_now(self, func, *args, **kwargs):
+        """
+        Like run(), but raises PoolFull unless one of the threads is idle,
+        so that the call never waits in the queue.
+        """
+        task = Task(func, args, kwargs)
+        if not self._enqueue(task._run, (), {}, immediate=True):
+            raise PoolFull("No thread in {0} is idle".format(self.name))
+        return task
+
+    def _run(self):
+        _current.pool = self
+        while True:
+            with self._lock:
+                while not self._tasks and not self._closed:
+                    self._work.wait()
+                if not self._tasks:
+                    return
+                func, args, kwargs = self._tasks.popleft()
+                self.busy += 1
+
+            failed = False
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                failed = True
+                logger.exception("Error in background call to %r", func)
+
+            with self._lock:
+                self.busy -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+                if not self._tasks and not self.busy:
+                    self._idle.notify_all()
+
+    def drain(self, timeout=None):
+        """
+        Wait until all queued work has finished.  Returns False if the
+        timeout expired first.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self._lock:
+            if self._pid != os.getpid():
+                return True
+
+            while self._tasks or self.busy:
+                if timeout is None:
+                    self._idle.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+
+        return True
+
+    def shutdown(self, wait=True, timeout=None):
+        """
+        Stop accepting work.  If wait is true, queued work is finished before
+        returning; returns False if the timeout expired first.
+        """
+        with self._lock:
+            self._closed = True
+            self._work.notify_all()
+            threads = list(self._threads)
+
+        if not wait:
+            return True
+
+        drained = self.drain(timeout)
+        if drained:
+            for t in threads:
+                t.join()
+        return drained
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': len(self._threads),
+                'busy': self.busy,
+                'queue_depth': len(self._tasks),
+                'queue_size': self.queue_size,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def __repr__(self):
+        return "ThreadPool(name={0!r}, threads={1}, queued={2})".format(
+            self.name, self.num_threads, len(self._tasks))
+
+
+def all_pools():
+    """
+    Return every pool in this process that hasn't been garbage-collected.
+    """
+    return list(_pools)
+
+
+def drain_all(timeout=None):
+    """
+    Wait for the queued work in every pool to finish.  The servers call this
+    when they stop gracefully, and it's also run (with EXIT_DRAIN_TIMEOUT)
+    when the interpreter exits.  Returns False if the timeout expired
+    first.
+    """
+    if timeout is not None:
+        deadline = time.time() + timeout
+
+    drained = True
+    for pool in list(_pools):
+        if timeout is not None:
+            timeout = max(0, deadline - time.time())
+        drained = pool.drain(timeout) and drained
+    return drained
+
+
+def _after_fork():
+    # A lock that was held by another thread when we forked would never be
+    # released in the child, so we start afresh.
+    for pool in list(_pools):
+        pool._init_locks()
+        pool._reset()
+
+
+def _drain_at_exit():
+    if not drain_all(EXIT_DRAIN_TIMEOUT):
+        logger.warning("Exiting with background work still queued")
+
+
+atexit.register(_drain_at_exit)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,208 @@
+"""
+Sampling profiling of route functions.  When the PROFILE_RATE (or
+PROFILE_ROUTES) config value is set, a fraction of calls to route functions
+are run under cProfile, and the results are aggregated for each route.
+
+The profiler is itself a WSGI application that reports the results, so it
+can be mounted on an application, e.g.:
+
+    app.mount('/_profile', app.profiler)
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import random
+import signal
+import logging
+import pstats
+try:
+    import cProfile as profile_module
+except ImportError:         # pragma: no cover
+    import profile as profile_module
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    from urlparse import parse_qs
+except ImportError:         # pragma: no cover
+    from urllib.parse import parse_qs
+
+from hoboken.metrics import route_label
+from hoboken.timing import cpu_clock
+from hoboken.six import StringIO
+
+
+logger = logging.getLogger(__name__)
+
+# The environ key that holds the profiler for a request, if it's enabled.
+PROFILER_KEY = 'hoboken.profiler'
+
+
+class RouteProfiler(object):
+    """
+    Profiles a sample of calls to route functions, and aggregates the
+    statistics for each route.  The settings are read, when each call is
+    made, from a mapping (normally the application's config):
+      - PROFILE_RATE: the fraction of calls to profile, between 0 and 1.
+      - PROFILE_ROUTES: a dictionary mapping route patterns to the rate for
+        that route, overriding PROFILE_RATE.
+      - PROFILE_BUDGET: the largest fraction of the CPU time spent in route
+        functions that can be spent in profiled calls.  Once it's used up,
+        calls aren't profiled until it's available again.  CPU time is
+        measured for the calling thread, so that time spent waiting (e.g.
+        on I/O, or for the GIL) doesn't count.
+
+    Only one call is profiled at a time; calls made while another is being
+    profiled aren't sampled.
+    """
+    def __init__(self, settings=None):
+        self.settings = settings if settings is not None else {}
+        self.stats = {}
+        self.samples = {}
+        self.total_time = 0.0
+        self.profiled_time = 0.0
+
+        self._lock = threading.RLock()
+        self._active = threading.Lock()
+
+    def rate_for(self, label):
+        routes = self.settings.get('PROFILE_ROUTES') or {}
+        rate = routes.get(label)
+        if rate is None:
+            rate = self.settings.get('PROFILE_RATE') or 0
+        return rate
+
+    def _within_budget(self):
+        budget = self.settings.get('PROFILE_BUDGET', 0.05)
+        with self._lock:
+            return self.profiled_time <= budget * self.total_time
+
+    def _account(self, elapsed, label=None, profile=None):
+        with self._lock:
+            self.total_time += elapsed
+            if profile is None:
+                return
+
+            self.profiled_time += elapsed
+            self.samples[label] = self.samples.get(label, 0) + 1
+            stats = self.stats.get(label)
+            if stats is None:
+                self.stats[label] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def call(self, route, func, args, kwargs):
+        """
+        Call a route's function, profiling the call if it's sampled.
+        """
+        label = route_label(route)
+        rate = self.rate_for(label)
+
+        profile = None
+        if rate and random.random() < rate and self._within_budget() and \
+                self._active.acquire(False):
+            profile = profile_module.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active.
+                profile = None
+                self._active.release()
+
+        start = cpu_clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._active.release()
+            self._account(cpu_clock() - start, label, profile)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.samples.clear()
+            self.total_time = self.profiled_time = 0.0
+
+    def report(self, label=None, sort='cumulative', limit=30):
+        """
+        Return the statistics for the given route (or every route that has
+        been sampled) as text.
+        """
+        out = StringIO()
+        with self._lock:
+            labels = [label] if label is not None else sorted(self.stats)
+            out.write("Profiled {0:.3f}s of {1:.3f}s of CPU time in route "
+                      "functions\n".format(self.profiled_time,
+                                           self.total_time))
+            for label in labels:
+                stats = self.stats.get(label)
+                if stats is None:
+                    continue
+
+                out.write("\n=== {0} ({1} samples) ===\n".format(
+                    label, self.samples[label]))
+                stats.stream = out
+                stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, directory):
+        """
+        Write the statistics for each route to a file in the given directory,
+        in the pstats format.  Returns the paths of the files.
+        """
+        paths = []
+        with self._lock:
+            for label, stats in self.stats.items():
+                name = ''.join(c if c.isalnum() else '_' for c in label)
+                path = os.path.join(directory,
+                                    'route{0}.pstats'.format(name))
+                stats.dump_stats(path)
+                paths.append(path)
+        return paths
+
+    def install_signal_handler(self, directory, signum=None):
+        """
+        Dump the statistics to the given directory whenever the process
+        receives the given signal (by default, SIGUSR2).
+        """
+        if signum is None:
+            signum = signal.SIGUSR2
+
+        def handler(signum, frame):
+            try:
+                paths = self.dump(directory)
+                logger.info("Dumped %d route profile(s) to %s", len(paths),
+                            directory)
+            except Exception:
+                logger.exception("Error dumping route profiles")
+
+        signal.signal(signum, handler)
+
+    def __call__(self, environ, start_response):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+
+        def arg(name, default=None):
+            return query.get(name, [default])[0]
+
+        try:
+            limit = int(arg('limit', 30))
+        except ValueError:
+            limit = 30
+
+        sort = arg('sort', 'cumulative')
+        if sort in pstats.Stats.sort_arg_dict_default:
+            status = '200 OK'
+            body = self.report(arg('route'), sort, limit)
+        else:
+            status = '400 Bad Request'
+            body = "Invalid sort key {0!r}; expected one of: {1}\n".format(
+                sort, ', '.join(sorted(pstats.Stats.sort_arg_dict_default)))
+        body = body.encode('utf-8')
+
+        start_response(status, [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
@@ -0,0 +1,386 @@
+"""
+Replay of captured traffic (see hoboken.capture) against an application, to
+check its performance on real traffic before deploying it.  Requests can be
+sent to a WSGI application in the same process, or to a server over HTTP,
+from a number of threads, either as fast as possible, at a fixed rate, or
+with the timing they were captured with.  For example:
+
+    python -m hoboken.replay traffic.capture --app myapp:app --threads 8
+    python -m hoboken.replay traffic.capture --url http://127.0.0.1:8000 \\
+        --rate 200
+"""
+from __future__ import with_statement, absolute_import, division, \
+    print_function
+
+import sys
+import math
+import time
+import argparse
+import importlib
+from bisect import bisect_left
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    import http.client as http_client
+    from urllib.parse import urlsplit
+except ImportError:         # pragma: no cover
+    import httplib as http_client
+    from urlparse import urlsplit
+
+from hoboken.capture import read_capture
+from hoboken.metrics import DEFAULT_BUCKETS
+from hoboken.objects import WSGIFullRequest as Request
+from hoboken.timing import clock
+from hoboken.six import string_types
+
+
+# The percentiles that a report summarises latencies with.
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LoadReport(object):
+    """
+    The results of sending a number of requests: their latencies, statuses
+    and errors.  It's safe to record results from several threads.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = {}
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = clock()
+
+    def finish(self):
+        self.finished = clock()
+
+    def record(self, latency, status=None, error=None):
+        """
+        Record a request's latency, along with either its HTTP status or,
+        if it couldn't be sent, the name of the error.
+        """
+        with self._lock:
+            self.latencies.append(latency)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def merge(self, other):
+        with self._lock:
+            self.latencies.extend(other.latencies)
+            for status, count in other.statuses.items():
+                self.statuses[status] = self.statuses.get(status, 0) + count
+            for error, count in other.errors.items():
+                self.errors[error] = self.errors.get(error, 0) + count
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        end = self.finished if self.finished is not None else clock()
+        return end - self.started
+
+    @property
+    def throughput(self):
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed else 0.0
+
+    def error_breakdown(self):
+        """
+        Count the failures: requests that couldn't be sent, by error, and
+        responses with a 4xx or 5xx status, by status.
+        """
+        breakdown = dict(self.errors)
+        for status, count in self.statuses.items():
+            if status >= 400:
+                breakdown[str(status)] = count
+        return breakdown
+
+    def percentiles(self, percentiles=PERCENTILES):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return dict((p, None) for p in percentiles)
+
+        # The nearest-rank method.
+        result = {}
+        for p in percentiles:
+            rank = int(math.ceil(p / 100.0 * len(latencies))) - 1
+            result[p] = latencies[max(0, min(rank, len(latencies) - 1))]
+        return result
+
+    def histogram(self, buckets=DEFAULT_BUCKETS):
+        """
+        Return (upper bound, count) pairs for the latencies, with a final
+        bound of None for those above the last bucket.
+        """
+        counts = [0] * (len(buckets) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(buckets, latency)] += 1
+        return list(zip(list(buckets) + [None], counts))
+
+    def summary(self):
+        latencies = self.latencies
+        return {
+            'requests': self.count,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput,
+            'statuses': dict(self.statuses),
+            'errors': self.error_breakdown(),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'max': max(latencies) if latencies else None,
+            'percentiles': self.percentiles(),
+        }
+
+    def format(self, histogram=False):
+        s = self.summary()
+        lines = [
+            "Requests:    {0}".format(s['requests']),
+            "Elapsed:     {0:.3f}s".format(s['elapsed']),
+            "Throughput:  {0:.1f} requests/sec".format(s['throughput']),
+            "Statuses:    {0}".format(', '.join(
+                '{0}: {1}'.format(k, v)
+                for k, v in sorted(s['statuses'].items())) or '-'),
+            "Errors:      {0}".format(', '.join(
+                '{0}: {1}'.format(k, v)
+                for k, v in sorted(s['errors'].items())) or '-'),
+        ]
+        if s['requests']:
+            lines.append("Latency:     mean {0:.2f}ms, max {1:.2f}ms".format(
+                s['mean'] * 1000, s['max'] * 1000))
+            for p, value in sorted(s['percentiles'].items()):
+                lines.append("  p{0:<9} {1:.2f}ms".format(p, value * 1000))
+        if histogram and s['requests']:
+            lines.append("Histogram:")
+            counts = self.histogram()
+            for bound, count in counts:
+                if bound is None:
+                    label = "> {0:g}ms".format(counts[-2][0] * 1000)
+                else:
+                    label = "<= {0:g}ms".format(bound * 1000)
+                lines.append("  {0:<11} {1}".format(label, count))
+        return '\n'.join(lines)
+
+
+class WSGITarget(object):
+    """
+    Sends requests to a WSGI application in this process, with a Request's
+    call_application(), so that there's no network overhead.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, environ):
+        request = Request(environ)
+        status, headers, body = request.call_application(self.app)
+
+        # The body is only read for us if the application used write().
+        try:
+            for chunk in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return int(status[:3])
+
+
+class HTTPTarget(object):
+    """
+    Sends requests to a server over HTTP, with a keep-alive connection for
+    each thread.
+    """
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http_client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def send(self, environ):
+        path = self.prefix + environ.get('SCRIPT_NAME', '') + \
+            environ.get('PATH_INFO', '/')
+        if environ.get('QUERY_STRING'):
+            path += '?' + environ['QUERY_STRING']
+
+        headers = dict((key[5:].replace('_', '-').title(), value)
+                       for key, value in environ.items()
+                       if key.startswith('HTTP_') and key != 'HTTP_HOST')
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        body = environ['wsgi.input'].read()
+
+        conn = self._connection()
+        try:
+            conn.request(environ.get('REQUEST_METHOD', 'GET'), path,
+                         body=body or None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception:
+            conn.close()
+            self._local.conn = None
+            raise
+
+        if response.getheader('connection', '').lower() == 'close':
+            conn.close()
+            self._local.conn = None
+        return response.status
+
+
+class Pacer(object):
+    """
+    Decides when each request should be sent: as soon as possible, at a
+    fixed overall rate, or - with a speed - with the same spacing as the
+    times the requests were captured at, sped up by that factor.
+    """
+    def __init__(self, rate=None, speed=None):
+        self.rate = rate
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._start = None
+        self._first = None
+        self._next = None
+
+    def wait(self, captured_at=None):
+        with self._lock:
+            now = clock()
+            if self._start is None:
+                self._start = self._next = now
+                self._first = captured_at
+
+            if self.speed and captured_at is not None:
+                when = self._start + (captured_at - self._first) / self.speed
+            elif self.rate:
+                when = max(self._next, now)
+                self._next = when + 1.0 / self.rate
+            else:
+                return
+
+        delay = when - clock()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_load(items, send, threads=1, rate=None, speed=None, report=None):
+    """
+    Send each item with send(item) from the given number of threads, and
+    return a LoadReport.  Each item is an (environ, captured_at) pair;
+    captured_at is only used when a speed is given.  send() should return
+    the response's status, or raise an exception if the request failed.
+    """
+    if report is None:
+        report = LoadReport()
+    pacer = Pacer(rate, speed)
+    items = iter(items)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                try:
+                    environ, captured_at = next(items)
+                except StopIteration:
+                    return
+
+            pacer.wait(captured_at)
+            start = clock()
+            try:
+                status = send(environ)
+            except Exception as e:
+                report.record(clock() - start, error=type(e).__name__)
+            else:
+                report.record(clock() - start, status)
+
+    workers = [threading.Thread(target=worker,
+                                name='hoboken-load-{0}'.format(i))
+               for i in range(threads)]
+    report.start()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    report.finish()
+    return report
+
+
+def replay(requests, target, threads=1, rate=None, speed=None, repeat=1):
+    """
+    Replay captured requests - a capture file's path, or an iterable of
+    CapturedRequests - against a target: a WSGI application, a URL, or an
+    object with a send(environ) method.  Returns a LoadReport.
+    """
+    if isinstance(requests, string_types):
+        requests = read_capture(requests)
+    requests = list(requests)
+
+    if isinstance(target, string_types):
+        target = HTTPTarget(target)
+    elif not hasattr(target, 'send'):
+        target = WSGITarget(target)
+
+    # When repeating, later passes are placed after the earlier ones.
+    span = 0.0
+    if requests:
+        span = requests[-1].time - requests[0].time
+
+    def items():
+        for n in range(repeat):
+            for r in requests:
+                yield r.make_environ(), r.time + n * span
+
+    return run_load(items(), target.send, threads=threads, rate=rate,
+                    speed=speed)
+
+
+def load_app(spec):
+    """
+    Import an application given as 'module:attribute'.
+    """
+    module_name, _, attr = spec.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, attr or 'app')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay captured traffic against an application.")
+    parser.add_argument('capture', help="the capture file to replay")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--app', help="a WSGI application to call in this "
+                       "process, as module:attribute")
+    group.add_argument('--url', help="the base URL of a server")
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--rate', type=float,
+                        help="the total requests per second to send")
+    parser.add_argument('--speed', type=float,
+                        help="keep the captured timing, sped up by this "
+                        "factor")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="the number of times to replay the capture")
+    args = parser.parse_args(argv)
+
+    target = args.url if args.url else load_app(args.app)
+    report = replay(args.capture, target, threads=args.threads,
+                    rate=args.rate, speed=args.speed, repeat=args.repeat)
+    print(report.format())
+    return 1 if report.error_breakdown() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
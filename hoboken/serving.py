@@ -0,0 +1,1581 @@
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import re
+import sys
+import time
+import errno
+import random
+import select
+import signal
+import socket
+import logging
+from email.utils import formatdate
+from collections import deque
+try:
+    import selectors
+except ImportError:         # pragma: no cover
+    selectors = None
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+try:
+    import queue
+except ImportError:         # pragma: no cover
+    import Queue as queue
+try:
+    from urllib.parse import unquote_to_bytes as _unquote
+except ImportError:         # pragma: no cover
+    from urllib import unquote as _unquote
+try:
+    from importlib import reload as _reload_module
+except ImportError:         # pragma: no cover
+    _reload_module = reload
+
+from hoboken.six import PY3, reraise, string_types, text_type
+from hoboken.pool import drain_all
+
+
+logger = logging.getLogger(__name__)
+
+SERVER_SOFTWARE = 'Hoboken'
+
+# Limits on the size of an incoming request head.
+MAX_LINE = 65536
+MAX_HEADERS = 100
+
+# A chunk size is only hex digits; int() would also accept a sign, a "0x"
+# prefix or underscores.
+_CHUNK_SIZE_RE = re.compile(br'^[0-9A-Fa-f]+$')
+
+# A worker exits with this code if it can't load the application.  The
+# master stops, rather than endlessly forking workers that will fail.
+WORKER_BOOT_ERROR = 3
+
+
+class HTTPParseError(ValueError):
+    """
+    Raised when an incoming request can't be parsed.  The status code is the
+    one that should be sent to the client.
+    """
+    def __init__(self, message, status=400):
+        super(HTTPParseError, self).__init__(message)
+        self.status = status
+
+
+if PY3:             # pragma: no cover
+    def _native(value):
+        return value.decode('latin-1')
+
+    def _unquote_path(path):
+        return _unquote(path).decode('latin-1')
+
+    def _to_bytes(value):
+        if isinstance(value, text_type):
+            value = value.encode('latin-1')
+        return value
+else:               # pragma: no cover
+    def _native(value):
+        return value
+
+    def _unquote_path(path):
+        return _unquote(path)
+
+    def _to_bytes(value):
+        if isinstance(value, text_type):
+            value = value.encode('latin-1')
+        return value
+
+
+_date_cache = [None, None]
+
+
+def http_date():
+    """
+    Return the current time formatted for a Date header.  This is cached for
+    a second at a time, since it's needed for every response.
+    """
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[:] = [now, formatdate(now, usegmt=True).encode('ascii')]
+    return _date_cache[1]
+
+
+def parse_request_line(line):
+    """
+    Parse an HTTP request line into a tuple of (method, target, version),
+    each as a bytestring.
+    """
+    parts = line.rstrip(b'\r\n').split(b' ')
+    if len(parts) != 3:
+        raise HTTPParseError("Malformed request line: {0!r}".format(line))
+
+    method, target, version = parts
+    if not method or not target:
+        raise HTTPParseError("Malformed request line: {0!r}".format(line))
+    if version not in (b'HTTP/1.0', b'HTTP/1.1'):
+        raise HTTPParseError("Unsupported HTTP version: {0!r}".format(
+            version), status=505)
+
+    return method, target, version
+
+
+def parse_header_line(line):
+    """
+    Parse a single header line into a (name, value) tuple.  Names are
+    returned upper-cased, as they would be in a WSGI environ.
+    """
+    name, sep, value = line.partition(b':')
+    name = name.strip()
+    if not sep or not name or b' ' in name:
+        raise HTTPParseError("Malformed header line: {0!r}".format(line))
+    return name.upper(), value.strip()
+
+
+def parse_chunk_size(line):
+    """
+    Parse the size from a chunk header line, ignoring any chunk extensions.
+    """
+    size = line.split(b';', 1)[0].strip()
+    if not _CHUNK_SIZE_RE.match(size):
+        raise HTTPParseError("Invalid chunk size: {0!r}".format(line))
+    return int(size, 16)
+
+
+def build_environ(method, target, version, headers, body, client_address,
+                  server_address, multithread=False, multiprocess=False):
+    """
+    Build a WSGI environ from a parsed request.  The headers are a list of
+    (NAME, value) bytestring tuples, as returned from parse_header_line.
+    """
+    path, _, query = target.partition(b'?')
+
+    # Requests for an absolute URI (e.g. from a proxy) are routed based on
+    # their path only.
+    if path.startswith(b'http://') or path.startswith(b'https://'):
+        path = b'/' + path.split(b'/', 3)[-1] if path.count(b'/') > 2 \
+            else b'/'
+
+    environ = {
+        'REQUEST_METHOD': _native(method),
+        'SCRIPT_NAME': '',
+        'PATH_INFO': _unquote_path(path),
+        'QUERY_STRING': _native(query),
+        'SERVER_NAME': server_address[0],
+        'SERVER_PORT': str(server_address[1]),
+        'SERVER_PROTOCOL': _native(version),
+        'SERVER_SOFTWARE': SERVER_SOFTWARE,
+        'REMOTE_ADDR': client_address[0] if client_address else '',
+        'REMOTE_PORT': str(client_address[1]) if client_address else '',
+
+        # WSGI variables.
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': multithread,
+        'wsgi.multiprocess': multiprocess,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in headers:
+        name = _native(name).replace('-', '_')
+        value = _native(value)
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+
+        key = 'HTTP_' + name
+        if key in environ:
+            # Repeated headers are combined, as per RFC 7230.
+            environ[key] += ',' + value
+        else:
+            environ[key] = value
+
+    return environ
+
+
+def request_framing(version, headers):
+    """
+    Work out how a request's body is framed, and whether the connection
+    should be kept alive, from its parsed headers.  Returns a tuple of
+    (content length, chunked, keep alive, expects 100-continue).
+    """
+    header_dict = dict(headers)
+    te = header_dict.get(b'TRANSFER-ENCODING', b'').lower()
+    chunked = te == b'chunked'
+    if te and not chunked:
+        raise HTTPParseError("Unsupported transfer encoding", status=501)
+
+    length = 0
+    if not chunked and b'CONTENT-LENGTH' in header_dict:
+        try:
+            length = int(header_dict[b'CONTENT-LENGTH'])
+        except ValueError:
+            raise HTTPParseError("Invalid Content-Length")
+        if length < 0:
+            raise HTTPParseError("Invalid Content-Length")
+
+    conn = header_dict.get(b'CONNECTION', b'').lower()
+    if version == b'HTTP/1.1':
+        keep_alive = conn != b'close'
+    else:
+        keep_alive = conn == b'keep-alive'
+
+    expect_continue = (version == b'HTTP/1.1' and
+                       header_dict.get(b'EXPECT', b'').lower() ==
+                       b'100-continue')
+
+    return length, chunked, keep_alive, expect_continue
+
+
+class InputStream(object):
+    """
+    This class is the wsgi.input stream for a request.  It reads at most the
+    request's body from the underlying connection - either a fixed length,
+    or a chunked body - so that any pipelined requests that follow are left
+    untouched.
+    """
+    def __init__(self, rfile, length=0, chunked=False, on_first_read=None):
+        self.rfile = rfile
+        self.remaining = length
+        self.chunked = chunked
+        self.on_first_read = on_first_read
+        self._chunk_left = 0
+        self._eof = not chunked and length <= 0
+
+    def _start(self):
+        if self.on_first_read is not None:
+            callback, self.on_first_read = self.on_first_read, None
+            callback()
+
+    def _next_chunk(self):
+        line = self.rfile.readline(MAX_LINE)
+        if not line:
+            raise HTTPParseError("Unexpected end of chunked body")
+        size = parse_chunk_size(line)
+
+        if size == 0:
+            # Skip any trailers, up to and including the final empty line.
+            while True:
+                line = self.rfile.readline(MAX_LINE)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+            self._eof = True
+
+        self._chunk_left = size
+
+    def _read_some(self, size, reader):
+        """
+        Read up to size bytes (or everything, if size is negative) of the
+        body using the given reader function, without crossing a chunk
+        boundary.
+        """
+        if self._eof:
+            return b''
+        self._start()
+
+        if not self.chunked:
+            if size < 0 or size > self.remaining:
+                size = self.remaining
+            data = reader(size)
+            if not data:
+                raise HTTPParseError("Unexpected end of body")
+            self.remaining -= len(data)
+            self._eof = self.remaining <= 0
+            return data
+
+        if self._chunk_left == 0:
+            self._next_chunk()
+            if self._eof:
+                return b''
+
+        if size < 0 or size > self._chunk_left:
+            size = self._chunk_left
+        data = reader(size)
+        if not data:
+            raise HTTPParseError("Unexpected end of chunked body")
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            # Consume the CRLF following the chunk's data.
+            self.rfile.readline(MAX_LINE)
+        return data
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+
+        parts = []
+        while size != 0:
+            data = self._read_some(size, self.rfile.read)
+            if not data:
+                break
+            parts.append(data)
+            if size > 0:
+                size -= len(data)
+
+        return b''.join(parts)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+
+        parts = []
+        while size != 0:
+            data = self._read_some(size, self.rfile.readline)
+            if not data:
+                break
+            parts.append(data)
+            if data.endswith(b'\n'):
+                break
+            if size > 0:
+                size -= len(data)
+
+        return b''.join(parts)
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def drain(self, limit=65536):
+        """
+        Discard any of the body that the application didn't read.  Returns
+        True if the body was fully consumed, or False if more than limit
+        bytes were left (in which case the connection can't be reused).
+        """
+        # If the client is waiting for a 100 Continue that we never sent,
+        # it won't send the body, and we can't reuse the connection.
+        if self.on_first_read is not None and not self._eof:
+            return False
+
+        while limit > 0 and not self._eof:
+            data = self._read_some(min(limit, 8192), self.rfile.read)
+            limit -= len(data)
+        return self._eof
+
+
+class HTTPConnection(object):
+    """
+    This class serves HTTP/1.1 requests on a single, blocking, client
+    connection.  Requests on a connection are handled one after another, so
+    both keep-alive and pipelined requests are supported.  If
+    keepalive_timeout is None (or 0), keep-alive is disabled, and the
+    connection is closed after each response.
+    """
+    def __init__(self, app, sock, client_address, server_address,
+                 multithread=False, multiprocess=False, keepalive_timeout=5.0,
+                 request_timeout=30.0):
+        self.app = app
+        self.sock = sock
+        self.client_address = client_address
+        self.server_address = server_address
+        self.multithread = multithread
+        self.multiprocess = multiprocess
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+
+        self.rfile = sock.makefile('rb', 65536)
+        self.requests = 0
+
+        # The ResponseWriter for the request currently being served.
+        self.response = None
+
+        # Responses are written with as few calls as possible, so there's no
+        # benefit to delaying small writes.
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (socket.error, AttributeError):
+            pass
+
+    def handle(self, after_request=None):
+        """
+        Serve requests until the connection is closed.  If given, the
+        after_request function is called after every request, and can
+        return False to close the connection.
+        """
+        try:
+            while True:
+                served = self.requests
+                keep_alive = self.handle_one()
+                if self.requests > served and after_request is not None:
+                    keep_alive = after_request() and keep_alive
+                if not keep_alive:
+                    break
+        except socket.timeout:
+            pass
+        except socket.error as e:
+            self._log_socket_error(e)
+        finally:
+            self.close()
+
+    def handle_ready(self):
+        """
+        Serve the request on this connection, along with any pipelined
+        requests that have already arrived, but don't wait for any more.
+        Returns whether the connection can be kept open - if not, it has been
+        closed.
+        """
+        keep_alive = False
+        try:
+            keep_alive = self.handle_one()
+            while keep_alive and self.has_pending():
+                keep_alive = self.handle_one()
+        except socket.timeout:
+            pass
+        except socket.error as e:
+            self._log_socket_error(e)
+
+        if not keep_alive:
+            self.close()
+        return keep_alive
+
+    def has_pending(self):
+        """
+        Return whether there's data for another request that can be read
+        without blocking.
+        """
+        peek = getattr(self.rfile, 'peek', None)
+        if peek is None:        # pragma: no cover
+            return False
+
+        self.sock.settimeout(0.0)
+        try:
+            return bool(peek(1))
+        except socket.error:
+            return False
+        finally:
+            self.sock.settimeout(self._idle_timeout)
+
+    @property
+    def _idle_timeout(self):
+        # How long to wait for the next request.  Without keep-alive, there's
+        # only the first, which is treated like the rest of the request.
+        return self.keepalive_timeout or self.request_timeout
+
+    def _log_socket_error(self, e):
+        if e.args and e.args[0] not in (errno.EPIPE, errno.ECONNRESET):
+            logger.exception("Error serving connection from %r",
+                             self.client_address)
+
+    def abort(self):
+        """
+        Stop serving this connection from another thread.  A streaming
+        response is closed, and the socket is shut down, so that any blocked
+        read or write fails straight away.
+        """
+        response = self.response
+        if response is not None and response.streaming:
+            body = response.body
+            if hasattr(body, 'close'):
+                body.close()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def close(self):
+        try:
+            self.rfile.close()
+        finally:
+            try:
+                self.sock.close()
+            except socket.error:        # pragma: no cover
+                pass
+
+    def read_request_head(self):
+        """
+        Read the request line and headers.  Returns None if the connection
+        was closed before a request was sent.
+        """
+        self.sock.settimeout(self._idle_timeout)
+        while True:
+            line = self.rfile.readline(MAX_LINE + 1)
+            if not line:
+                return None
+            if line not in (b'\r\n', b'\n'):
+                break
+
+        self.sock.settimeout(self.request_timeout)
+        if len(line) > MAX_LINE:
+            raise HTTPParseError("Request line too long", status=414)
+        method, target, version = parse_request_line(line)
+
+        headers = []
+        while True:
+            line = self.rfile.readline(MAX_LINE + 1)
+            if not line:
+                raise HTTPParseError("Connection closed in request headers")
+            if line in (b'\r\n', b'\n'):
+                break
+            if len(line) > MAX_LINE or len(headers) >= MAX_HEADERS:
+                raise HTTPParseError("Request headers too large", status=431)
+            headers.append(parse_header_line(line))
+
+        return method, target, version, headers
+
+    def handle_one(self):
+        """
+        Serve a single request.  Returns whether the connection can be used
+        for another request.
+        """
+        try:
+            head = self.read_request_head()
+            if head is None:
+                return False
+            method, target, version, headers = head
+            length, chunked, keep_alive, expect_continue = \
+                request_framing(version, headers)
+            if not self.keepalive_timeout:
+                keep_alive = False
+        except HTTPParseError as e:
+            logger.debug("Bad request from %r: %s", self.client_address, e)
+            self.send_error(e.status)
+            return False
+
+        on_first_read = self._send_continue if expect_continue else None
+        body = InputStream(self.rfile, length, chunked, on_first_read)
+        environ = build_environ(method, target, version, headers, body,
+                                self.client_address, self.server_address,
+                                self.multithread, self.multiprocess)
+
+        response = ResponseWriter(self.sock, version, keep_alive,
+                                  method == b'HEAD')
+        self.requests += 1
+        self.response = response
+        try:
+            response.run(self.app, environ)
+        finally:
+            self.response = None
+
+        if not response.keep_alive:
+            return False
+
+        try:
+            return body.drain()
+        except HTTPParseError:
+            return False
+
+    def _send_continue(self):
+        self.sock.sendall(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+    def send_error(self, status):
+        send_error(self.sock, status)
+
+
+_ERROR_REASONS = {
+    400: 'Bad Request',
+    414: 'Request-URI Too Long',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+    503: 'Service Unavailable',
+    505: 'HTTP Version Not Supported',
+}
+
+
+def error_response(status):
+    """
+    Build a complete, minimal, response for the given error status.
+    """
+    reason = _ERROR_REASONS.get(status, 'Error')
+    body = '{0} {1}\n'.format(status, reason).encode('ascii')
+    return b''.join([
+        'HTTP/1.1 {0} {1}\r\n'.format(status, reason).encode('ascii'),
+        b'Retry-After: 1\r\n' if status == 503 else b'',
+        b'Content-Type: text/plain\r\n',
+        b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n',
+        b'Connection: close\r\n',
+        b'Date: ' + http_date() + b'\r\n',
+        b'\r\n',
+        body,
+    ])
+
+
+def send_error(sock, status):
+    try:
+        sock.sendall(error_response(status))
+    except socket.error:
+        pass
+
+
+class ResponseWriter(object):
+    """
+    This class implements the server side of the WSGI call for a single
+    request: it provides start_response and write, and frames the response
+    body using a Content-Length, chunked encoding, or by closing the
+    connection, as appropriate.
+    """
+    def __init__(self, sock, version, keep_alive, is_head=False):
+        self.sock = sock
+        self.version = version
+        self.keep_alive = keep_alive
+        self.is_head = is_head
+
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.chunked = False
+        self.length = None
+        self.body = None
+        self.streaming = False
+        self._held = None
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info is not None:
+            try:
+                if self.headers_sent:
+                    reraise(*exc_info)
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError("start_response() called twice")
+
+        self.status = status
+        self.headers = headers
+        return self.write
+
+    def _build_head(self, body_length):
+        status_code = int(self.status.split(' ', 1)[0])
+        no_body = status_code in (204, 304) or 100 <= status_code < 200
+
+        lines = [b'HTTP/1.1 ' + _to_bytes(self.status)]
+        has_date = has_server = False
+        for name, value in self.headers:
+            lname = name.lower()
+            if lname == 'content-length':
+                self.length = int(value)
+            elif lname == 'connection':
+                if value.lower() == 'close':
+                    self.keep_alive = False
+                continue
+            elif lname == 'transfer-encoding':
+                # We decide how the body is framed ourselves.
+                continue
+            elif lname == 'date':
+                has_date = True
+            elif lname == 'server':
+                has_server = True
+            lines.append(_to_bytes(name) + b': ' + _to_bytes(value))
+
+        if self.length is None and not no_body:
+            if body_length is not None:
+                self.length = body_length
+                lines.append(b'Content-Length: ' +
+                             str(body_length).encode('ascii'))
+            elif self.is_head:
+                pass
+            elif self.version == b'HTTP/1.1':
+                self.chunked = True
+                lines.append(b'Transfer-Encoding: chunked')
+            else:
+                self.keep_alive = False
+
+        if not has_date:
+            lines.append(b'Date: ' + http_date())
+        if not has_server:
+            lines.append(b'Server: ' + SERVER_SOFTWARE.encode('ascii'))
+
+        if not self.keep_alive:
+            lines.append(b'Connection: close')
+        elif self.version == b'HTTP/1.0':
+            lines.append(b'Connection: keep-alive')
+
+        if no_body:
+            self.is_head = True
+
+        lines.append(b'\r\n')
+        return b'\r\n'.join(lines)
+
+    def _frame(self, data):
+        if self.is_head or not data:
+            return b''
+        if self.chunked:
+            return b''.join([('%x' % len(data)).encode('ascii'), b'\r\n',
+                             data, b'\r\n'])
+        return data
+
+    def write(self, data, body_length=None):
+        if self.status is None:
+            raise AssertionError("write() called before start_response()")
+
+        if self._held is not None:
+            data, self._held = self._held + data, None
+
+        if not self.headers_sent:
+            head = self._build_head(body_length)
+            self.headers_sent = True
+            self.sock.sendall(head + self._frame(data))
+        elif data:
+            self.sock.sendall(self._frame(data))
+
+    def finish(self):
+        if not self.headers_sent:
+            self.write(b'', body_length=0)
+        if self.chunked and not self.is_head:
+            self.sock.sendall(b'0\r\n\r\n')
+
+    def run(self, app, environ, detach=None):
+        """
+        Call the application and send its response.
+
+        If given, detach is a function that's called with the application's
+        result.  If it returns True, only the headers are sent, and the
+        result is returned (without being closed) so that the caller can
+        send the body itself - for example, from an event loop.
+        """
+        result = None
+        try:
+            result = app(environ, self.start_response)
+            self.body = result
+            self.streaming = getattr(result, 'streaming', False) is True
+
+            if detach is not None and detach(result):
+                self.write(b'')
+                detached, result = result, None
+                return detached
+
+            # If the whole body is known up-front, send it with the headers
+            # in a single call, and with a Content-Length.
+            if isinstance(result, (list, tuple)) and not self.headers_sent:
+                data = b''.join(result)
+                self.write(data, body_length=len(data))
+            else:
+                # We hold back the first chunk of the body until we know
+                # whether there are any more; if not, we can send it with a
+                # Content-Length instead of using chunked encoding.  This
+                # isn't done for streaming bodies, which should be sent as
+                # soon as possible.
+                hold = not self.streaming
+                for data in result:
+                    if not data:
+                        continue
+                    if hold and self._held is None and \
+                            not self.headers_sent:
+                        self._held = data
+                    else:
+                        self.write(data)
+
+                if self._held is not None:
+                    self.write(b'', body_length=len(self._held))
+
+            self.finish()
+        except socket.error:
+            self.keep_alive = False
+            raise
+        except HTTPParseError as e:
+            # The application failed reading a malformed request body.
+            logger.debug("Bad request body for %s %s: %s",
+                         environ.get('REQUEST_METHOD'),
+                         environ.get('PATH_INFO'), e)
+            self.keep_alive = False
+            if not self.headers_sent:
+                send_error(self.sock, e.status)
+        except Exception:
+            logger.exception("Error handling request %s %s",
+                             environ.get('REQUEST_METHOD'),
+                             environ.get('PATH_INFO'))
+            self.keep_alive = False
+            if not self.headers_sent:
+                send_error(self.sock, 500)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def import_app(uri):
+    """
+    Import an application given as 'module:attribute'.  The attribute
+    defaults to 'app'.
+    """
+    module_name, _, attr = uri.partition(':')
+    __import__(module_name)
+    module = sys.modules[module_name]
+    return getattr(module, attr or 'app')
+
+
+def freeze_gc(app):
+    """
+    Freeze the objects that exist once an application has been loaded, if
+    it has a GC policy that asks for it (see hoboken.gcpolicy).
+    """
+    policy = getattr(app, 'gc_policy', None)
+    if policy is not None:
+        policy.freeze()
+
+
+def get_rss():
+    """
+    Return the resident set size of this process in bytes, or None if it
+    can't be determined.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:     # pragma: no cover
+        return None
+
+    # Note that this is the peak, not the current, RSS, but is the best we
+    # can do.  It's in kilobytes on Linux and bytes on OS X.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+class Worker(object):
+    """
+    A single worker process of the PreforkServer.  It accepts and serves
+    connections one at a time until it's told to stop, or until it's served
+    enough requests (or used enough memory) that it should be recycled.
+    """
+    def __init__(self, server, listener, generation):
+        self.server = server
+        self.listener = listener
+        self.generation = generation
+        self.pid = None
+
+        self.alive = True
+        self.requests = 0
+        self.max_requests = server.max_requests
+        if self.max_requests and server.max_requests_jitter:
+            self.max_requests += random.randint(0,
+                                                server.max_requests_jitter)
+
+    def _stop(self, signum, frame):
+        self.alive = False
+
+    def _quit(self, signum, frame):
+        os._exit(0)
+
+    def _check_recycle(self):
+        if self.max_requests and self.requests >= self.max_requests:
+            logger.info("Worker %d recycling after %d requests", self.pid,
+                        self.requests)
+            self.alive = False
+            return
+
+        if self.server.max_rss:
+            rss = get_rss()
+            if rss is not None and rss > self.server.max_rss:
+                logger.info("Worker %d recycling with RSS of %d bytes",
+                            self.pid, rss)
+                self.alive = False
+
+    def _after_request(self):
+        self.requests += 1
+        self._check_recycle()
+        return self.alive
+
+    def run(self):
+        self.pid = os.getpid()
+        ppid = os.getppid()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._quit)
+        signal.signal(signal.SIGQUIT, self._quit)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        try:
+            app = self.server.load_app()
+        except Exception:
+            logger.exception("Worker %d failed to load the application",
+                             self.pid)
+            return WORKER_BOOT_ERROR
+        freeze_gc(app)
+
+        if self.listener is None:
+            self.listener = self.server.make_listener()
+        self.listener.setblocking(False)
+
+        while self.alive:
+            if os.getppid() != ppid:
+                logger.info("Master died, worker %d exiting", self.pid)
+                break
+
+            try:
+                ready = select.select([self.listener], [], [], 1.0)[0]
+                if not ready:
+                    continue
+                sock, client_address = self.listener.accept()
+            except (select.error, socket.error) as e:
+                if e.args[0] in (errno.EINTR, errno.EAGAIN,
+                                 errno.EWOULDBLOCK, errno.ECONNABORTED):
+                    continue
+                raise
+
+            self._serve(app, sock, client_address, self._after_request)
+
+        # If we own our listening socket, any connections still waiting to be
+        # accepted would be dropped when it's closed, so we accept them all
+        # before closing it, and then serve them.
+        pending = []
+        if self.server.reuse_port:
+            while True:
+                try:
+                    pending.append(self.listener.accept())
+                except socket.error:
+                    break
+
+        self.listener.close()
+        for sock, client_address in pending:
+            self._serve(app, sock, client_address, lambda: False)
+
+        # Finish any background work before the process exits.
+        if not drain_all(self.server.graceful_timeout):
+            logger.warning("Worker %d exiting with background work still "
+                           "queued", self.pid)
+        return 0
+
+    def _serve(self, app, sock, client_address, after_request):
+        sock.setblocking(True)
+        conn = HTTPConnection(app, sock, client_address,
+                              self.server.address[:2], multiprocess=True,
+                              keepalive_timeout=self.server.keepalive)
+        conn.handle(after_request)
+
+
+class PreforkServer(object):
+    """
+    A prefork HTTP/1.1 server.  The master process binds the listening
+    address, optionally imports the application, and then forks a number of
+    worker processes that serve requests.  Loading the application before
+    forking lets the workers share its memory copy-on-write.
+
+    Each worker serves one connection at a time, so keep-alive is off by
+    default: otherwise, a single idle client could hold a whole worker for
+    the keep-alive timeout.  Set keepalive to a timeout in seconds to enable
+    it, e.g. behind a proxy that reuses a small number of connections.
+
+    Where SO_REUSEPORT is available, each worker listens on its own socket,
+    and the kernel balances incoming connections between them.  Otherwise,
+    the workers all accept from a single shared socket.  Note that with
+    SO_REUSEPORT, a connection that arrives at a worker's socket just as the
+    worker exits can be reset; pass reuse_port=False if that matters more
+    than the improved balancing.
+
+    The master responds to the following signals:
+      - SIGHUP: gracefully restart the workers, reloading the application.
+      - SIGTERM: stop, letting the workers finish their current requests.
+      - SIGINT, SIGQUIT: stop immediately.
+      - SIGTTIN, SIGTTOU: increase or decrease the number of workers by one.
+    """
+    def __init__(self, app, host='127.0.0.1', port=8000, workers=None,
+                 preload=True, reuse_port=None, backlog=2048,
+                 max_requests=0, max_requests_jitter=0, max_rss=None,
+                 graceful_timeout=30, keepalive=None):
+        if isinstance(app, string_types):
+            self.app_uri = app
+            self.app = None
+        else:
+            self.app_uri = None
+            self.app = app
+
+        self.host = host
+        self.port = port
+        self.num_workers = workers or _cpu_count()
+        self.preload = preload
+        if reuse_port is None:
+            reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+
+        self.address = None
+        self.socket = None
+        self.workers = {}
+        self.generation = 0
+
+        self._signals = []
+        self._pipe = None
+        self._stopping = None
+
+    # Setup
+    # --------------------------------------------------
+    def make_listener(self, listen=True, address=None):
+        if address is None:
+            address = self.address or (self.host, self.port)
+        info = socket.getaddrinfo(address[0], address[1], 0,
+                                  socket.SOCK_STREAM)[0]
+        sock = socket.socket(info[0], socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(info[4])
+        if listen:
+            sock.listen(self.backlog)
+        return sock
+
+    def bind(self):
+        """
+        Bind the listening address.  This is done automatically by run(),
+        but can be called beforehand to find out which port was bound, if
+        the port is 0.
+        """
+        if self.socket is not None:
+            return
+
+        # If we're using SO_REUSEPORT, the master only binds its socket to
+        # reserve the address; each worker listens on its own socket.
+        self.socket = self.make_listener(listen=not self.reuse_port)
+        self.address = self.socket.getsockname()
+        logger.info("Listening on http://%s:%d", self.address[0],
+                    self.address[1])
+
+    def load_app(self):
+        if self.app is None:
+            self.app = import_app(self.app_uri)
+        return self.app
+
+    def reload_app(self):
+        if self.app_uri is None:
+            return
+        if self.preload:
+            module_name = self.app_uri.partition(':')[0]
+            _reload_module(sys.modules[module_name])
+            self.app = import_app(self.app_uri)
+            freeze_gc(self.app)
+        else:
+            self.app = None
+
+    # Signal handling
+    # --------------------------------------------------
+    def _signal(self, signum, frame):
+        self._signals.append(signum)
+        try:
+            os.write(self._pipe[1], b'.')
+        except OSError:         # pragma: no cover
+            pass
+
+    def _setup_signals(self):
+        self._pipe = os.pipe()
+        for fd in self._pipe:
+            _set_nonblocking(fd)
+
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT,
+                    signal.SIGQUIT, signal.SIGTTIN, signal.SIGTTOU,
+                    signal.SIGCHLD):
+            signal.signal(sig, self._signal)
+
+    def _sleep(self, timeout):
+        try:
+            ready = select.select([self._pipe[0]], [], [], timeout)[0]
+            if ready:
+                while os.read(self._pipe[0], 1024):
+                    pass
+        except (select.error, OSError) as e:
+            if e.args[0] not in (errno.EINTR, errno.EAGAIN):
+                raise
+
+    def _handle_signals(self):
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig == signal.SIGHUP:
+                self.restart()
+            elif sig == signal.SIGTERM:
+                self.stop(graceful=True)
+            elif sig in (signal.SIGINT, signal.SIGQUIT):
+                self.stop(graceful=False)
+            elif sig == signal.SIGTTIN:
+                self.num_workers += 1
+            elif sig == signal.SIGTTOU and self.num_workers > 1:
+                self.num_workers -= 1
+
+    # Worker management
+    # --------------------------------------------------
+    def spawn_worker(self):
+        listener = None if self.reuse_port else self.socket
+        worker = Worker(self, listener, self.generation)
+
+        pid = os.fork()
+        if pid != 0:
+            worker.pid = pid
+            self.workers[pid] = worker
+            return worker
+
+        # In the child.
+        code = 1
+        try:
+            os.close(self._pipe[0])
+            os.close(self._pipe[1])
+            if self.reuse_port:
+                self.socket.close()
+            code = worker.run()
+        except SystemExit as e:
+            code = e.code
+        except BaseException:
+            logger.exception("Unhandled exception in worker")
+        finally:
+            os._exit(code or 0)
+
+    def kill_worker(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:      # pragma: no cover
+                raise
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    break
+                raise       # pragma: no cover
+            if pid == 0:
+                break
+
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
+            if code == WORKER_BOOT_ERROR:
+                logger.error("Worker %d failed to boot, stopping", pid)
+                self.stop(graceful=False)
+            elif code != 0:
+                logger.warning("Worker %d exited with status %r", pid,
+                               status)
+
+    def manage_workers(self):
+        current = [w for w in self.workers.values()
+                   if w.generation == self.generation]
+
+        # Spawn new workers to replace any that have exited...
+        for i in range(self.num_workers - len(current)):
+            self.spawn_worker()
+
+        # ... and stop any excess ones.
+        excess = len(current) - self.num_workers
+        for w in sorted(current, key=lambda w: w.pid)[:max(excess, 0)]:
+            self.kill_worker(w.pid, signal.SIGTERM)
+            w.generation = -1
+
+    def restart(self):
+        """
+        Gracefully restart all workers: new workers are started, and then the
+        old ones are told to finish their current requests and exit.
+        """
+        logger.info("Restarting workers")
+        try:
+            self.reload_app()
+        except Exception:
+            logger.exception("Failed to reload the application, keeping "
+                             "the existing workers")
+            return
+
+        old = list(self.workers.values())
+        self.generation += 1
+        self.manage_workers()
+        for w in old:
+            self.kill_worker(w.pid, signal.SIGTERM)
+
+    def stop(self, graceful=True):
+        if self._stopping is not None:
+            graceful = False
+
+        sig = signal.SIGTERM if graceful else signal.SIGQUIT
+        timeout = self.graceful_timeout if graceful else 0
+        self._stopping = time.time() + timeout
+        for pid in list(self.workers):
+            self.kill_worker(pid, sig)
+
+    # Main loop
+    # --------------------------------------------------
+    def run(self):
+        self.bind()
+        if self.preload:
+            # Objects that exist before we fork are frozen, if the
+            # application asks for it, so the workers' collections don't
+            # touch the pages they share with us.
+            freeze_gc(self.load_app())
+
+        self._setup_signals()
+        logger.info("Master %d starting %d workers", os.getpid(),
+                    self.num_workers)
+
+        try:
+            while True:
+                if self._stopping is None:
+                    self.manage_workers()
+
+                self._sleep(1.0)
+                self._handle_signals()
+                self.reap_workers()
+
+                if self._stopping is not None:
+                    if not self.workers:
+                        break
+                    if time.time() > self._stopping:
+                        for pid in list(self.workers):
+                            self.kill_worker(pid, signal.SIGKILL)
+        finally:
+            for fd in self._pipe:
+                os.close(fd)
+            self.socket.close()
+            logger.info("Master %d stopped", os.getpid())
+
+
+class ThreadedServer(object):
+    """
+    A single-process HTTP/1.1 server that serves requests on a fixed pool of
+    worker threads.
+
+    Accepted connections are placed on a bounded queue for the workers.  If
+    the queue is full, the server is overloaded, and the connection is
+    immediately sent a 503 response and closed, rather than left waiting.
+    Between requests, idle keep-alive connections are handed back to the
+    accepting thread, which waits for them to become readable, so that they
+    don't tie up a worker thread.
+
+    Statistics on the pool and queue are available from stats().  When the
+    server stops, streaming responses are closed, and it waits up to
+    graceful_timeout seconds for the other requests in progress, and then
+    for any background work (see after_response()), to finish.
+    """
+    def __init__(self, app, host='127.0.0.1', port=8000, threads=8,
+                 queue_size=None, backlog=2048, keepalive=5.0,
+                 max_idle=1000, graceful_timeout=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_threads = threads
+        self.queue_size = threads * 4 if queue_size is None else queue_size
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.graceful_timeout = graceful_timeout
+
+        self.address = None
+        self.socket = None
+        self.queue = queue.Queue(self.queue_size)
+        self.threads = []
+
+        # Without a selector, keep-alive connections stay with a worker
+        # until they're closed.
+        self.pinned = selectors is None
+
+        self._lock = threading.Lock()
+        self._running = False
+        self._stopped = threading.Event()
+        self._returned = deque()
+        self._idle = {}
+        self._active = set()
+        self._wake = None
+
+        self.busy = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.requests = 0
+
+    def bind(self):
+        if self.socket is not None:
+            return
+
+        info = socket.getaddrinfo(self.host, self.port, 0,
+                                  socket.SOCK_STREAM)[0]
+        self.socket = socket.socket(info[0], socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(info[4])
+        self.socket.listen(self.backlog)
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+        logger.info("Listening on http://%s:%d", self.address[0],
+                    self.address[1])
+
+    def stats(self):
+        """
+        Return a dictionary of statistics about the server's current load.
+        """
+        with self._lock:
+            busy = self.busy
+        return {
+            'threads': self.num_threads,
+            'busy_threads': busy,
+            'utilization': float(busy) / self.num_threads,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue_size,
+            'idle_connections': len(self._idle),
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'requests': self.requests,
+        }
+
+    # Worker threads
+    # --------------------------------------------------
+    def _work(self):
+        while True:
+            conn = self.queue.get()
+            if conn is None:
+                break
+
+            with self._lock:
+                self.busy += 1
+                self._active.add(conn)
+            try:
+                served = conn.requests
+                if self.pinned:
+                    conn.handle()
+                    keep_alive = False
+                else:
+                    keep_alive = conn.handle_ready()
+            except Exception:
+                logger.exception("Unhandled error serving connection")
+                conn.close()
+                keep_alive = False
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                    self._active.discard(conn)
+                    self.requests += conn.requests - served
+
+            if keep_alive:
+                if self._running:
+                    self._returned.append(conn)
+                    self._wakeup()
+                else:
+                    conn.close()
+
+    def _wakeup(self):
+        try:
+            self._wake[1].send(b'.')
+        except socket.error:        # pragma: no cover
+            pass
+
+    # Accepting thread
+    # --------------------------------------------------
+    def _dispatch(self, conn):
+        try:
+            self.queue.put_nowait(conn)
+        except queue.Full:
+            self.rejected += 1
+            conn.send_error(503)
+            conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, client_address = self.socket.accept()
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                break
+
+            sock.setblocking(True)
+            self.accepted += 1
+            self._dispatch(HTTPConnection(
+                self.app, sock, client_address, self.address[:2],
+                multithread=True, keepalive_timeout=self.keepalive))
+
+    def _close_idle(self, selector, conn):
+        selector.unregister(conn.sock)
+        del self._idle[conn]
+        conn.close()
+
+    def run(self):
+        self.bind()
+        self._wake = socket.socketpair()
+        self._wake[0].setblocking(False)
+        self._running = True
+
+        for i in range(self.num_threads):
+            t = threading.Thread(target=self._work,
+                                 name='hoboken-worker-{0}'.format(i))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+        if selectors is not None:
+            selector = selectors.DefaultSelector()
+        else:                   # pragma: no cover
+            selector = _SelectSelector()
+        selector.register(self.socket, selectors_read, 'accept')
+        selector.register(self._wake[0], selectors_read, 'wake')
+
+        try:
+            while self._running:
+                for key, mask in selector.select(1.0):
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        try:
+                            while self._wake[0].recv(1024):
+                                pass
+                        except socket.error:
+                            pass
+                    else:
+                        # An idle connection has a new request.
+                        selector.unregister(key.fileobj)
+                        del self._idle[key.data]
+                        self._dispatch(key.data)
+
+                now = time.time()
+                while self._returned:
+                    conn = self._returned.popleft()
+                    self._idle[conn] = now + self.keepalive
+                    selector.register(conn.sock, selectors_read, conn)
+
+                # Close connections that have been idle for too long, or the
+                # oldest ones, if we have too many.
+                for conn, deadline in list(self._idle.items()):
+                    if deadline <= now:
+                        self._close_idle(selector, conn)
+                if len(self._idle) > self.max_idle:
+                    oldest = sorted(self._idle, key=self._idle.get)
+                    for conn in oldest[:len(self._idle) - self.max_idle]:
+                        self._close_idle(selector, conn)
+        finally:
+            self._shutdown(selector)
+
+    def _shutdown(self, selector):
+        self._running = False
+        for conn in list(self._idle):
+            self._close_idle(selector, conn)
+        selector.close()
+        self.socket.close()
+
+        # Let the workers finish the connections that are already queued.
+        # Streaming responses never finish by themselves, so they're
+        # aborted, along with everything else once the timeout expires.
+        deadline = time.time() + self.graceful_timeout
+        stopping = len(self.threads)
+        while True:
+            self._abort_connections(streaming_only=True)
+            while stopping:
+                try:
+                    self.queue.put_nowait(None)
+                except queue.Full:
+                    break
+                stopping -= 1
+
+            alive = [t for t in self.threads if t.is_alive()]
+            if not alive or time.time() >= deadline:
+                break
+            alive[0].join(0.1)
+
+        if alive:
+            logger.warning("Aborting %d connection(s) that did not finish "
+                           "in time", len(self._active))
+            self._abort_connections()
+            for t in alive:
+                t.join(1.0)
+
+        while self._returned:
+            self._returned.popleft().close()
+        for s in self._wake:
+            s.close()
+
+        if not drain_all(self.graceful_timeout):
+            logger.warning("Stopping with background work still queued")
+        self._stopped.set()
+        logger.info("Server stopped")
+
+    def _abort_connections(self, streaming_only=False):
+        with self._lock:
+            active = list(self._active)
+        for conn in active:
+            response = conn.response
+            if not streaming_only or (response is not None and
+                                      response.streaming):
+                conn.abort()
+
+    def stop(self, wait=True):
+        """
+        Stop the server.  Queued connections are served before the worker
+        threads exit.
+        """
+        self._running = False
+        if self._wake is not None:
+            self._wakeup()
+        if wait:
+            self._stopped.wait()
+
+
+if selectors is not None:
+    selectors_read = selectors.EVENT_READ
+else:                       # pragma: no cover
+    selectors_read = 1
+
+    class _SelectKey(object):
+        def __init__(self, fileobj, data):
+            self.fileobj = fileobj
+            self.data = data
+
+    class _SelectSelector(object):
+        """
+        A minimal stand-in for selectors.SelectSelector.
+        """
+        def __init__(self):
+            self.keys = {}
+
+        def register(self, fileobj, events, data=None):
+            self.keys[fileobj] = _SelectKey(fileobj, data)
+
+        def unregister(self, fileobj):
+            del self.keys[fileobj]
+
+        def select(self, timeout=None):
+            try:
+                ready = select.select(list(self.keys), [], [], timeout)[0]
+            except select.error:
+                return []
+            return [(self.keys[f], selectors_read) for f in ready]
+
+        def close(self):
+            self.keys.clear()
+
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):      # pragma: no cover
+        return 1
+
+
+def _set_nonblocking(fd):
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def serve(app, host='127.0.0.1', port=8000, threads=None, **kwargs):
+    """
+    Serve a WSGI application (or an application given as 'module:attribute')
+    with a prefork server.  Any additional keyword arguments are passed to
+    PreforkServer.  If threads is given, the application is instead served
+    from a single process by a ThreadedServer with that many threads.  This
+    blocks until the server is stopped.
+    """
+    if threads is not None:
+        if isinstance(app, string_types):
+            app = import_app(app)
+        server = ThreadedServer(app, host=host, port=port, threads=threads,
+                                **kwargs)
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            logger.info("Stopping due to keyboard interrupt")
+        return
+
+    server = PreforkServer(app, host=host, port=port, **kwargs)
+    server.run()
@@ -0,0 +1,305 @@
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import mmap
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:         # pragma: no cover
+    import pickle
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import text_type
+from hoboken.cache import BaseCache, _time
+
+
+logger = logging.getLogger(__name__)
+
+
+# Each slot starts with a fixed-size header:
+#   - seq:      a sequence number, which is odd while the slot is being
+#               written (i.e. a seqlock)
+#   - ref:      the clock reference bit, set whenever the slot is read
+#   - used:     whether the slot holds a value
+#   - key hash: a 128-bit hash of the key
+#   - expires:  the time the value expires at, or 0 for never
+#   - length:   the length of the (pickled) value that follows
+SLOT_HEADER = struct.Struct('<IBB2x16sdI')
+SEQ = struct.Struct('<I')
+HAND = struct.Struct('<I')
+
+# The offsets of fields within a slot header.
+REF_OFFSET = 4
+
+# How many times a reader retries a slot that's being concurrently written
+# before giving up and treating it as a miss.
+READ_RETRIES = 16
+
+
+def _hash_key(key):
+    if isinstance(key, text_type):
+        key = key.encode('utf-8')
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(key, digest_size=16).digest()
+    return hashlib.md5(key).digest()        # pragma: no cover
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    A cache that stores values in a memory-mapped region that's shared
+    between processes.  If the cache is created before a prefork server forks
+    its workers, every worker will share the same entries, without needing an
+    external cache service.
+
+    The region is divided into buckets of a fixed number of slots, each of a
+    fixed size.  A key is hashed to a single bucket, and can be stored in any
+    slot within it; when the bucket is full, a slot is evicted using the CLOCK
+    algorithm (an approximation of LRU).  Values that don't fit in a slot,
+    once pickled, are not stored.
+
+    Readers never lock - each slot is protected by a seqlock, and reads are
+    retried if they overlap with a write.  Writers to a bucket are serialized
+    with a byte-range lock on the backing file (between processes) and a
+    thread lock (within a process).
+    """
+    def __init__(self, slots=4096, slot_size=4096, ways=8, path=None):
+        if slots % ways != 0:
+            raise ValueError("The number of slots must be a multiple of the "
+                             "number of ways")
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError("The slot size must be larger than "
+                             "{0} bytes".format(SLOT_HEADER.size))
+
+        self.slot_size = slot_size
+        self.ways = ways
+        self.buckets = slots // ways
+        self.max_value_size = slot_size - SLOT_HEADER.size
+
+        # The region starts with the clock hand for each bucket, followed by
+        # the slots themselves.
+        self._slots_offset = HAND.size * self.buckets
+        self.size = self._slots_offset + slots * slot_size
+
+        # We map a file, rather than anonymous memory, since we need a file
+        # descriptor for locking.  By default, this is an unlinked temporary
+        # file that's inherited by forked children.
+        if path is None:
+            self._file = tempfile.TemporaryFile()
+        else:
+            self._file = open(path, 'a+b')
+        self._fd = self._file.fileno()
+        if os.fstat(self._fd).st_size < self.size:
+            os.ftruncate(self._fd, self.size)
+
+        self._map = mmap.mmap(self._fd, self.size, mmap.MAP_SHARED,
+                              mmap.PROT_READ | mmap.PROT_WRITE)
+        self._lock = threading.Lock()
+
+        # These are per-process statistics.
+        self.hits = 0
+        self.misses = 0
+
+    # Low-level slot access
+    # --------------------------------------------------
+    def _bucket(self, key_hash):
+        return struct.unpack_from('<Q', key_hash)[0] % self.buckets
+
+    def _slot_offset(self, bucket, way):
+        index = bucket * self.ways + way
+        return self._slots_offset + index * self.slot_size
+
+    def _read_slot(self, offset):
+        """
+        Read a consistent copy of a slot's header and value, retrying if
+        there's a concurrent write.  Returns None if we can't get one.
+        """
+        m = self._map
+        for i in range(READ_RETRIES):
+            seq = SEQ.unpack_from(m, offset)[0]
+            if seq & 1:
+                continue
+
+            header = SLOT_HEADER.unpack_from(m, offset)
+            length = min(header[5], self.max_value_size)
+            start = offset + SLOT_HEADER.size
+            data = m[start:start + length]
+
+            if SEQ.unpack_from(m, offset)[0] == seq:
+                return header, data
+
+        return None
+
+    def _write_slot(self, offset, key_hash, expires, data, used=True):
+        m = self._map
+        seq = SEQ.unpack_from(m, offset)[0]
+
+        # Mark the slot as being written, write it, and then mark it as
+        # complete again.
+        SEQ.pack_into(m, offset, seq + 1)
+        SLOT_HEADER.pack_into(m, offset, seq + 1, 1 if used else 0,
+                              1 if used else 0, key_hash, expires,
+                              len(data))
+        start = offset + SLOT_HEADER.size
+        m[start:start + len(data)] = data
+        SEQ.pack_into(m, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def _lock_bucket(self, bucket):
+        self._lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, bucket)
+        except:
+            self._lock.release()
+            raise
+
+    def _unlock_bucket(self, bucket):
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, bucket)
+        finally:
+            self._lock.release()
+
+    def _find(self, bucket, key_hash):
+        """
+        Find the slot holding the given key.  Returns a tuple of (offset,
+        header, data), or None if the key isn't in this bucket.
+        """
+        for way in range(self.ways):
+            offset = self._slot_offset(bucket, way)
+            slot = self._read_slot(offset)
+            if slot is None:
+                continue
+
+            header, data = slot
+            if header[2] and header[3] == key_hash:
+                return offset, header, data
+
+        return None
+
+    def _victim(self, bucket, now):
+        """
+        Choose a slot to write a new value into, using the bucket's clock
+        hand.  Must be called with the bucket locked.
+        """
+        m = self._map
+        hand_offset = bucket * HAND.size
+        hand = HAND.unpack_from(m, hand_offset)[0] % self.ways
+
+        # Empty and expired slots are used first.
+        for way in range(self.ways):
+            offset = self._slot_offset(bucket, way)
+            header = SLOT_HEADER.unpack_from(m, offset)
+            if not header[2] or (header[4] and header[4] <= now):
+                return offset
+
+        # Otherwise, we sweep the clock hand around the bucket, giving each
+        # recently-read slot a second chance.
+        for i in range(self.ways * 2):
+            offset = self._slot_offset(bucket, hand)
+            hand = (hand + 1) % self.ways
+            if m[offset + REF_OFFSET:offset + REF_OFFSET + 1] == b'\x00':
+                break
+            m[offset + REF_OFFSET:offset + REF_OFFSET + 1] = b'\x00'
+
+        HAND.pack_into(m, hand_offset, hand)
+        return offset
+
+    # Cache interface
+    # --------------------------------------------------
+    def get(self, key):
+        key_hash = _hash_key(key)
+        found = self._find(self._bucket(key_hash), key_hash)
+        if found is not None:
+            offset, header, data = found
+            expires = header[4]
+            if not expires or expires > _time():
+                # Mark the slot as recently used.  This isn't protected by the
+                # seqlock, since it's only ever a hint.
+                self._map[offset + REF_OFFSET:offset + REF_OFFSET + 1] = \
+                    b'\x01'
+                try:
+                    value = pickle.loads(data)
+                except Exception:
+                    logger.exception("Unable to unpickle cached value")
+                else:
+                    self.hits += 1
+                    return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value, timeout=None):
+        """
+        Store a value in the cache.  Returns False if the value is too large
+        to be stored.
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_value_size:
+            logger.debug("Value for %r is too large to cache (%d bytes)",
+                         key, len(data))
+            return False
+
+        now = _time()
+        expires = 0.0 if timeout is None else now + timeout
+        key_hash = _hash_key(key)
+        bucket = self._bucket(key_hash)
+
+        self._lock_bucket(bucket)
+        try:
+            found = self._find(bucket, key_hash)
+            if found is not None:
+                offset = found[0]
+            else:
+                offset = self._victim(bucket, now)
+            self._write_slot(offset, key_hash, expires, data)
+        finally:
+            self._unlock_bucket(bucket)
+
+        return True
+
+    def delete(self, key):
+        key_hash = _hash_key(key)
+        bucket = self._bucket(key_hash)
+
+        self._lock_bucket(bucket)
+        try:
+            found = self._find(bucket, key_hash)
+            if found is not None:
+                self._write_slot(found[0], b'\x00' * 16, 0.0, b'',
+                                 used=False)
+        finally:
+            self._unlock_bucket(bucket)
+
+    def clear(self):
+        for bucket in range(self.buckets):
+            self._lock_bucket(bucket)
+            try:
+                for way in range(self.ways):
+                    offset = self._slot_offset(bucket, way)
+                    self._write_slot(offset, b'\x00' * 16, 0.0, b'',
+                                     used=False)
+            finally:
+                self._unlock_bucket(bucket)
+
+    def __len__(self):
+        count = 0
+        for bucket in range(self.buckets):
+            for way in range(self.ways):
+                offset = self._slot_offset(bucket, way)
+                if SLOT_HEADER.unpack_from(self._map, offset)[2]:
+                    count += 1
+        return count
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __repr__(self):
+        return ("SharedMemoryCache(buckets={0}, ways={1}, "
+                "slot_size={2})".format(self.buckets, self.ways,
+                                        self.slot_size))
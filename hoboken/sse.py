@@ -0,0 +1,300 @@
+from __future__ import with_statement, absolute_import, print_function
+
+import logging
+from collections import deque
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import binary_type, text_type, advance_iterator
+
+
+logger = logging.getLogger(__name__)
+
+# A comment line, which is ignored by clients, but keeps the connection (and
+# any proxies in between) from timing out.
+HEARTBEAT = b':\n\n'
+
+
+def encode_event(data=None, event=None, id=None, retry=None):
+    """
+    Encode a single Server-Sent Event in the wire format.  Multi-line data
+    is split over several 'data' fields, as required by the format.  The id
+    and event name can't be split, so a line break in either of them is a
+    ValueError.
+    """
+    lines = []
+    if id is not None:
+        lines.append(b'id: ' + _field(id, 'id'))
+    if event is not None:
+        lines.append(b'event: ' + _field(event, 'event'))
+    if retry is not None:
+        lines.append(b'retry: ' + str(int(retry)).encode('ascii'))
+    if data is not None:
+        for line in _to_bytes(data).splitlines() or [b'']:
+            lines.append(b'data: ' + line)
+
+    lines.append(b'\n')
+    return b'\n'.join(lines)
+
+
+def _field(value, name):
+    value = _to_bytes(value)
+    if b'\r' in value or b'\n' in value:
+        raise ValueError("The event {0} can't contain a line "
+                         "break: {1!r}".format(name, value))
+    return value
+
+
+def _to_bytes(value):
+    if isinstance(value, binary_type):
+        return value
+    if not isinstance(value, text_type):
+        value = text_type(value)
+    return value.encode('utf-8')
+
+
+class Event(object):
+    """
+    A single event, which is encoded once, when it's created.
+    """
+    __slots__ = ('data', 'event', 'id', 'encoded')
+
+    def __init__(self, data=None, event=None, id=None, retry=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.encoded = encode_event(data, event, id, retry)
+
+    def __repr__(self):
+        return "Event(event={0!r}, id={1!r})".format(self.event, self.id)
+
+
+class Subscription(object):
+    """
+    A subscriber's queue of encoded events.  The queue is bounded: if a
+    subscriber falls behind, the oldest events are dropped to make room for
+    new ones, and counted in the 'dropped' attribute.
+    """
+    def __init__(self, broker, topics, max_queue=100):
+        self.broker = broker
+        self.topics = tuple(topics)
+        self.queue = deque(maxlen=max_queue)
+        self.dropped = 0
+        self.closed = False
+
+        self._cond = threading.Condition()
+        self._notify = None
+
+    def put(self, encoded):
+        with self._cond:
+            if self.closed:
+                return
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(encoded)
+            self._cond.notify()
+            notify = self._notify
+
+        if notify is not None:
+            notify()
+
+    def get(self, timeout=None):
+        """
+        Wait for, and return, the next encoded event.  Returns None if the
+        timeout expires, or the subscription is closed.
+        """
+        with self._cond:
+            if not self.queue and not self.closed:
+                self._cond.wait(timeout)
+            if self.queue:
+                return self.queue.popleft()
+            return None
+
+    def get_nowait(self):
+        with self._cond:
+            if self.queue:
+                return self.queue.popleft()
+            return None
+
+    def set_notify(self, callback):
+        """
+        Set a function that's called, from the publishing thread, whenever an
+        event is added to the queue (or the subscription is closed).  This
+        lets an event loop wait for events without blocking a thread.
+        """
+        with self._cond:
+            self._notify = callback
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+            notify = self._notify
+
+        self.broker.unsubscribe(self)
+        if notify is not None:
+            notify()
+
+    def __repr__(self):
+        return "Subscription(topics={0!r}, queued={1}, dropped={2})".format(
+            self.topics, len(self.queue), self.dropped)
+
+
+class Broker(object):
+    """
+    An in-process publish/subscribe broker.  Publishing an event encodes it
+    once, and then adds the same bytes to every subscriber's queue.
+    """
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._topics = {}
+        self.published = 0
+
+    def subscribe(self, *topics, **kwargs):
+        max_queue = kwargs.get('max_queue', self.max_queue)
+        sub = Subscription(self, topics, max_queue=max_queue)
+        with self._lock:
+            for topic in topics:
+                self._topics.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._topics.get(topic)
+                if subs is None:
+                    continue
+                subs.discard(sub)
+                if not subs:
+                    del self._topics[topic]
+
+    def publish(self, topic, data=None, event=None, id=None, retry=None):
+        """
+        Publish an event to all subscribers of a topic.  The data may also be
+        an Event instance.  Returns the number of subscribers the event was
+        delivered to.
+        """
+        if isinstance(data, Event):
+            encoded = data.encoded
+        else:
+            encoded = encode_event(data, event, id, retry)
+
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+            self.published += 1
+
+        for sub in subs:
+            sub.put(encoded)
+        return len(subs)
+
+    def subscribers(self, topic=None):
+        with self._lock:
+            if topic is not None:
+                return len(self._topics.get(topic, ()))
+            return len(set().union(*self._topics.values()))
+
+    def stats(self):
+        with self._lock:
+            subs = set().union(*self._topics.values())
+            return {
+                'topics': len(self._topics),
+                'subscribers': len(subs),
+                'published': self.published,
+                'dropped': sum(s.dropped for s in subs),
+            }
+
+
+class EventStream(object):
+    """
+    A WSGI response body that streams Server-Sent Events.  The source can be
+    a Subscription, in which case a heartbeat comment is sent whenever no
+    event has been sent for the heartbeat interval, or any iterable of
+    Events, bytes or text.
+
+    Iterating over the stream blocks while waiting for events, which suits
+    threaded servers.  Event loop servers can instead use set_notify() to be
+    told when events are available, and poll() to fetch them.
+    """
+    # This marks the body as unbounded, so it's never buffered.
+    streaming = True
+
+    def __init__(self, source, heartbeat=15.0, retry=None):
+        self.source = source
+        self.heartbeat = heartbeat
+        self.is_subscription = isinstance(source, Subscription)
+        if not self.is_subscription:
+            self._iter = iter(source)
+
+        # We start with something to make sure the response is sent to the
+        # client straight away.
+        if retry is not None:
+            self._preamble = encode_event(retry=retry)
+        else:
+            self._preamble = HEARTBEAT
+
+    def _encode(self, item):
+        if isinstance(item, Event):
+            return item.encoded
+        if isinstance(item, binary_type):
+            return item
+        return encode_event(item)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._preamble is not None:
+            data, self._preamble = self._preamble, None
+            return data
+
+        if not self.is_subscription:
+            return self._encode(advance_iterator(self._iter))
+
+        data = self.source.get(timeout=self.heartbeat)
+        if data is not None:
+            return data
+        if self.source.closed:
+            raise StopIteration()
+        return HEARTBEAT
+
+    next = __next__
+
+    def poll(self):
+        """
+        Return the next chunk of the stream if one is ready, or None if not.
+        Raises StopIteration when the stream has ended.  This never blocks,
+        and is only supported for streams from a Subscription.
+        """
+        if self._preamble is not None:
+            data, self._preamble = self._preamble, None
+            return data
+
+        data = self.source.get_nowait()
+        if data is None and self.source.closed:
+            raise StopIteration()
+        return data
+
+    @property
+    def pollable(self):
+        return self.is_subscription
+
+    def idle(self):
+        """
+        Return the data to send when nothing has been sent for the heartbeat
+        interval.
+        """
+        return HEARTBEAT
+
+    def set_notify(self, callback):
+        self.source.set_notify(callback)
+
+    def close(self):
+        if self.is_subscription:
+            self.source.close()
+        elif hasattr(self._iter, 'close'):
+            self._iter.close()
@@ -76,6 +76,21 @@ def suite():
     from .test_routing import suite as suite_7
     from .test_request_response import suite as suite_8
     from .test_ext import suite as suite_9
+    from .test_cache import suite as suite_10
+    from .test_serving import suite as suite_11
+    from .test_aioserving import suite as suite_12
+    from .test_sse import suite as suite_13
+    from .test_pool import suite as suite_14
+    from .test_timing import suite as suite_15
+    from .test_metrics import suite as suite_16
+    from .test_profiling import suite as suite_17
+    from .test_watchdog import suite as suite_18
+    from .test_allocations import suite as suite_19
+    from .test_tracing import suite as suite_20
+    from .test_introspection import suite as suite_21
+    from .test_capture import suite as suite_22
+    from .test_load import suite as suite_23
+    from .test_gcpolicy import suite as suite_24
 
     from .objects import suite as suite_objects
 
@@ -89,6 +104,21 @@ def suite():
     suite.addTest(suite_7())
     suite.addTest(suite_8())
     suite.addTest(suite_9())
+    suite.addTest(suite_10())
+    suite.addTest(suite_11())
+    suite.addTest(suite_12())
+    suite.addTest(suite_13())
+    suite.addTest(suite_14())
+    suite.addTest(suite_15())
+    suite.addTest(suite_16())
+    suite.addTest(suite_17())
+    suite.addTest(suite_18())
+    suite.addTest(suite_19())
+    suite.addTest(suite_20())
+    suite.addTest(suite_21())
+    suite.addTest(suite_22())
+    suite.addTest(suite_23())
+    suite.addTest(suite_24())
 
     suite.addTest(suite_objects())
 
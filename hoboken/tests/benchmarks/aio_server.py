@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import socket
+import threading
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench import Benchmark
+from hoboken import HobokenApplication
+from hoboken.aioserving import AsyncServer
+
+
+app = HobokenApplication('aio_benchmark')
+
+
+@app.get('/')
+def index():
+    return 'Hello world'
+
+
+def raise_file_limit(wanted):
+    try:
+        import resource
+    except ImportError:         # pragma: no cover
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+class WSGIRefBenchmark(Benchmark):
+    """
+    Serve requests from a number of concurrent clients with the wsgiref
+    server used by test_server.
+    """
+    CLIENTS = 8
+    REQUESTS_PER_CLIENT = 500
+    IDLE_CONNECTIONS = 0
+
+    def setUp(self):
+        from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app,
+                                  handler_class=QuietHandler)
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.errors = 0
+        self.open_idle_connections()
+
+    def tearDown(self):
+        self.close_idle_connections()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def open_idle_connections(self):
+        raise_file_limit(self.IDLE_CONNECTIONS * 2 + 1024)
+        self.idle = [socket.create_connection(self.address)
+                     for i in range(self.IDLE_CONNECTIONS)]
+
+    def close_idle_connections(self):
+        for sock in self.idle:
+            sock.close()
+
+    def client(self):
+        request = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        sock = f = None
+        try:
+            for i in range(self.REQUESTS_PER_CLIENT):
+                if sock is None:
+                    sock = socket.create_connection(self.address)
+                    f = sock.makefile('rb')
+
+                sock.sendall(request)
+                status, keep_alive = self.read_response(f)
+                if b' 200 ' not in status:
+                    self.errors += 1
+
+                if not keep_alive:
+                    f.close()
+                    sock.close()
+                    sock = f = None
+        except socket.error:
+            self.errors += 1
+        finally:
+            if sock is not None:
+                f.close()
+                sock.close()
+
+    def read_response(self, f):
+        """
+        Read a response, returning the status line and whether the connection
+        can be reused.
+        """
+        status = f.readline()
+        keep_alive = status.startswith(b'HTTP/1.1')
+        length = None
+        chunked = False
+        while True:
+            line = f.readline().lower()
+            if line in (b'\r\n', b''):
+                break
+            if line.startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+            elif line.startswith(b'transfer-encoding:'):
+                chunked = b'chunked' in line
+            elif line.startswith(b'connection:'):
+                keep_alive = b'close' not in line
+
+        if chunked:
+            while True:
+                size = int(f.readline().strip(), 16)
+                f.read(size + 2)
+                if size == 0:
+                    break
+        elif length is not None:
+            f.read(length)
+        else:
+            f.read()
+            keep_alive = False
+
+        return status, keep_alive
+
+    def bench(self):
+        threads = [threading.Thread(target=self.client)
+                   for i in range(self.CLIENTS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def more_info(self, time_taken):
+        seconds = time_taken.seconds + time_taken.microseconds / 1000000.0
+        total = self.CLIENTS * self.REQUESTS_PER_CLIENT
+
+        return {
+            "Clients": self.CLIENTS,
+            "Idle Connections": self.IDLE_CONNECTIONS,
+            "Total Requests": total,
+            "Errors": self.errors,
+            "Requests/sec": "%.1f" % (total / seconds),
+        }
+
+
+class AsyncServerBenchmark(WSGIRefBenchmark):
+    """
+    Serve the same load with the event loop server.
+    """
+    def setUp(self):
+        self.server = AsyncServer(app, port=0, threads=self.CLIENTS)
+        self.server.bind()
+        self.address = self.server.address
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+        self.errors = 0
+        self.open_idle_connections()
+
+    def tearDown(self):
+        self.close_idle_connections()
+        self.server.stop()
+        self.thread.join()
+
+
+class AsyncServerIdleBenchmark(AsyncServerBenchmark):
+    """
+    Serve the same load while holding thousands of idle keep-alive
+    connections open.
+    """
+    IDLE_CONNECTIONS = 5000
+
+
+if __name__ == "__main__":
+    WSGIRefBenchmark().run()
+    AsyncServerBenchmark().run()
+    AsyncServerIdleBenchmark().run()
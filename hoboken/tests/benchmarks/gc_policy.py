@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import gc
+import sys
+import json
+from collections import deque
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench import Benchmark
+from hoboken import HobokenApplication
+from hoboken.gcpolicy import gc_pauses
+from hoboken.load import LoadGenerator, RequestTemplate, integers
+from hoboken.replay import LoadReport
+from hoboken.timing import clock
+
+
+# A large, long-lived heap, like the modules, caches and configuration of a
+# real application, which every full collection has to scan.
+HEAP = [{'id': i, 'tags': [i, str(i)]} for i in range(300000)]
+
+
+def make_app(**config):
+    app = HobokenApplication('gc_policy')
+    app.config.update(config)
+
+    # Some of each request's objects are kept for a while, so they survive
+    # into the older generations.
+    recent = deque(maxlen=200)
+
+    @app.get('/orders/:id')
+    def order(id):
+        order = {'id': id, 'items': []}
+        for i in range(300):
+            # Each item refers back to its order, so they form cycles.
+            item = {'order': order, 'n': i, 'tags': [i, i + 1]}
+            order['items'].append(item)
+        recent.append(order)
+        return json.dumps({'id': int(id), 'items': len(order['items'])})
+
+    return app
+
+
+class DefaultGCBenchmark(Benchmark):
+    """
+    Send allocation-heavy requests, one at a time (as a prefork worker
+    serves them), with the collector's default behaviour.  A request's
+    latency is measured until its body has been read - i.e. until a server
+    would have sent the response - so a collection deferred until after
+    that isn't counted.  Its total time also includes closing the body,
+    which is when deferred collections run, so the total throughput shows
+    what deferring costs the worker.
+    """
+    REQUESTS = 5000
+    CONFIG = {}
+
+    def setUp(self):
+        self.thresholds = gc.get_threshold()
+        self.app = make_app(**self.CONFIG)
+        self.generator = LoadGenerator([
+            RequestTemplate('/orders/{id}', params={'id': integers(1, 1000)}),
+        ], seed=1)
+
+        gc.collect()
+        gc_pauses.install()
+        self.collections = sum(gc_pauses.collections)
+        self.paused = sum(gc_pauses.total)
+
+    def send(self, environ):
+        captured = []
+
+        def start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers]
+
+        # The body is a single chunk, which a server would send before
+        # asking for the next one.
+        start = clock()
+        body = self.app(environ, start_response)
+        it = iter(body)
+        next(it)
+        latency = clock() - start
+
+        for chunk in it:
+            pass
+        if hasattr(body, 'close'):
+            body.close()
+        return latency, clock() - start, int(captured[0][:3])
+
+    def bench(self):
+        self.report = report = LoadReport()
+        self.totals = totals = LoadReport()
+        report.start()
+        totals.start()
+        for environ in self.generator.environs(self.REQUESTS):
+            latency, total, status = self.send(environ)
+            report.record(latency, status)
+            totals.record(total, status)
+        report.finish()
+        totals.finish()
+
+    def tearDown(self):
+        self.collections = sum(gc_pauses.collections) - self.collections
+        self.paused = sum(gc_pauses.total) - self.paused
+        self.app.gc_policy.restore()
+        gc.set_threshold(*self.thresholds)
+
+    def more_info(self, time_taken):
+        summary = self.report.summary()
+        percentiles = summary['percentiles']
+        totals = self.totals.summary()
+        return {
+            "Requests": summary['requests'],
+            "Errors": sum(summary['errors'].values()),
+            "p50 Latency": "%.3fms" % (percentiles[50] * 1000),
+            "p99 Latency": "%.3fms" % (percentiles[99] * 1000),
+            "Max Latency": "%.3fms" % (summary['max'] * 1000),
+            "p99 Total": "%.3fms" % (totals['percentiles'][99] * 1000),
+            "Max Total": "%.3fms" % (totals['max'] * 1000),
+            "Total Time": "%.3fs" % totals['elapsed'],
+            "Throughput": "%.1f req/s" % totals['throughput'],
+            "Collections": self.collections,
+            "GC Pauses": "%.3fs" % self.paused,
+        }
+
+
+class FreezeOnlyBenchmark(DefaultGCBenchmark):
+    """
+    The same requests, with the heap frozen, so full collections don't
+    scan it.
+    """
+    CONFIG = {'GC_FREEZE': True}
+
+
+class DeferOnlyBenchmark(DefaultGCBenchmark):
+    """
+    The same requests, with collections deferred until each response has
+    been sent.
+    """
+    CONFIG = {'GC_DEFER': True}
+
+
+class GCPolicyBenchmark(DefaultGCBenchmark):
+    """
+    The same requests, with the heap frozen and collections deferred until
+    each response has been sent.
+    """
+    CONFIG = {'GC_FREEZE': True, 'GC_DEFER': True}
+
+
+if __name__ == "__main__":
+    DefaultGCBenchmark().run()
+    FreezeOnlyBenchmark().run()
+    DeferOnlyBenchmark().run()
+    GCPolicyBenchmark().run()
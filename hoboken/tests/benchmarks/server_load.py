@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+from __future__ import print_function
+import os
+import sys
+import time
+import signal
+import socket
+import threading
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from bench import Benchmark
+from hoboken import HobokenApplication
+from hoboken.load import RequestTemplate, run
+from hoboken.serving import PreforkServer, ThreadedServer
+
+
+app = HobokenApplication('load_test')
+
+
+@app.get('/')
+def index():
+    return 'Hello world'
+
+
+def read_response(f):
+    """
+    Read a response from the given file, returning the status line.
+    """
+    length = None
+    chunked = False
+    status = f.readline()
+    while True:
+        line = f.readline().lower()
+        if line == b'\r\n':
+            break
+        if line.startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+        elif line.startswith(b'transfer-encoding:'):
+            chunked = b'chunked' in line
+
+    if not chunked:
+        f.read(length)
+        return status
+
+    while True:
+        size = int(f.readline().strip(), 16)
+        f.read(size + 2)
+        if size == 0:
+            return status
+
+
+class PreforkServerBenchmark(Benchmark):
+    """
+    Run a prefork server on localhost, and hammer it with a number of
+    concurrent keep-alive clients.
+    """
+    WORKERS = 4
+    CLIENTS = 16
+    REQUESTS_PER_CLIENT = 2000
+
+    def setUp(self):
+        server = PreforkServer(app, port=0, workers=self.WORKERS)
+        server.bind()
+
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                server.run()
+            finally:
+                os._exit(0)
+
+        server.socket.close()
+        self.port = server.address[1]
+        self.errors = 0
+
+        # Wait for the workers to start listening.
+        for i in range(50):
+            try:
+                socket.create_connection(('127.0.0.1', self.port)).close()
+                break
+            except socket.error:
+                time.sleep(0.1)
+
+    def client(self):
+        request = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        f = sock.makefile('rb')
+        try:
+            for i in range(self.REQUESTS_PER_CLIENT):
+                sock.sendall(request)
+
+                if not read_response(f).startswith(b'HTTP/1.1 200'):
+                    self.errors += 1
+        except socket.error:
+            self.errors += 1
+        finally:
+            f.close()
+            sock.close()
+
+    def bench(self):
+        threads = [threading.Thread(target=self.client)
+                   for i in range(self.CLIENTS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def tearDown(self):
+        os.kill(self.pid, signal.SIGTERM)
+        os.waitpid(self.pid, 0)
+
+    def more_info(self, time_taken):
+        seconds = time_taken.seconds + time_taken.microseconds / 1000000.0
+        total = self.CLIENTS * self.REQUESTS_PER_CLIENT
+
+        return {
+            "Workers": self.WORKERS,
+            "Clients": self.CLIENTS,
+            "Total Requests": total,
+            "Errors": self.errors,
+            "Requests/sec": "%.1f" % (total / seconds),
+        }
+
+
+class ThreadedServerBenchmark(PreforkServerBenchmark):
+    """
+    Run the same load against a single-process, thread-pool server.
+    """
+    THREADS = 16
+
+    def setUp(self):
+        self.server = ThreadedServer(app, port=0, threads=self.THREADS,
+                                     queue_size=self.CLIENTS)
+        self.server.bind()
+        self.port = self.server.address[1]
+        self.errors = 0
+
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+
+    def tearDown(self):
+        self.stats = self.server.stats()
+        self.server.stop()
+        self.thread.join()
+
+    def more_info(self, time_taken):
+        info = super(ThreadedServerBenchmark, self).more_info(time_taken)
+        del info["Workers"]
+        info["Threads"] = self.THREADS
+        info["Rejected"] = self.stats['rejected']
+        return info
+
+
+class InProcessBenchmark(PreforkServerBenchmark):
+    """
+    Send the same requests straight to the application, with no server or
+    sockets, to show how much of the time above is the framework's.
+    """
+    def setUp(self):
+        self.templates = [RequestTemplate('/')]
+
+    def bench(self):
+        self.report = run(app, self.templates,
+                          requests=self.CLIENTS * self.REQUESTS_PER_CLIENT,
+                          threads=self.CLIENTS)
+
+    def tearDown(self):
+        pass
+
+    def more_info(self, time_taken):
+        summary = self.report.summary()
+        return {
+            "Threads": self.CLIENTS,
+            "Total Requests": summary['requests'],
+            "Errors": sum(summary['errors'].values()),
+            "Requests/sec": "%.1f" % summary['throughput'],
+            "p99 Latency": "%.3fms" % (summary['percentiles'][99] * 1000),
+        }
+
+
+if __name__ == "__main__":
+    PreforkServerBenchmark().run()
+    ThreadedServerBenchmark().run()
+    InProcessBenchmark().run()
@@ -23,6 +23,7 @@ def suite():
     from .test_mixins_request_building import suite as suite_11
     from .test_mixins_response_body import suite as suite_12
     from .test_mixins_user_agent import suite as suite_13
+    from .test_mixins_deadline import suite as suite_14
 
     suite = unittest.TestSuite()
     suite.addTest(suite_1())
@@ -38,6 +39,7 @@ def suite():
     suite.addTest(suite_11())
     suite.addTest(suite_12())
     suite.addTest(suite_13())
+    suite.addTest(suite_14())
 
     return suite
 
@@ -156,7 +156,7 @@ class TestWSGIResponseCacheMixin(unittest.TestCase):
     BOOLEAN_PROPS = ['public', 'no_store', 'no_transform',
                      'must_revalidate', 'proxy_revalidate']
     VALUE_PROPS = ['no_cache', 'private', 'max_age', 's_max_age',
-                   's_maxage']
+                   's_maxage', 'stale_while_revalidate', 'stale_if_error']
 
     def setUp(self):
         self.r = WSGIResponseCacheMixin()
@@ -261,6 +261,62 @@ class TestPragmaNoCacheMixin(unittest.TestCase):
         self.assertEqual(self.calls, 1)
 
 
+class TestNoteVary(unittest.TestCase):
+    def test_does_nothing_without_tracking(self):
+        class Obj(object):
+            pass
+
+        note_vary(Obj(), b'Accept')
+
+    def test_records_header(self):
+        r = WSGIRequestVaryMixin()
+        self.assertIsNone(r.varied_headers)
+
+        r.track_vary()
+        note_vary(r, b'Accept')
+        note_vary(r, u'User-Agent')
+        self.assertEqual(r.varied_headers, set([b'Accept', b'User-Agent']))
+
+
+class TestWSGIResponseVaryMixin(unittest.TestCase):
+    def setUp(self):
+        self.r = WSGIResponseVaryMixin()
+        self.r.headers = {}
+
+    def test_default(self):
+        self.assertIsNone(self.r.vary)
+
+    def test_parse(self):
+        self.r.headers['Vary'] = b'Accept,  Cookie ,'
+        self.assertEqual(self.r.vary, (b'Accept', b'Cookie'))
+
+    def test_set(self):
+        self.r.vary = [b'Accept', u'Cookie']
+        self.assertEqual(self.r.headers['Vary'], b'Accept, Cookie')
+
+        self.r.vary = b'User-Agent'
+        self.assertEqual(self.r.vary, (b'User-Agent',))
+
+    def test_delete(self):
+        self.r.vary = b'Accept'
+        del self.r.vary
+        self.assertIsNone(self.r.vary)
+
+        self.r.vary = b'Accept'
+        self.r.vary = None
+        self.assertNotIn('Vary', self.r.headers)
+
+    def test_add_vary(self):
+        self.r.add_vary(b'Accept')
+        self.r.add_vary(b'accept', b'Cookie')
+        self.assertEqual(self.r.vary, (b'Accept', b'Cookie'))
+
+    def test_add_vary_with_wildcard(self):
+        self.r.vary = b'*'
+        self.r.add_vary(b'Accept')
+        self.assertEqual(self.r.vary, (b'*',))
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestBooleanProperty))
@@ -270,5 +326,7 @@ def suite():
     suite.addTest(unittest.makeSuite(TestWSGIResponseCacheMixin))
     suite.addTest(unittest.makeSuite(TestWSGIResponseOtherCachesMixin))
     suite.addTest(unittest.makeSuite(TestPragmaNoCacheMixin))
+    suite.addTest(unittest.makeSuite(TestNoteVary))
+    suite.addTest(unittest.makeSuite(TestWSGIResponseVaryMixin))
 
     return suite
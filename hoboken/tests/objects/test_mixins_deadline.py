@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from hoboken.tests.compat import unittest
+from mock import patch
+
+from hoboken.exceptions import DeadlineExceededException
+from hoboken.objects.mixins.deadline import *
+
+
+class TestRequestDeadlineMixin(unittest.TestCase):
+    def setUp(self):
+        class R(WSGIRequestDeadlineMixin):
+            def __init__(self):
+                self.environ = {}
+
+        self.r = R()
+        self.now = 1000.0
+        patcher = patch.object(WSGIRequestDeadlineMixin, '_time',
+                               staticmethod(lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_deadline(self):
+        self.assertIsNone(self.r.deadline)
+        self.assertIsNone(self.r.time_remaining())
+        self.r.check_deadline()
+
+    def test_set_timeout(self):
+        self.r.set_timeout(5)
+        self.assertEqual(self.r.environ[DEADLINE_KEY], 1005.0)
+        self.assertEqual(self.r.time_remaining(), 5.0)
+
+    def test_timeout_only_shortens(self):
+        self.r.set_timeout(5)
+        self.r.set_timeout(10)
+        self.assertEqual(self.r.deadline, 1005.0)
+        self.r.set_timeout(1)
+        self.assertEqual(self.r.deadline, 1001.0)
+
+    def test_check_deadline(self):
+        self.r.set_timeout(5)
+        self.now += 5
+        self.assertEqual(self.r.time_remaining(), 0.0)
+
+        with self.assertRaises(DeadlineExceededException) as cm:
+            self.r.check_deadline()
+        self.assertEqual(cm.exception.code, 503)
+
+        with self.assertRaises(DeadlineExceededException) as cm:
+            self.r.check_deadline(code=504)
+        self.assertEqual(cm.exception.code, 504)
+
+    def test_clear_deadline(self):
+        self.r.deadline = 5
+        self.r.deadline = None
+        self.assertNotIn(DEADLINE_KEY, self.r.environ)
+
+    def test_current_deadline(self):
+        self.assertIsNone(current_deadline())
+        self.r.deadline = 1234
+        previous = set_current_request(self.r)
+        try:
+            self.assertEqual(current_deadline(), 1234)
+        finally:
+            set_current_request(previous)
+        self.assertIsNone(current_deadline())
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRequestDeadlineMixin))
+
+    return suite
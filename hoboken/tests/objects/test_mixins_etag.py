@@ -134,12 +134,75 @@ class TestWSGIResponseEtagMixin(unittest.TestCase):
         self.assertEqual(self.m.etag, (b'foobar', False))
 
 
+class TestAddBodyEtag(unittest.TestCase):
+    def setUp(self):
+        self.m = WSGIResponseEtagMixin()
+        self.m.headers = {}
+        self.closed = False
+
+        def close():
+            self.closed = True
+
+        self.close = close
+
+    def body(self, chunks):
+        body = MagicMock()
+        body.__iter__.return_value = iter(chunks)
+        body.close = self.close
+        return body
+
+    def test_sets_etag(self):
+        self.m.response_iter = self.body([b'foo', b'bar'])
+        self.assertTrue(self.m.add_body_etag())
+
+        etag, strong = self.m.etag
+        self.assertTrue(strong)
+        self.assertEqual(len(etag), 32)
+        self.assertEqual(list(self.m.response_iter), [b'foo', b'bar'])
+        self.assertTrue(self.closed)
+
+    def test_same_body_same_etag(self):
+        self.m.response_iter = [b'foobar']
+        self.m.add_body_etag(digest_size=8)
+        first = self.m.etag
+
+        del self.m.headers['Etag']
+        self.m.response_iter = [b'foo', b'bar']
+        self.m.add_body_etag(digest_size=8)
+        self.assertEqual(self.m.etag, first)
+        self.assertEqual(len(first[0]), 16)
+
+    def test_will_not_override(self):
+        self.m.etag = b'existing'
+        self.m.response_iter = [b'foo']
+        self.assertFalse(self.m.add_body_etag())
+        self.assertEqual(self.m.etag, (b'existing', True))
+
+    def test_skips_large_content_length(self):
+        self.m.headers['Content-Length'] = b'100'
+        self.m.response_iter = self.body([b'foo'])
+        self.assertFalse(self.m.add_body_etag(max_size=10))
+        self.assertEqual(self.m.etag, None)
+
+    def test_skips_large_stream(self):
+        self.m.response_iter = self.body([b'a' * 6, b'b' * 6, b'c' * 6])
+        self.assertFalse(self.m.add_body_etag(max_size=10))
+        self.assertEqual(self.m.etag, None)
+
+        self.assertEqual(b''.join(self.m.response_iter),
+                         b'a' * 6 + b'b' * 6 + b'c' * 6)
+        self.assertFalse(self.closed)
+        self.m.response_iter.close()
+        self.assertTrue(self.closed)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestMatchAnyEtag))
     suite.addTest(unittest.makeSuite(TestMatchNoneEtag))
     suite.addTest(unittest.makeSuite(TestWSGIRequestEtagMixin))
     suite.addTest(unittest.makeSuite(TestWSGIResponseEtagMixin))
+    suite.addTest(unittest.makeSuite(TestAddBodyEtag))
 
     return suite
 
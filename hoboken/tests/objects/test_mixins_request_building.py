@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
+import threading
 from hoboken.tests.compat import unittest
 from mock import MagicMock, call, patch
 
 from hoboken.objects.mixins.request_building import *
+from hoboken.pool import ThreadPool
 
 
 class TestBuildMethod(unittest.TestCase):
@@ -151,6 +154,15 @@ class TestCallApplication(unittest.TestCase):
         self.assertEqual(list(it), [b'foo', b'bar'])
         app_it.close.assert_called_once_with()
 
+    def test_start_response_not_called(self):
+        def dummy_app(environ, start_response):
+            return [b'body']
+
+        self.req = self.Type.build('/')
+        with self.assertRaises(AssertionError) as cm:
+            self.req.call_application(dummy_app)
+        self.assertIn('start_response', str(cm.exception))
+
     def test_call_application_with_exception(self):
         def dummy_app(environ, start_response):
             try:
@@ -197,10 +209,138 @@ class TestCallApplication(unittest.TestCase):
         self.assertEqual(resp.status, '500 Internal Server Error')
 
 
+class TestStreamApplication(unittest.TestCase):
+    def setUp(self):
+        class DummyObject(object):
+            def __init__(self, environ):
+                self.environ = environ
+
+            headers = {}
+
+        class MixedIn(WSGIRequestBuilderMixin, DummyObject):
+            pass
+
+        self.req = MixedIn.build('/')
+
+    def test_iterable_is_passed_through(self):
+        class Body(object):
+            closed = False
+
+            def __iter__(self):
+                return self
+
+            def next(self):
+                raise StopIteration()
+
+            __next__ = next
+
+            def close(self):
+                self.closed = True
+
+        app_body = Body()
+
+        def app(environ, start_response):
+            start_response('200 OK', [('X-Foo', 'bar')])
+            return app_body
+
+        status, headers, body = self.req.stream_application(app)
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers, [('X-Foo', 'bar')])
+        self.assertEqual(list(body), [])
+
+        body.close()
+        self.assertTrue(app_body.closed)
+
+    def test_start_response_in_iterable(self):
+        def app(environ, start_response):
+            start_response('201 Created', [])
+            yield b'one'
+            yield b'two'
+
+        status, headers, body = self.req.stream_application(app)
+        self.assertEqual(status, '201 Created')
+        self.assertEqual(list(body), [b'one', b'two'])
+
+    def test_write_is_bounded(self):
+        written = []
+
+        def app(environ, start_response):
+            write = start_response('200 OK', [])
+            for i in range(10):
+                write(str(i).encode('ascii'))
+                written.append(i)
+            return [b'end']
+
+        status, headers, body = self.req.stream_application(app,
+                                                            max_queued=2)
+        self.assertEqual(next(body), b'0')
+
+        # The application can only get a couple of chunks ahead of us.
+        time.sleep(0.05)
+        self.assertTrue(len(written) <= 4)
+
+        self.assertEqual(b''.join(body), b'123456789end')
+
+    def test_close_stops_writes(self):
+        errors = []
+
+        def app(environ, start_response):
+            write = start_response('200 OK', [])
+            try:
+                while True:
+                    write(b'data')
+            except IOError:
+                errors.append(1)
+            return MagicMock()
+
+        status, headers, body = self.req.stream_application(app,
+                                                            max_queued=1)
+        self.assertEqual(next(body), b'data')
+        body.close()
+
+        for i in range(100):
+            if errors:
+                break
+            time.sleep(0.01)
+        self.assertEqual(errors, [1])
+
+    def test_exception_is_reraised(self):
+        def app(environ, start_response):
+            raise ValueError("failure")
+
+        self.assertRaises(ValueError, self.req.stream_application, app)
+
+    def test_start_response_not_called(self):
+        def app(environ, start_response):
+            return [b'body']
+
+        self.assertRaises(AssertionError, self.req.stream_application, app)
+
+    def test_inline_when_threads_are_busy(self):
+        threads = []
+
+        def app(environ, start_response):
+            threads.append(threading.current_thread())
+            write = start_response('200 OK', [])
+            for i in range(5):
+                write(b'x')
+            return [b'end']
+
+        with patch('hoboken.objects.mixins.request_building._stream_pool',
+                   ThreadPool(threads=0)):
+            status, headers, body = self.req.stream_application(
+                app, max_queued=1)
+
+        # All the writes were buffered, since nothing was reading them.
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(b''.join(body), b'xxxxxend')
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestBuildMethod))
     suite.addTest(unittest.makeSuite(TestCallApplication))
+    suite.addTest(unittest.makeSuite(TestStreamApplication))
 
     return suite
 
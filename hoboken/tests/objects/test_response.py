@@ -70,6 +70,22 @@ class TestWSGIBaseResponse(unittest.TestCase):
         self.e.close()
         self.assertTrue(i.closed)
 
+    def test_will_close_iterable(self):
+        class TestIterable(object):
+            closed = False
+
+            def __iter__(self):
+                return iter([b'a'])
+
+            def close(self):
+                self.closed = True
+
+        i = TestIterable()
+        self.e.response_iter = i
+        self.assertEqual(list(self.e.response_iter), [b'a'])
+        self.e.close()
+        self.assertTrue(i.closed)
+
     def test___call__(self):
         start_response = MagicMock()
         environ = {"REQUEST_METHOD": "GET"}
@@ -82,6 +98,28 @@ class TestWSGIBaseResponse(unittest.TestCase):
             [('Response-Header', 'value')]
         )
 
+    def test_call_on_close_when_exhausted(self):
+        calls = []
+        self.e.response_iter = [b'a', b'b']
+        self.e.call_on_close(lambda: calls.append(1))
+
+        it = self.e({"REQUEST_METHOD": "GET"}, MagicMock())
+        self.assertEqual(next(it), b'a')
+        self.assertEqual(calls, [])
+        self.assertEqual(list(it), [b'b'])
+        self.assertEqual(calls, [1])
+
+        it.close()
+        self.assertEqual(calls, [1])
+
+    def test_call_on_close_when_closed(self):
+        calls = []
+        self.e.call_on_close(lambda: calls.append(1))
+
+        it = self.e({"REQUEST_METHOD": "HEAD"}, MagicMock())
+        it.close()
+        self.assertEqual(calls, [1])
+
 
 class TestEmptyResponse(unittest.TestCase):
     def setUp(self):
@@ -239,6 +239,34 @@ class TestBytesIteratorFile(unittest.TestCase):
         self.assertEqual(self.f.read(-1), b'foobarbaz')
 
 
+class TestClosingIterator(unittest.TestCase):
+    def test_callbacks_run_once(self):
+        calls = []
+        underlying = Mock()
+        underlying.__iter__ = Mock(return_value=iter([b'a']))
+        i = ClosingIterator(underlying, [lambda: calls.append(1)])
+
+        self.assertEqual(list(i), [b'a'])
+        i.close()
+        self.assertEqual(calls, [1])
+        underlying.close.assert_called_once_with()
+
+    def test_callback_errors_are_logged(self):
+        calls = []
+
+        def fail():
+            raise ValueError("failure")
+
+        i = ClosingIterator([], [fail, lambda: calls.append(1)])
+        i.close()
+        self.assertEqual(calls, [1])
+
+    def test_proxies_attributes(self):
+        underlying = Mock(streaming=True)
+        underlying.__iter__ = Mock(return_value=iter([]))
+        self.assertTrue(ClosingIterator(underlying, []).streaming)
+
+
 class TestOther(unittest.TestCase):
     def test_int_parser_handles_invalid(self):
         self.assertIs(_int_parser(None), None)
@@ -252,6 +280,7 @@ def suite():
     suite.addTest(unittest.makeSuite(TestEnvironConverter))
     suite.addTest(unittest.makeSuite(TestCachedProperty))
     suite.addTest(unittest.makeSuite(TestBytesIteratorFile))
+    suite.addTest(unittest.makeSuite(TestClosingIterator))
     suite.addTest(unittest.makeSuite(TestOther))
 
     return suite
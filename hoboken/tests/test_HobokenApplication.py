@@ -2,7 +2,7 @@
 
 from __future__ import division
 from . import HobokenTestCase
-from .. import HobokenApplication, condition
+from .. import HobokenApplication, condition, timeout, validator
 from ..application import HobokenBaseApplication, Route, halt, pass_route
 from ..matchers import RegexMatcher
 from ..exceptions import *
@@ -47,6 +47,41 @@ class TestWorksWithConditions(HobokenTestCase):
         self.assertEqual(self.calls, ["below", "above", "body"])
 
 
+class TestValidators(HobokenTestCase):
+    def after_setup(self):
+        self.calls = []
+
+        def validate_above(req, resp):
+            self.calls.append("above")
+
+        def validate_below(req, resp):
+            self.calls.append("below")
+            if req.headers.get('X-Halt'):
+                halt(code=304)
+
+        def cond(req):
+            self.calls.append("condition")
+            return True
+
+        @validator(validate_above)
+        @self.app.get('/')
+        @validator(validate_below)
+        @condition(cond)
+        def route_func():
+            self.calls.append("body")
+            return 'success'
+
+    def test_validators_order(self):
+        self.assert_body_is("success")
+        self.assertEqual(self.calls, ["condition", "below", "above", "body"])
+
+    def test_validator_can_halt(self):
+        req = Request.build('/', headers={'X-Halt': b'1'})
+        resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 304)
+        self.assertNotIn("body", self.calls)
+
+
 class TestConditionCanAbortRequest(HobokenTestCase):
     def after_setup(self):
         def no_foo_in_path(req):
@@ -76,6 +111,15 @@ class TestSubapps(HobokenTestCase):
         def app_func():
             return "app"
 
+        def streaming_app(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write(b'written ')
+            return iter([b'and ', b'returned'])
+
+        @self.app.get("/streamed")
+        def streamed():
+            self.app.delegate(streaming_app, stream=True)
+
         # NOTE: order matters!
         @self.app.get("/*")
         def final_func(path):
@@ -90,10 +134,57 @@ class TestSubapps(HobokenTestCase):
     def test_neither(self):
         self.assert_not_found(path='/neither')
 
+    def test_streaming_delegation(self):
+        self.assert_body_is("written and returned", path='/streamed')
+
     def test_delegate_will_handle_none(self):
         self.assertFalse(self.app.delegate(None))
 
 
+class TestMount(HobokenTestCase):
+    def after_setup(self):
+        self.seen = []
+
+        def wsgi_app(environ, start_response):
+            self.seen.append((environ['SCRIPT_NAME'], environ['PATH_INFO']))
+            start_response('200 OK', [])
+            return [b'wsgi']
+
+        api = HobokenApplication("api")
+
+        @api.get("/users")
+        def users():
+            return "api users " + api.request.environ['SCRIPT_NAME']
+
+        @self.app.get("/*")
+        def catch_all(path):
+            return "app"
+
+        self.app.mount("/api", api)
+        self.app.mount("/api/v2/", wsgi_app)
+        self.app.mount("/static", wsgi_app)
+
+    def test_mounted_app(self):
+        self.assert_body_is("api users /api", path='/api/users')
+
+    def test_longest_prefix(self):
+        self.assert_body_is("wsgi", path='/api/v2/users')
+        self.assertEqual(self.seen, [('/api/v2', '/users')])
+
+    def test_exact_prefix(self):
+        self.assert_body_is("wsgi", path='/static')
+        self.assertEqual(self.seen, [('/static', '')])
+
+    def test_prefix_matches_whole_segments(self):
+        self.assert_body_is("app", path='/staticfiles')
+        self.assert_body_is("app", path='/other')
+        self.assertEqual(self.seen, [])
+
+    def test_invalid_prefixes(self):
+        self.assertRaises(ValueError, self.app.mount, "api", None)
+        self.assertRaises(ValueError, self.app.mount, "/", None)
+
+
 class TestHandlesExceptions(HobokenTestCase):
     def after_setup(self):
         @self.app.get("/errors")
@@ -500,6 +591,350 @@ class TestConfig(HobokenTestCase):
         resp = r.get_response(app)
 
 
+class TestTrackVary(HobokenTestCase):
+    def after_setup(self):
+        @self.app.get("/negotiated")
+        def negotiated():
+            self.app.request.accept_mimetypes
+            self.app.request.user_agent
+            return b'body'
+
+    def call_app(self):
+        req = Request.build("/negotiated")
+        return req.get_response(self.app)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(self.call_app().vary)
+
+    def test_tracks_vary(self):
+        self.app.config['TRACK_VARY'] = True
+        self.assertEqual(self.call_app().vary, (b'Accept', b'User-Agent'))
+
+
+class TestAutoEtag(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['AUTO_ETAG'] = True
+
+        @self.app.get("/resource")
+        def resource():
+            return b'resource body'
+
+        @self.app.get("/stream")
+        def stream():
+            self.app.response.response_iter = (b'x' * 10 for i in range(10))
+
+        @self.app.get("/tagged")
+        def tagged():
+            self.app.response.etag = b'mine'
+            return b'tagged'
+
+    def call_app(self, path, **kwargs):
+        req = Request.build(path, **kwargs)
+        return req.get_response(self.app)
+
+    def test_sets_etag(self):
+        resp = self.call_app("/resource")
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, b'resource body')
+        self.assertTrue(resp.etag[1])
+
+    def test_not_modified(self):
+        etag = self.call_app("/resource").headers['Etag']
+        resp = self.call_app("/resource", headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_int, 304)
+        self.assertEqual(resp.body, b'')
+
+    def test_disabled(self):
+        self.app.config['AUTO_ETAG'] = False
+        self.assertIsNone(self.call_app("/resource").etag)
+
+    def test_skips_large_stream(self):
+        self.app.config['AUTO_ETAG_MAX_SIZE'] = 50
+        resp = self.call_app("/stream")
+        self.assertIsNone(resp.etag)
+        self.assertEqual(resp.body, b'x' * 100)
+
+    def test_keeps_existing_etag(self):
+        resp = self.call_app("/tagged")
+        self.assertEqual(resp.etag, (b'mine', True))
+
+
+class TestAfterResponse(HobokenTestCase):
+    def after_setup(self):
+        self.calls = []
+
+        @self.app.get("/work")
+        def work():
+            self.app.after_response(self.calls.append, 'done')
+            self.calls.append('handler')
+            return b'body'
+
+        def subapp(environ, start_response):
+            start_response('200 OK', [])
+            return [b'sub body']
+
+        @self.app.get("/delegated")
+        def delegated():
+            self.app.after_response(self.calls.append, 'done')
+            self.app.delegate(subapp)
+
+    def test_runs_after_body_sent(self):
+        req = Request.build("/work")
+        status, headers, app_iter = req.call_application(self.app)
+        self.assertEqual(self.calls, ['handler'])
+
+        self.assertEqual(list(app_iter), [b'body'])
+        self.assertTrue(self.app.background.drain(5))
+        self.assertEqual(self.calls, ['handler', 'done'])
+        self.assertEqual(self.app.background.stats()['completed'], 1)
+
+    def test_runs_when_closed(self):
+        req = Request.build("/work")
+        status, headers, app_iter = req.call_application(self.app)
+        app_iter.close()
+
+        self.assertTrue(self.app.background.drain(5))
+        self.assertEqual(self.calls, ['handler', 'done'])
+
+    def test_kept_across_delegate(self):
+        resp = Request.build("/delegated").get_response(self.app)
+        self.assertEqual(resp.body, b'sub body')
+
+        self.assertTrue(self.app.background.drain(5))
+        self.assertEqual(self.calls, ['done'])
+
+    def test_pool_config(self):
+        self.app.config['BACKGROUND_THREADS'] = 1
+        self.assertEqual(self.app.background.num_threads, 1)
+
+
+class TestDeadlines(HobokenTestCase):
+    def after_setup(self):
+        self.called = []
+
+        @self.app.get("/slow")
+        def slow():
+            time.sleep(0.05)
+            self.app.request.check_deadline()
+            return b'finished'
+
+        @timeout(10)
+        @self.app.get("/remaining")
+        def remaining():
+            return str(self.app.request.time_remaining())
+
+        @self.app.get("/short")
+        @timeout(0)
+        def short():
+            self.called.append('short')
+            return b'never'
+
+        def slow_app(environ, start_response):
+            time.sleep(0.05)
+            start_response('200 OK', [])
+            return [b'slow']
+
+        @self.app.get("/delegate")
+        def delegate():
+            self.app.request.set_timeout(0.01)
+            self.app.delegate(slow_app)
+
+        def deadline_app(environ, start_response):
+            start_response('200 OK', [])
+            return [str(environ.get('hoboken.deadline')).encode('ascii')]
+
+        @self.app.get("/subrequest")
+        def subrequest():
+            self.app.request.deadline = 1234.5
+            return Request.build("/").get_response(deadline_app).body
+
+    def call_app(self, path):
+        return Request.build(path).get_response(self.app)
+
+    def test_no_deadline_by_default(self):
+        self.assertEqual(self.call_app("/slow").body, b'finished')
+
+    def test_request_timeout(self):
+        self.app.config['REQUEST_TIMEOUT'] = 0.01
+        resp = self.call_app("/slow")
+        self.assertEqual(resp.status_int, 503)
+
+    def test_route_timeout(self):
+        resp = self.call_app("/remaining")
+        self.assertTrue(0 < float(resp.body) <= 10)
+
+        resp = self.call_app("/short")
+        self.assertEqual(resp.status_int, 503)
+        self.assertEqual(self.called, [])
+
+    def test_before_filter_checkpoint(self):
+        self.app.config['REQUEST_TIMEOUT'] = 0.01
+
+        @self.app.before()
+        def slow_filter():
+            time.sleep(0.05)
+
+        @self.app.before()
+        def second_filter():
+            self.called.append('filter')
+
+        resp = self.call_app("/remaining")
+        self.assertEqual(resp.status_int, 503)
+        self.assertEqual(self.called, [])
+
+    def test_after_filters_still_run(self):
+        self.app.config['REQUEST_TIMEOUT'] = 0.01
+
+        @self.app.after()
+        def after_filter():
+            self.called.append('after')
+
+        resp = self.call_app("/slow")
+        self.assertEqual(resp.status_int, 503)
+        self.assertEqual(self.called, ['after'])
+
+    def test_timeout_ignored_if_conditions_fail(self):
+        @self.app.get("/conditional")
+        @timeout(0.01)
+        @condition(lambda req: False)
+        def short_conditional():
+            return b'never'
+
+        @self.app.get("/conditional")
+        def fallback():
+            time.sleep(0.05)
+            self.app.request.check_deadline()
+            return b'fallback'
+
+        resp = self.call_app("/conditional")
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, b'fallback')
+
+    def test_delegate_timeout(self):
+        resp = self.call_app("/delegate")
+        self.assertEqual(resp.status_int, 504)
+
+    def test_subrequest_inherits_deadline(self):
+        resp = self.call_app("/subrequest")
+        self.assertEqual(resp.body, b'1234.5')
+
+
+class TestGather(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['TASK_THREADS'] = 4
+
+    def test_runs_concurrently(self):
+        barrier = threading.Event()
+        arrived = []
+
+        def first():
+            arrived.append(1)
+            barrier.wait(5)
+            return 'first'
+
+        def second():
+            # This only returns if both are running at once.
+            arrived.append(2)
+            barrier.set()
+            return 'second'
+
+        @self.app.get("/")
+        def index():
+            results = self.app.gather(first, second)
+            return ','.join(results)
+
+        self.assert_body_is('first,second')
+        self.assertEqual(sorted(arrived), [1, 2])
+
+    def test_preserves_context(self):
+        threads = []
+
+        @self.app.before("/context")
+        def set_var():
+            self.app.g.user = 'alice'
+
+        def context():
+            threads.append(threading.current_thread())
+            return self.app.request.method + ' ' + self.app.g.user
+
+        @self.app.get("/context")
+        def index():
+            threads.append(threading.current_thread())
+            return self.app.gather(context)[0]
+
+        self.assert_body_is('GET alice', '/context')
+        self.assertNotEqual(threads[0], threads[1])
+
+        # The worker's context is restored afterwards.
+        def check():
+            return self.app.request
+        self.assertEqual(self.app.gather(check), [None])
+
+    def test_records_timings(self):
+        def named():
+            return 1
+
+        @self.app.get("/")
+        def index():
+            self.app.gather(named, named)
+            timings = self.app.request.environ['hoboken.gather_timings']
+            return ','.join(name for name, elapsed in timings)
+
+        self.assert_body_is('named,named')
+
+    def test_first_error_is_raised(self):
+        def fail():
+            raise ValueError("failure")
+
+        self.assertRaises(ValueError, self.app.gather, lambda: 1, fail)
+
+    def test_cancel_on_error(self):
+        self.app.config['TASK_THREADS'] = 1
+        release = threading.Event()
+        self.addCleanup(release.set)
+        calls = []
+
+        def fail():
+            raise ValueError("failure")
+
+        def blocked():
+            release.wait(5)
+
+        with self.assertRaises(ValueError):
+            self.app.gather(fail, blocked, lambda: calls.append(1),
+                            cancel_on_error=True)
+        release.set()
+
+        self.assertTrue(self.app.tasks.drain(5))
+        self.assertEqual(calls, [])
+
+    def test_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        from hoboken.pool import TaskTimeout
+        self.assertRaises(TaskTimeout, self.app.gather,
+                          lambda: release.wait(5), timeout=0.01)
+
+    def test_deadline_exceeded(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        @self.app.get("/")
+        @timeout(0.01)
+        def index():
+            self.app.gather(lambda: release.wait(5))
+
+        status, body = self.call_app()
+        self.assertEqual(status, 504)
+
+    def test_runs_inline_when_pool_is_full(self):
+        self.app.config['TASK_THREADS'] = 1
+        self.app.config['TASK_QUEUE_SIZE'] = 1
+        results = self.app.gather(*[(lambda i=i: i) for i in range(4)])
+        self.assertEqual(results, [0, 1, 2, 3])
+
+
 class TestInheritance(HobokenTestCase):
     def test_mixin_init_called(self):
         calls = []
@@ -599,8 +1034,10 @@ def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestHasHTTPMethods))
     suite.addTest(unittest.makeSuite(TestWorksWithConditions))
+    suite.addTest(unittest.makeSuite(TestValidators))
     suite.addTest(unittest.makeSuite(TestConditionCanAbortRequest))
     suite.addTest(unittest.makeSuite(TestSubapps))
+    suite.addTest(unittest.makeSuite(TestMount))
     suite.addTest(unittest.makeSuite(TestHandlesExceptions))
     suite.addTest(unittest.makeSuite(TestBodyReturnValues))
     suite.addTest(unittest.makeSuite(TestHaltHelper))
@@ -610,6 +1047,11 @@ def suite():
     suite.addTest(unittest.makeSuite(TestMatcherTypes))
     suite.addTest(unittest.makeSuite(TestMiscellaneousMethods))
     suite.addTest(unittest.makeSuite(TestConfig))
+    suite.addTest(unittest.makeSuite(TestTrackVary))
+    suite.addTest(unittest.makeSuite(TestAutoEtag))
+    suite.addTest(unittest.makeSuite(TestAfterResponse))
+    suite.addTest(unittest.makeSuite(TestDeadlines))
+    suite.addTest(unittest.makeSuite(TestGather))
     suite.addTest(unittest.makeSuite(TestInheritance))
 
     return suite
@@ -0,0 +1,211 @@
+from __future__ import with_statement, print_function
+
+import time
+import socket
+import threading
+from hoboken.tests.compat import unittest
+
+try:
+    from hoboken.aioserving import AsyncServer, BodyReader, HIGH_WATER
+except ImportError:         # pragma: no cover
+    AsyncServer = None
+
+from hoboken.tests.test_serving import echo_app, read_response
+
+
+requires_asyncio = unittest.skipIf(AsyncServer is None,
+                                   "asyncio is not available")
+
+
+@requires_asyncio
+class TestBodyReader(unittest.TestCase):
+    def setUp(self):
+        self.r = BodyReader()
+
+    def test_read1_returns_chunks_unchanged(self):
+        chunk = b'x' * 100
+        self.r.feed(chunk)
+        self.r.feed_eof()
+
+        self.assertIs(self.r.read1(1024), chunk)
+        self.assertEqual(self.r.read1(1024), b'')
+
+    def test_read(self):
+        self.r.feed(b'abc')
+        self.r.feed(b'def')
+        self.r.feed_eof()
+
+        self.assertEqual(self.r.read(4), b'abcd')
+        self.assertEqual(self.r.read(), b'ef')
+        self.assertEqual(self.r.read(), b'')
+
+    def test_readline(self):
+        self.r.feed(b'one\ntw')
+        self.r.feed(b'o\nthree')
+        self.r.feed_eof()
+
+        self.assertEqual(list(self.r), [b'one\n', b'two\n', b'three'])
+
+    def test_blocks_until_data(self):
+        def feeder():
+            time.sleep(0.05)
+            self.r.feed(b'late')
+            self.r.feed_eof()
+
+        t = threading.Thread(target=feeder)
+        t.start()
+        self.assertEqual(self.r.read(), b'late')
+        t.join()
+
+    def test_error(self):
+        self.r.feed(b'abc')
+        self.r.feed_eof(IOError("disconnected"))
+
+        self.assertEqual(self.r.read1(), b'abc')
+        self.assertRaises(IOError, self.r.read)
+
+
+def read1_app(environ, start_response):
+    chunks = []
+    while True:
+        data = environ['wsgi.input'].read1(1024 * 1024)
+        if not data:
+            break
+        chunks.append(data)
+
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b','.join(chunks)]
+
+
+def read_all_app(environ, start_response):
+    # A single read of the whole body, which is larger than the buffer.
+    body = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(len(body)).encode('ascii')]
+
+
+def ignore_body_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'ignored']
+
+
+@requires_asyncio
+class TestAsyncServer(unittest.TestCase):
+    def start_server(self, app, **kwargs):
+        self.server = AsyncServer(app, port=0, threads=4, **kwargs)
+        self.server.bind()
+
+        t = threading.Thread(target=self.server.run)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.server.stop)
+
+    def connect(self):
+        sock = socket.create_connection(self.server.address, timeout=5)
+        f = sock.makefile('rb')
+        self.addCleanup(sock.close)
+        self.addCleanup(f.close)
+        return sock, f
+
+    def test_keep_alive(self):
+        self.start_server(echo_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'GET /one HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'GET /one |')
+        sock.sendall(b'POST /two HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc')
+        self.assertEqual(read_response(f)[2], b'POST /two |abc')
+
+    def test_pipelining(self):
+        self.start_server(echo_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'POST /one HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc'
+                     b'GET /two HTTP/1.1\r\n\r\n'
+                     b'GET /three HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'POST /one |abc')
+        self.assertEqual(read_response(f)[2], b'GET /two |')
+
+        status, headers, body = read_response(f)
+        self.assertEqual(body, b'GET /three |')
+        self.assertEqual(headers[b'connection'], b'close')
+        self.assertEqual(f.read(), b'')
+
+    def test_incremental_request(self):
+        self.start_server(echo_app)
+        sock, f = self.connect()
+
+        for part in (b'GET /sl', b'ow HTTP/1.1\r', b'\nHost: x\r\n', b'\r\n'):
+            sock.sendall(part)
+            time.sleep(0.01)
+        self.assertEqual(read_response(f)[2], b'GET /slow |')
+
+    def test_chunked_body_is_passed_through(self):
+        self.start_server(read1_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'3\r\nabc\r\n')
+        time.sleep(0.05)
+        sock.sendall(b'2\r\nde\r\n0\r\n\r\n')
+
+        self.assertEqual(read_response(f)[2], b'abc,de')
+
+    def test_large_read(self):
+        self.start_server(read_all_app)
+        sock, f = self.connect()
+
+        size = HIGH_WATER * 8
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: ' +
+                     str(size).encode('ascii') + b'\r\n\r\n')
+        sock.sendall(b'x' * size)
+        self.assertEqual(read_response(f)[2], str(size).encode('ascii'))
+
+    def test_unread_body_is_discarded(self):
+        self.start_server(ignore_body_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'ignored')
+
+        sock.sendall(b'abcdeGET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'ignored')
+
+    def test_bad_request(self):
+        self.start_server(echo_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'NONSENSE\r\n\r\n')
+        status, headers, body = read_response(f)
+        self.assertEqual(status, b'HTTP/1.1 400 Bad Request')
+
+    def test_invalid_chunk_size(self):
+        self.start_server(echo_app)
+        sock, f = self.connect()
+
+        sock.sendall(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                     b'-3\r\nabc\r\n0\r\n\r\n')
+        status, headers, body = read_response(f)
+        self.assertEqual(status, b'HTTP/1.1 400 Bad Request')
+
+    def test_many_idle_connections(self):
+        self.start_server(echo_app)
+
+        socks = [self.connect()[0] for i in range(200)]
+        for i in range(50):
+            if self.server.stats()['connections'] == len(socks):
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.stats()['connections'], len(socks))
+
+        sock, f = self.connect()
+        sock.sendall(b'GET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[0], b'HTTP/1.1 200 OK')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBodyReader))
+    suite.addTest(unittest.makeSuite(TestAsyncServer))
+
+    return suite
@@ -0,0 +1,83 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+from hoboken.tests.compat import unittest
+
+from mock import Mock
+
+from hoboken.allocations import RouteAllocations, tracemalloc
+
+
+class TestRouteAllocations(unittest.TestCase):
+    def test_flags_growth_once(self):
+        route = RouteAllocations('/leak')
+        flags = [route.add(2048, [], 1024, 3, 10) for i in range(4)]
+        self.assertEqual(flags, [False, False, True, False])
+        self.assertTrue(route.growing)
+        self.assertEqual(route.retained, 2048 * 4)
+
+        route.add(0, [], 1024, 3, 10)
+        self.assertFalse(route.growing)
+        self.assertEqual(route.streak, 0)
+
+    def test_top_sites(self):
+        route = RouteAllocations('/')
+        route.add(30, [('a.py:1', 10), ('b.py:2', 20)], 1024, 3, 10)
+        route.add(10, [('a.py:1', 15)], 1024, 3, 10)
+        self.assertEqual(route.top_sites(1), [('a.py:1', 25)])
+
+
+@unittest.skipIf(tracemalloc is None, "requires tracemalloc")
+class TestAllocationSampling(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['ALLOCATION_SAMPLE_RATE'] = 1
+        self.app.config['ALLOCATION_GROWTH_SAMPLES'] = 3
+        self.app.allocations.logger = Mock()
+        self.leaked = leaked = []
+
+        @self.app.get("/leak/:id")
+        def leak(id):
+            leaked.append(bytearray(64 * 1024))
+            return 'leak'
+
+        @self.app.get("/clean")
+        def clean():
+            data = bytearray(64 * 1024)
+            return 'clean'
+
+    def test_flags_leaking_routes(self):
+        for i in range(3):
+            self.assert_body_is('leak', '/leak/{0}'.format(i))
+            self.assert_body_is('clean', '/clean')
+
+        report = self.app.allocations.report()
+        self.assertEqual(report['/leak/:id']['samples'], 3)
+        self.assertTrue(report['/leak/:id']['retained'] >= 3 * 64 * 1024)
+        self.assertTrue(report['/clean']['retained'] < 64 * 1024)
+        self.assertEqual(self.app.allocations.growing_routes(), ['/leak/:id'])
+
+        site, size = report['/leak/:id']['top_sites'][0]
+        self.assertIn('test_allocations.py', site)
+        self.assertTrue(self.app.allocations.logger.warning.called)
+
+        flags = self.app.metrics.get('hoboken_allocation_growth_flags_total')
+        self.assertEqual(flags.collect(), {('/leak/:id',): 1})
+
+        # The gauge holds the last sample, not the total.
+        retained = self.app.metrics.get('hoboken_allocation_retained_bytes')
+        last = retained.collect()[('/leak/:id',)]
+        self.assertTrue(64 * 1024 <= last < 2 * 64 * 1024)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_disabled(self):
+        self.app.config['ALLOCATION_SAMPLE_RATE'] = 0
+        self.assert_body_is('leak', '/leak/1')
+        self.assertEqual(self.app.allocations.report(), {})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRouteAllocations))
+    suite.addTest(unittest.makeSuite(TestAllocationSampling))
+
+    return suite
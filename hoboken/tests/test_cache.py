@@ -0,0 +1,303 @@
+from __future__ import with_statement, print_function
+
+import os
+import time
+import random
+import threading
+from hoboken.tests.compat import unittest, slow_test
+from mock import patch
+
+from hoboken.cache import CacheEntry, MemoryCache, SingleFlight, vary_key
+from hoboken.sharedcache import SharedMemoryCache
+
+
+class TestCacheEntry(unittest.TestCase):
+    def make_entry(self, age, **kwargs):
+        with patch('hoboken.cache._time') as time_func:
+            time_func.return_value = 1000
+            entry = CacheEntry(b'value', 10, **kwargs)
+
+        self.patcher = patch('hoboken.cache._time')
+        time_func = self.patcher.start()
+        time_func.return_value = 1000 + age
+        return entry
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_fresh(self):
+        e = self.make_entry(5)
+        self.assertTrue(e.is_fresh)
+        self.assertEqual(e.age, 5)
+
+    def test_stale_while_revalidate(self):
+        e = self.make_entry(15, stale_while_revalidate=10)
+        self.assertFalse(e.is_fresh)
+        self.assertTrue(e.can_revalidate)
+        self.assertFalse(e.can_serve_on_error)
+
+    def test_stale_if_error(self):
+        e = self.make_entry(15, stale_if_error=10)
+        self.assertFalse(e.can_revalidate)
+        self.assertTrue(e.can_serve_on_error)
+
+    def test_lifetime(self):
+        e = self.make_entry(0, stale_while_revalidate=5, stale_if_error=20)
+        self.assertEqual(e.lifetime, 30)
+
+
+class TestVaryKey(unittest.TestCase):
+    def test_no_headers(self):
+        self.assertEqual(vary_key(b'base', (), {}), b'base')
+        self.assertEqual(vary_key(b'base', None, {}), b'base')
+
+    def test_with_headers(self):
+        headers = {b'accept': b'text/html'}
+        key = vary_key(b'base', (b'Accept', b'Cookie'), headers)
+        self.assertEqual(key, b'base\naccept:text/html\ncookie:')
+
+    def test_is_order_and_case_insensitive(self):
+        headers = {b'accept': b'text/html', b'cookie': b'a=b'}
+        self.assertEqual(vary_key(b'base', (b'Accept', b'Cookie'), headers),
+                         vary_key(b'base', (b'cookie', b'ACCEPT'), headers))
+
+
+class TestMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self.c = MemoryCache(max_entries=2)
+
+    def test_get_set(self):
+        self.assertIsNone(self.c.get(b'foo'))
+        self.c.set(b'foo', b'bar')
+        self.assertEqual(self.c.get(b'foo'), b'bar')
+        self.assertEqual(self.c.hits, 1)
+        self.assertEqual(self.c.misses, 1)
+
+    def test_delete_and_clear(self):
+        self.c.set(b'foo', b'bar')
+        self.c.delete(b'foo')
+        self.assertIsNone(self.c.get(b'foo'))
+
+        self.c.set(b'foo', b'bar')
+        self.c.clear()
+        self.assertEqual(len(self.c), 0)
+
+    def test_timeout(self):
+        with patch('hoboken.cache._time') as time_func:
+            time_func.return_value = 1000
+            self.c.set(b'foo', b'bar', timeout=10)
+
+            time_func.return_value = 1009
+            self.assertEqual(self.c.get(b'foo'), b'bar')
+
+            time_func.return_value = 1010
+            self.assertIsNone(self.c.get(b'foo'))
+
+    def test_evicts_least_recently_used(self):
+        self.c.set(b'one', 1)
+        self.c.set(b'two', 2)
+        self.c.get(b'one')
+        self.c.set(b'three', 3)
+
+        self.assertEqual(self.c.get(b'one'), 1)
+        self.assertIsNone(self.c.get(b'two'))
+        self.assertEqual(self.c.get(b'three'), 3)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.sf = SingleFlight()
+
+    def test_do(self):
+        ret = self.sf.do(b'key', lambda x: x * 2, 21)
+        self.assertEqual(ret, (42, False))
+        self.assertFalse(self.sf.in_flight(b'key'))
+
+    def test_do_raises(self):
+        def fail():
+            raise ValueError("fail")
+
+        self.assertRaises(ValueError, self.sf.do, b'key', fail)
+        self.assertFalse(self.sf.in_flight(b'key'))
+
+    def test_concurrent_calls_are_coalesced(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return b'result'
+
+        def worker():
+            results.append(self.sf.do(b'key', slow))
+
+        leader = threading.Thread(target=worker)
+        leader.start()
+        started.wait()
+
+        followers = [threading.Thread(target=worker) for i in range(5)]
+        for t in followers:
+            t.start()
+
+        # Give the followers a chance to start waiting on the leader.
+        time.sleep(0.1)
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(r[0] == b'result' for r in results))
+        self.assertEqual(len([r for r in results if not r[1]]), 1)
+
+    def test_spawn_only_runs_once(self):
+        release = threading.Event()
+        done = threading.Event()
+
+        def slow():
+            release.wait()
+            done.set()
+
+        self.assertTrue(self.sf.spawn(b'key', slow))
+        self.assertFalse(self.sf.spawn(b'key', slow))
+        release.set()
+        done.wait()
+
+
+class TestSharedMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self.c = SharedMemoryCache(slots=16, slot_size=256, ways=4)
+
+    def tearDown(self):
+        self.c.close()
+
+    def test_get_set(self):
+        self.assertIsNone(self.c.get(b'foo'))
+        self.assertTrue(self.c.set(b'foo', {'a': [1, 2]}))
+        self.assertEqual(self.c.get(b'foo'), {'a': [1, 2]})
+        self.assertEqual(self.c.hits, 1)
+        self.assertEqual(self.c.misses, 1)
+
+    def test_overwrite(self):
+        self.c.set(b'foo', b'one')
+        self.c.set(b'foo', b'two')
+        self.assertEqual(self.c.get(b'foo'), b'two')
+        self.assertEqual(len(self.c), 1)
+
+    def test_delete_and_clear(self):
+        self.c.set(b'foo', b'bar')
+        self.c.delete(b'foo')
+        self.assertIsNone(self.c.get(b'foo'))
+
+        self.c.set(b'foo', b'bar')
+        self.c.set(b'baz', b'qux')
+        self.c.clear()
+        self.assertEqual(len(self.c), 0)
+
+    def test_timeout(self):
+        with patch('hoboken.sharedcache._time') as time_func:
+            time_func.return_value = 1000
+            self.c.set(b'foo', b'bar', timeout=10)
+
+            time_func.return_value = 1009
+            self.assertEqual(self.c.get(b'foo'), b'bar')
+
+            time_func.return_value = 1010
+            self.assertIsNone(self.c.get(b'foo'))
+
+    def test_too_large(self):
+        self.assertFalse(self.c.set(b'foo', b'x' * 1024))
+        self.assertIsNone(self.c.get(b'foo'))
+
+    def test_eviction_prefers_unreferenced_slots(self):
+        c = SharedMemoryCache(slots=4, slot_size=256, ways=4)
+        self.addCleanup(c.close)
+
+        keys = [b'key' + str(i).encode('ascii') for i in range(6)]
+        for k in keys[:4]:
+            c.set(k, k)
+
+        # Adding a fifth value clears every reference bit, and evicts the
+        # first value.  We then touch everything except the third value,
+        # which should be the next one evicted.
+        c.set(keys[4], keys[4])
+        self.assertIsNone(c.get(keys[0]))
+        for k in (keys[1], keys[3], keys[4]):
+            c.get(k)
+
+        c.set(keys[5], keys[5])
+        self.assertIsNone(c.get(keys[2]))
+        self.assertEqual(c.get(keys[1]), keys[1])
+        self.assertEqual(len(c), 4)
+
+    def test_is_shared_with_children(self):
+        self.c.set(b'parent', b'value')
+
+        pid = os.fork()
+        if pid == 0:
+            ok = self.c.get(b'parent') == b'value'
+            self.c.set(b'child', b'value')
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(self.c.get(b'child'), b'value')
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, SharedMemoryCache, slots=10, ways=4)
+        self.assertRaises(ValueError, SharedMemoryCache, slot_size=16)
+
+    @slow_test
+    def test_multiprocess_stress(self):
+        c = SharedMemoryCache(slots=64, slot_size=512, ways=4)
+        self.addCleanup(c.close)
+
+        # Every value is derived from its key, so a torn read (or a value
+        # returned for the wrong key) is detectable.
+        def value_for(key, n):
+            return (key, n, key * (n % 50))
+
+        def worker(seed):
+            rand = random.Random(seed)
+            for i in range(5000):
+                key = b'key-' + str(rand.randint(0, 200)).encode('ascii')
+                if rand.random() < 0.3:
+                    c.set(key, value_for(key, rand.randint(0, 1000)))
+                else:
+                    value = c.get(key)
+                    if value is not None and \
+                            value != value_for(key, value[1]):
+                        return 1
+            return 0
+
+        pids = []
+        for i in range(4):
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    code = worker(i)
+                finally:
+                    os._exit(code)
+            pids.append(pid)
+
+        for pid in pids:
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(status, 0)
+
+        self.assertTrue(0 < len(c) <= 64)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCacheEntry))
+    suite.addTest(unittest.makeSuite(TestVaryKey))
+    suite.addTest(unittest.makeSuite(TestMemoryCache))
+    suite.addTest(unittest.makeSuite(TestSingleFlight))
+    suite.addTest(unittest.makeSuite(TestSharedMemoryCache))
+
+    return suite
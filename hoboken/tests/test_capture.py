@@ -0,0 +1,260 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import os
+import json
+import shutil
+import tempfile
+import threading
+from io import BytesIO
+from hoboken.tests.compat import unittest
+
+from hoboken.application import Request
+from hoboken.capture import (CaptureMiddleware, CapturedRequest,
+                             read_capture, redact_json, redact_query,
+                             sanitise_environ)
+from hoboken.replay import LoadReport, Pacer, replay, main
+from hoboken.serving import ThreadedServer
+from hoboken.timing import clock
+
+
+class TestCapture(HobokenTestCase):
+    def after_setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'traffic.capture')
+
+        self.bodies = bodies = []
+
+        @self.app.post("/echo")
+        def echo():
+            bodies.append(self.app.request.input_stream.read())
+            return 'echo'
+
+        @self.app.get("/users/:id")
+        def user(id):
+            return 'user'
+
+        self.capture = CaptureMiddleware(self.app, self.path, max_body=8)
+        self.addCleanup(self.capture.file.close)
+
+    def send(self, path, method='GET', body=None, headers=None,
+             content_type=None, capture=None, query_string=None):
+        req = Request.build(path, method=method, query_string=query_string)
+        if content_type is not None:
+            req.environ['CONTENT_TYPE'] = content_type
+        for name, value in (headers or {}).items():
+            req.headers[name] = value
+        if body is not None:
+            req.environ['wsgi.input'] = BytesIO(body)
+            req.environ['CONTENT_LENGTH'] = str(len(body))
+        return req.get_response(capture or self.capture)
+
+    def read(self):
+        return list(read_capture(self.path))
+
+    def test_sanitise_environ(self):
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/',
+                   'REMOTE_ADDR': '10.0.0.1', 'HTTP_ACCEPT': 'text/html',
+                   'HTTP_COOKIE': 'session=secret',
+                   'wsgi.input': BytesIO()}
+        self.assertEqual(sanitise_environ(environ), {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': '/',
+            'HTTP_ACCEPT': 'text/html'})
+
+    def test_redact_query(self):
+        self.assertEqual(redact_query('a=1&Password=x%20y&api%5Fkey=k&b'),
+                         'a=1&Password=REDACTED&api%5Fkey=REDACTED&b')
+        self.assertEqual(redact_query('token=1', fields=()), 'token=1')
+
+    def test_redact_json(self):
+        self.assertEqual(
+            redact_json({'user': {'name': 'a', 'Secret': 's'},
+                         'items': [{'token': 't'}, 1]}),
+            {'user': {'name': 'a', 'Secret': 'REDACTED'},
+             'items': [{'token': 'REDACTED'}, 1]})
+
+    def test_query_fields_are_redacted(self):
+        self.send('/users/1', query_string='page=2&access_token=abc')
+
+        captured, = self.read()
+        self.assertEqual(captured.environ['QUERY_STRING'],
+                         'page=2&access_token=REDACTED')
+
+    def test_form_bodies_are_not_captured_by_default(self):
+        self.send('/echo', method='POST', body=b'password=hunter2',
+                  content_type='application/x-www-form-urlencoded')
+
+        captured, = self.read()
+        self.assertEqual(captured.body, b'')
+        self.assertTrue(captured.truncated)
+        self.assertEqual(captured.make_environ()['CONTENT_LENGTH'], '0')
+        self.assertEqual(self.bodies, [b'password=hunter2'])
+
+    def test_body_fields_are_redacted(self):
+        capture = CaptureMiddleware(self.app, self.capture.file,
+                                    capture_body=True)
+        self.send('/echo', method='POST', body=b'user=a&password=hunter2',
+                  content_type='application/x-www-form-urlencoded',
+                  capture=capture)
+        self.send('/echo', method='POST',
+                  body=b'{"user": "a", "api_key": "k"}',
+                  content_type='application/json',
+                  capture=capture)
+        self.send('/echo', method='POST', body=b'--x--',
+                  content_type='multipart/form-data; boundary=x',
+                  capture=capture)
+
+        form, data, multipart = self.read()
+        self.assertEqual(form.body, b'user=a&password=REDACTED')
+        self.assertEqual(form.environ['CONTENT_LENGTH'],
+                         str(len(form.body)))
+        self.assertEqual(json.loads(data.body.decode('utf-8')),
+                         {'user': 'a', 'api_key': 'REDACTED'})
+        self.assertEqual((multipart.body, multipart.truncated), (b'', True))
+
+        # The application still got the original bodies.
+        self.assertEqual(self.bodies[0], b'user=a&password=hunter2')
+
+    def test_capture_body_off(self):
+        capture = CaptureMiddleware(self.app, self.capture.file,
+                                    capture_body=False)
+        self.send('/echo', method='POST', body=b'hello', capture=capture)
+
+        captured, = self.read()
+        self.assertEqual((captured.body, captured.truncated), (b'', True))
+        self.assertEqual(self.bodies, [b'hello'])
+
+    def test_captures_requests(self):
+        self.send('/users/1', headers={'Authorization': 'Basic secret',
+                                       'Accept': 'text/plain'})
+        self.send('/echo', method='POST', body=b'hello')
+
+        first, second = self.read()
+        self.assertEqual(first.environ['PATH_INFO'], '/users/1')
+        self.assertEqual(first.environ['HTTP_ACCEPT'], 'text/plain')
+        self.assertNotIn('HTTP_AUTHORIZATION', first.environ)
+        self.assertEqual(second.body, b'hello')
+        self.assertFalse(second.truncated)
+        self.assertEqual(self.bodies, [b'hello'])
+
+    def test_large_bodies_are_truncated(self):
+        self.send('/echo', method='POST', body=b'0123456789abcdef')
+
+        captured, = self.read()
+        self.assertEqual(captured.body, b'01234567')
+        self.assertTrue(captured.truncated)
+
+        # The application still got the whole body.
+        self.assertEqual(self.bodies, [b'0123456789abcdef'])
+
+    def test_chunked_bodies(self):
+        for body in (b'short', b'0123456789abcdef'):
+            req = Request.build('/echo', method='POST')
+            req.environ['wsgi.input'] = BytesIO(body)
+            req.environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+            req.get_response(self.capture)
+
+        short, long = self.read()
+        self.assertEqual((short.body, short.truncated), (b'short', False))
+        self.assertEqual((long.body, long.truncated), (b'01234567', True))
+        self.assertEqual(self.bodies, [b'short', b'0123456789abcdef'])
+
+        environ = short.make_environ()
+        self.assertEqual(environ['CONTENT_LENGTH'], '5')
+        self.assertNotIn('HTTP_TRANSFER_ENCODING', environ)
+
+    def test_round_trip(self):
+        captured = CapturedRequest(12.5, {'PATH_INFO': '/'}, b'\x00\xff',
+                                   True)
+        copy = CapturedRequest.from_json(captured.to_json())
+        self.assertEqual((copy.time, copy.environ, copy.body, copy.truncated),
+                         (12.5, {'PATH_INFO': '/'}, b'\x00\xff', True))
+
+    def test_skips_bad_lines(self):
+        self.send('/users/1')
+        with open(self.path, 'ab') as f:
+            f.write(b'{"t": 1, "envir\n')
+        self.assertEqual(len(self.read()), 1)
+
+    def test_replay_in_process(self):
+        for i in range(3):
+            self.send('/users/{0}'.format(i))
+        self.send('/echo', method='POST', body=b'hello')
+        self.send('/missing')
+        del self.bodies[:]
+
+        report = replay(self.path, self.app, threads=2, repeat=2)
+        self.assertEqual(report.count, 10)
+        self.assertEqual(report.statuses, {200: 8, 404: 2})
+        self.assertEqual(report.error_breakdown(), {'404': 2})
+        self.assertEqual(self.bodies, [b'hello', b'hello'])
+        self.assertIsNotNone(report.percentiles()[99])
+
+    def test_replay_over_http(self):
+        server = ThreadedServer(self.app, port=0, threads=2)
+        server.bind()
+        t = threading.Thread(target=server.run)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(server.stop)
+
+        self.send('/users/1')
+        self.send('/echo', method='POST', body=b'hello')
+        del self.bodies[:]
+
+        url = 'http://{0}:{1}'.format(*server.address[:2])
+        report = replay(self.path, url, threads=2)
+        self.assertEqual(report.statuses, {200: 2})
+        self.assertEqual(self.bodies, [b'hello'])
+
+    def test_command_line(self):
+        self.send('/users/1')
+
+        import hoboken.tests.test_capture as module
+        module.replay_app = self.app
+        self.addCleanup(delattr, module, 'replay_app')
+        self.assertEqual(main([self.path, '--app', module.__name__ +
+                               ':replay_app']), 0)
+
+
+class TestLoadReport(unittest.TestCase):
+    def test_summary(self):
+        report = LoadReport()
+        for i in range(1, 101):
+            report.record(i / 1000.0, 200)
+        report.record(0.5, error='ConnectionError')
+        report.record(0.001, 503)
+
+        summary = report.summary()
+        self.assertEqual(summary['requests'], 102)
+        self.assertEqual(summary['errors'], {'ConnectionError': 1,
+                                             '503': 1})
+        self.assertEqual(summary['percentiles'][50], 0.05)
+        self.assertEqual(summary['max'], 0.5)
+        self.assertIn('Throughput', report.format())
+
+        histogram = dict(report.histogram([0.01, 0.1]))
+        self.assertEqual(histogram, {0.01: 11, 0.1: 90, None: 1})
+
+    def test_pacer_rate(self):
+        pacer = Pacer(rate=100)
+        start = clock()
+        for i in range(5):
+            pacer.wait()
+        self.assertTrue(clock() - start >= 0.035)
+
+    def test_pacer_speed(self):
+        pacer = Pacer(speed=10)
+        start = clock()
+        pacer.wait(100.0)
+        pacer.wait(100.5)
+        self.assertTrue(clock() - start >= 0.045)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCapture))
+    suite.addTest(unittest.makeSuite(TestLoadReport))
+
+    return suite
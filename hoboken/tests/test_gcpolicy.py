@@ -0,0 +1,204 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import gc
+from hoboken.tests.compat import unittest
+
+from hoboken.gcpolicy import GCPauses, GCPolicy, gc_pauses
+from hoboken.metrics import MetricsRegistry
+from hoboken.serving import freeze_gc
+
+
+def make_garbage(count):
+    # Reference cycles, which only the collector can free.
+    for i in range(count):
+        l = []
+        l.append(l)
+
+
+class PauseListener(object):
+    def __init__(self):
+        self.pauses = []
+
+    def gc_pause(self, generation, seconds):
+        self.pauses.append((generation, seconds))
+
+
+class TestGCPauses(unittest.TestCase):
+    def test_listeners(self):
+        pauses = GCPauses()
+        listener = PauseListener()
+        pauses.add_listener(listener)
+
+        pauses._callback('start', {'generation': 1})
+        pauses._callback('stop', {'generation': 1})
+        self.assertEqual(len(listener.pauses), 1)
+        self.assertEqual(listener.pauses[0][0], 1)
+        self.assertEqual(pauses.collections, [0, 1, 0])
+
+    def test_listeners_are_weak(self):
+        pauses = GCPauses()
+        pauses.add_listener(PauseListener())
+        gc.collect()
+
+        pauses._callback('start', {'generation': 0})
+        pauses._callback('stop', {'generation': 0})
+        self.assertEqual(len(pauses._listeners), 0)
+
+
+class TestGCPolicy(unittest.TestCase):
+    def setUp(self):
+        self.original = gc.get_threshold()
+        self.addCleanup(gc.set_threshold, *self.original)
+
+        self.settings = {
+            'GC_FREEZE': False,
+            'GC_THRESHOLDS': (100, 10, 10),
+            'GC_DEFER': True,
+            'GC_DEFER_LIMIT': 10,
+            'METRICS': True,
+        }
+        self.registry = MetricsRegistry()
+        self.policy = GCPolicy(self.settings, self.registry)
+        self.addCleanup(self.policy.restore)
+
+    def deferred(self):
+        return sum(self.policy.deferred_collections.collect().values())
+
+    def test_thresholds(self):
+        self.settings['GC_DEFER'] = False
+        self.policy.apply()
+        self.assertEqual(gc.get_threshold(), (100, 10, 10))
+
+        self.policy.restore()
+        self.assertEqual(gc.get_threshold(), self.original)
+
+    def test_deferral_raises_the_threshold(self):
+        self.policy.apply()
+        self.assertEqual(gc.get_threshold(), (1000, 10, 10))
+        self.assertEqual(self.policy.thresholds, (100, 10, 10))
+
+    def test_collects_once_no_requests_are_in_flight(self):
+        first = self.policy.request_started()
+        second = self.policy.request_started()
+        make_garbage(200)
+
+        first()
+        self.assertEqual(self.deferred(), 0)
+        second()
+        self.assertEqual(self.deferred(), 1)
+        self.assertTrue(gc.get_count()[0] < 100)
+
+    def test_only_collects_when_due(self):
+        gc.collect()
+        self.policy.request_started()()
+        self.assertEqual(self.deferred(), 0)
+
+    def test_not_deferring(self):
+        self.settings['GC_DEFER'] = False
+        self.assertIsNone(self.policy.request_started())
+
+    @unittest.skipUnless(hasattr(gc, 'freeze'), "requires gc.freeze()")
+    def test_freeze(self):
+        self.assertFalse(self.policy.freeze())
+
+        self.settings['GC_FREEZE'] = True
+        self.assertTrue(self.policy.freeze())
+        self.assertTrue(gc.get_freeze_count() > 0)
+        self.assertFalse(self.policy.freeze())
+
+        self.policy.restore()
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+    @unittest.skipUnless(hasattr(gc, 'callbacks'), "requires gc.callbacks")
+    def test_pause_metrics(self):
+        self.policy.apply()
+        gc.collect()
+
+        # Pauses are only recorded once it's safe to take locks.
+        self.assertEqual(self.policy.pauses.collect(), {})
+        self.policy.record_pauses()
+        rendered = self.registry.render()
+        self.assertIn(b'hoboken_gc_pause_seconds_count{generation="2"}',
+                      rendered)
+
+        self.settings['METRICS'] = False
+        count = self.policy.pauses.collect()
+        gc.collect()
+        self.policy.record_pauses()
+        self.assertEqual(self.policy.pauses.collect(), count)
+
+    @unittest.skipUnless(hasattr(gc, 'callbacks'), "requires gc.callbacks")
+    def test_installed_only_when_active(self):
+        installed = gc_pauses.installed
+        gc_pauses.uninstall()
+        self.addCleanup(gc_pauses.install if installed else
+                        gc_pauses.uninstall)
+
+        for key in ('GC_THRESHOLDS', 'GC_DEFER', 'METRICS'):
+            self.settings[key] = None
+        policy = GCPolicy(self.settings, MetricsRegistry())
+        self.addCleanup(policy.restore)
+        self.assertFalse(policy.active)
+        policy.apply()
+        self.assertFalse(gc_pauses.installed)
+
+        policy.restore()
+        self.settings['METRICS'] = True
+        policy.apply()
+        self.assertTrue(gc_pauses.installed)
+
+
+class TestGCPolicyApplication(HobokenTestCase):
+    def after_setup(self):
+        self.addCleanup(gc.set_threshold, *gc.get_threshold())
+        self.addCleanup(self.app.gc_policy.restore)
+        self.thresholds = []
+
+        @self.app.get("/")
+        def index():
+            self.thresholds.append(gc.get_threshold())
+            make_garbage(200)
+            return 'done'
+
+        @self.app.get("/fail")
+        def fail():
+            raise ValueError("oops")
+
+        self.app.config['GC_DEFER'] = True
+        self.app.config['GC_THRESHOLDS'] = (100, 10, 10)
+
+    def deferred(self):
+        return self.app.metrics.get('hoboken_gc_deferred_collections_total')
+
+    def test_collection_is_deferred(self):
+        self.assert_body_is('done')
+        self.assertEqual(self.thresholds, [(1000, 10, 10)])
+        self.assertEqual(len(self.deferred().collect()), 1)
+        self.assertEqual(self.app.gc_policy.stats()['in_flight'], 0)
+
+    def test_errors_finish_the_request(self):
+        self.app.config['DEBUG'] = False
+        status, _ = self.call_app('/fail')
+        self.assertEqual(status, 500)
+        self.assertEqual(self.app.gc_policy.stats()['in_flight'], 0)
+
+    def test_introspection(self):
+        self.call_app('/')
+        stats = self.app.introspector.collect()['gc']['policy']
+        self.assertTrue(stats['deferring'])
+        self.assertEqual(stats['thresholds'], [100, 10, 10])
+
+    def test_freeze_gc(self):
+        freeze_gc(object())
+        freeze_gc(self.app)
+        self.assertFalse(self.app.gc_policy.frozen)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestGCPauses))
+    suite.addTest(unittest.makeSuite(TestGCPolicy))
+    suite.addTest(unittest.makeSuite(TestGCPolicyApplication))
+
+    return suite
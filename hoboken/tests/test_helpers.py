@@ -3,13 +3,17 @@ from __future__ import print_function
 from . import HobokenTestCase
 import os
 import sys
+import json
 import time
+import threading
 from hoboken.tests.compat import unittest
 import datetime
+from io import BytesIO
 
 from mock import patch, MagicMock
 
 from hoboken.application import Request
+from hoboken.helpers import conditional
 import hoboken.helpers
 
 
@@ -133,6 +137,78 @@ class TestETag(HobokenTestCase):
         self.assertEqual(resp.status_int, 412)
 
 
+class TestConditional(HobokenTestCase):
+    def after_setup(self):
+        self.calls = 0
+        self.version = b'v1'
+        self.time = datetime.datetime(year=2012, month=7, day=15)
+
+        @self.app.get("/etag/:name")
+        @conditional(etag=lambda req: self.version + req.urlvars['name'])
+        def etag_resource(name=None):
+            self.calls += 1
+            return b'resource ' + name
+
+        @self.app.put("/etag/:name")
+        @conditional(etag=lambda req: self.version + req.urlvars['name'])
+        def etag_update(name=None):
+            self.calls += 1
+            return b'updated'
+
+        @self.app.get("/modified")
+        @conditional(last_modified=lambda req: self.time)
+        def modified_resource():
+            self.calls += 1
+            return b'resource'
+
+        @self.app.get("/none")
+        @conditional(etag=lambda req: None)
+        def no_etag():
+            self.calls += 1
+            return b'resource'
+
+    def call_app(self, path, *args, **kwargs):
+        req = Request.build(path, *args, **kwargs)
+        return req.get_response(self.app)
+
+    def test_sets_etag(self):
+        resp = self.call_app("/etag/foo")
+        self.assertEqual(resp.etag, (b'v1foo', True))
+        self.assertEqual(resp.body, b'resource foo')
+        self.assertEqual(self.calls, 1)
+
+    def test_not_modified_skips_route(self):
+        resp = self.call_app("/etag/foo", headers={'If-None-Match': b'"v1foo"'})
+        self.assertEqual(resp.status_int, 304)
+        self.assertEqual(resp.body, b'')
+        self.assertEqual(self.calls, 0)
+
+    def test_modified_calls_route(self):
+        self.version = b'v2'
+        resp = self.call_app("/etag/foo", headers={'If-None-Match': b'"v1foo"'})
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(self.calls, 1)
+
+    def test_precondition_failed_skips_route(self):
+        resp = self.call_app("/etag/foo", method='PUT',
+                             headers={'If-Match': b'"v0foo"'})
+        self.assertEqual(resp.status_int, 412)
+        self.assertEqual(self.calls, 0)
+
+    def test_last_modified(self):
+        r = Request.build("/modified")
+        r.if_modified_since = datetime.datetime(year=2012, month=7, day=20)
+        resp = r.get_response(self.app)
+        self.assertEqual(resp.status_int, 304)
+        self.assertEqual(self.calls, 0)
+
+    def test_provider_can_skip(self):
+        resp = self.call_app("/none", headers={'If-None-Match': b'*'})
+        self.assertEqual(resp.status_int, 200)
+        self.assertIsNone(resp.etag)
+        self.assertEqual(self.calls, 1)
+
+
 class TestCacheControl(HobokenTestCase):
     def after_setup(self):
         @self.app.get("/resource")
@@ -208,6 +284,144 @@ class TestExpires(HobokenTestCase):
         self.assertEqual(resp.cache_control.max_age, 0)
 
 
+class TestCachedResponses(HobokenTestCase):
+    def after_setup(self):
+        self.calls = 0
+        self.fail = False
+
+        @self.app.get("/cached")
+        @self.app.cached(max_age=10, stale_while_revalidate=10,
+                         stale_if_error=20)
+        def cached():
+            if self.fail:
+                raise ValueError("regeneration failed")
+            self.calls += 1
+            return 'call {0}'.format(self.calls)
+
+        @self.app.get("/from_header")
+        @self.app.cached()
+        def from_header():
+            self.calls += 1
+            self.app.set_cache_control(max_age=10)
+            return b'from header'
+
+        @self.app.get("/uncacheable")
+        @self.app.cached()
+        def uncacheable():
+            self.calls += 1
+            return b'uncacheable'
+
+    def call_at(self, when, path="/cached"):
+        with patch('hoboken.cache._time') as time_func:
+            time_func.return_value = when
+            r = Request.build(path)
+            return r.get_response(self.app)
+
+    def test_will_cache(self):
+        self.assertEqual(self.call_at(1000).body, b'call 1')
+        resp = self.call_at(1005)
+        self.assertEqual(resp.body, b'call 1')
+        self.assertEqual(resp.headers['Age'], b'5')
+        self.assertEqual(self.calls, 1)
+
+    def test_policy_from_cache_control(self):
+        self.call_at(1000, "/from_header")
+        resp = self.call_at(1005, "/from_header")
+        self.assertEqual(resp.body, b'from header')
+        self.assertEqual(self.calls, 1)
+
+    def test_will_not_cache_without_max_age(self):
+        self.call_at(1000, "/uncacheable")
+        self.call_at(1001, "/uncacheable")
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_while_revalidate(self):
+        self.call_at(1000)
+
+        with patch.object(self.app, '_refresh_cached') as refresh:
+            resp = self.call_at(1015)
+
+        self.assertEqual(resp.body, b'call 1')
+        self.assertEqual(refresh.call_count, 1)
+
+    def test_stale_refresh_regenerates(self):
+        self.call_at(1000)
+
+        # Wait for the background refresh to finish.
+        def spawn(key, func, *args, **kwargs):
+            t = threading.Thread(target=func, args=args, kwargs=kwargs)
+            t.start()
+            t.join()
+            return True
+
+        with patch.object(self.app._cache_flights, 'spawn', spawn):
+            self.assertEqual(self.call_at(1015).body, b'call 1')
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.call_at(1016).body, b'call 2')
+
+    def test_expired_will_regenerate(self):
+        self.call_at(1000)
+        self.assertEqual(self.call_at(1025).body, b'call 2')
+
+    def test_stale_if_error(self):
+        self.call_at(1000)
+        self.fail = True
+        resp = self.call_at(1025)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.body, b'call 1')
+
+    def test_error_after_stale_if_error(self):
+        self.call_at(1000)
+        self.fail = True
+        resp = self.call_at(1035)
+        self.assertEqual(resp.status_int, 500)
+
+    def test_post_is_not_cached(self):
+        @self.app.post("/cached_post")
+        @self.app.cached(max_age=10)
+        def cached_post():
+            self.calls += 1
+            return b'posted'
+
+        for i in range(2):
+            r = Request.build("/cached_post", method='POST')
+            r.get_response(self.app)
+
+        self.assertEqual(self.calls, 2)
+
+
+class TestVaryAwareCaching(HobokenTestCase):
+    def after_setup(self):
+        self.calls = 0
+
+        @self.app.get("/negotiated")
+        @self.app.cached(max_age=10)
+        def negotiated():
+            self.calls += 1
+            if self.app.request.accepts_json:
+                return b'json'
+            return b'html'
+
+    def call_app(self, accept):
+        r = Request.build("/negotiated", headers={'Accept': accept})
+        return r.get_response(self.app)
+
+    def test_response_has_vary(self):
+        resp = self.call_app(b'application/json')
+        self.assertEqual(resp.vary, (b'Accept',))
+
+    def test_caches_each_representation(self):
+        self.assertEqual(self.call_app(b'application/json').body, b'json')
+        self.assertEqual(self.call_app(b'text/html').body, b'html')
+        self.assertEqual(self.call_app(b'application/json').body, b'json')
+        self.assertEqual(self.call_app(b'text/html').body, b'html')
+        self.assertEqual(self.calls, 2)
+
+        resp = self.call_app(b'text/html')
+        self.assertEqual(resp.vary, (b'Accept',))
+
+
 class TestRedirection(HobokenTestCase):
     def after_setup(self):
         self.app.debug = True
@@ -267,14 +481,140 @@ class TestShift(HobokenTestCase):
 
 
 
+class TestBatch(HobokenTestCase):
+    def after_setup(self):
+        self.threads = set()
+
+        @self.app.get("/item/:id")
+        def item(id):
+            self.threads.add(threading.current_thread())
+            auth = self.app.request.headers.get('Authorization', b'none')
+            self.app.response.headers['X-Id'] = id
+            return b'item ' + id + b' ' + auth
+
+        @self.app.post("/echo")
+        def echo():
+            return self.app.request.input_stream.read()
+
+        @self.app.get("/binary")
+        def binary():
+            return b'\xff\xfe'
+
+        @self.app.get("/slow")
+        def slow():
+            time.sleep(0.2)
+            return b'slow'
+
+        @self.app.get("/gathered/:id")
+        def gathered(id):
+            parts = self.app.gather(lambda: b'a', lambda: b'b')
+            return id + b' ' + b''.join(parts)
+
+        self.app.add_batch_route('/batch', max_requests=5, max_body=1024,
+                                 concurrency=3)
+
+    def call_batch(self, items, headers=None, path="/batch"):
+        body = json.dumps(items).encode('utf-8')
+        req = Request.build(path, method='POST', headers=headers)
+        req.environ['wsgi.input'] = BytesIO(body)
+        req.environ['CONTENT_LENGTH'] = str(len(body))
+        return req.get_response(self.app)
+
+    def responses(self, resp):
+        self.assertEqual(resp.status_int, 200)
+        return json.loads(resp.body.decode('utf-8'))['responses']
+
+    def test_runs_subrequests_in_order(self):
+        resp = self.call_batch([{'path': '/item/%d' % i} for i in range(5)])
+        results = self.responses(resp)
+
+        self.assertEqual([r['status'] for r in results], [200] * 5)
+        self.assertEqual([r['body'] for r in results],
+                         ['item %d none' % i for i in range(5)])
+        self.assertIn(['X-Id', '3'], results[3]['headers'])
+
+        # The sub-requests aren't run on the request's own thread.
+        self.assertNotIn(threading.current_thread(), self.threads)
+
+    def test_gather_in_subrequests(self):
+        # Every pool thread is running a sub-request that gathers, so the
+        # gathered functions can't wait for a free thread.
+        self.app.config['TASK_THREADS'] = 2
+        results = self.responses(self.call_batch([
+            {'path': '/gathered/1'}, {'path': '/gathered/2'},
+        ]))
+
+        self.assertEqual([r['body'] for r in results], ['1 ab', '2 ab'])
+
+    def test_subrequest_details(self):
+        results = self.responses(self.call_batch({'requests': [
+            {'method': 'post', 'path': '/echo', 'body': 'hello'},
+            {'path': '/missing'},
+            {'path': '/binary'},
+        ]}))
+
+        self.assertEqual(results[0]['body'], 'hello')
+        self.assertEqual(results[1]['status'], 404)
+        self.assertEqual(results[2]['encoding'], 'base64')
+        self.assertEqual(results[2]['body'], '//4=')
+
+    def test_headers_are_inherited(self):
+        results = self.responses(self.call_batch([
+            {'path': '/item/1'},
+            {'path': '/item/2', 'headers': {'Authorization': 'other'}},
+        ], headers={'Authorization': 'token'}))
+
+        self.assertEqual(results[0]['body'], 'item 1 token')
+        self.assertEqual(results[1]['body'], 'item 2 other')
+
+    def test_limits(self):
+        resp = self.call_batch([{'path': '/item/1'}] * 6)
+        self.assertEqual(resp.status_int, 413)
+
+        resp = self.call_batch([{'path': '/item/' + 'x' * 2000}])
+        self.assertEqual(resp.status_int, 413)
+
+    def test_invalid_batches(self):
+        self.assertEqual(self.call_batch({'foo': 1}).status_int, 400)
+        self.assertEqual(self.call_batch([{'method': 'GET'}]).status_int, 400)
+        self.assertEqual(self.call_batch([{'path': 'relative'}]).status_int,
+                         400)
+
+        resp = self.call_batch([{'path': '/batch', 'method': 'POST',
+                                 'body': '[]'}])
+        self.assertEqual(self.responses(resp)[0]['status'], 400)
+
+    def test_deadline(self):
+        self.app.config['REQUEST_TIMEOUT'] = 0.05
+        results = self.responses(self.call_batch([
+            {'path': '/item/1'}, {'path': '/slow'},
+        ]))
+
+        self.assertEqual(results[0]['status'], 200)
+        self.assertEqual(results[1]['status'], 504)
+
+    def test_timeout(self):
+        self.app.add_batch_route('/quick', timeout=0.05)
+        results = self.responses(self.call_batch([
+            {'path': '/item/1'}, {'path': '/slow'},
+        ], path='/quick'))
+
+        self.assertEqual(results[0]['status'], 200)
+        self.assertEqual(results[1]['status'], 504)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestLastModified))
     suite.addTest(unittest.makeSuite(TestETag))
+    suite.addTest(unittest.makeSuite(TestConditional))
     suite.addTest(unittest.makeSuite(TestCacheControl))
     suite.addTest(unittest.makeSuite(TestExpires))
+    suite.addTest(unittest.makeSuite(TestCachedResponses))
+    suite.addTest(unittest.makeSuite(TestVaryAwareCaching))
     suite.addTest(unittest.makeSuite(TestRedirection))
     suite.addTest(unittest.makeSuite(TestShift))
+    suite.addTest(unittest.makeSuite(TestBatch))
 
     return suite
 
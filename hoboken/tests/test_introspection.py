@@ -0,0 +1,106 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import gc
+import json
+import threading
+from hoboken.tests.compat import unittest
+
+from hoboken.application import Request
+from hoboken.cache import MemoryCache
+from hoboken.introspection import GCPauses, cache_stats
+
+
+class TestHelpers(unittest.TestCase):
+    def test_cache_stats(self):
+        cache = MemoryCache(max_entries=10)
+        cache.set(b'a', 1)
+        cache.get(b'a')
+        cache.get(b'b')
+        self.assertEqual(cache_stats(cache), {
+            'type': 'MemoryCache', 'entries': 1, 'max_entries': 10,
+            'hits': 1, 'misses': 1, 'hit_rate': 0.5,
+        })
+        self.assertEqual(cache_stats(object()), {'type': 'object'})
+
+    @unittest.skipIf(not hasattr(gc, 'callbacks'), "requires gc.callbacks")
+    def test_gc_pauses(self):
+        pauses = GCPauses()
+        pauses.install()
+        self.addCleanup(pauses.uninstall)
+        gc.collect()
+
+        stats = pauses.stats()
+        self.assertEqual(stats['collections'][2], 1)
+        self.assertTrue(stats['total_pause_seconds'] > 0)
+
+
+class TestIntrospector(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['REQUEST_TIMING'] = True
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        @self.app.get("/wait/:id")
+        def wait(id):
+            self.started.set()
+            self.release.wait()
+            return 'done'
+
+        @self.app.get("/other")
+        def other():
+            return 'other'
+
+        self.app.mount('/_status', self.app.introspector)
+
+    def status(self):
+        status, body = self.call_app('/_status')
+        self.assertEqual(status, 200)
+        return json.loads(body)
+
+    def test_report(self):
+        data = self.status()
+        self.assertEqual(data['app'], self.app.name)
+        self.assertEqual(data['routes']['count'], 2)
+        self.assertEqual(data['routes']['by_method']['GET'], 2)
+        self.assertEqual(data['routes']['compiled'], 2)
+        self.assertEqual(data['routes']['mounts'], 1)
+        self.assertEqual(data['caches']['response_cache']['type'],
+                         'MemoryCache')
+        self.assertIn('counts', data['gc'])
+        self.assertTrue(data['process']['uptime'] > 0)
+        self.assertEqual(data['in_flight'], [])
+
+    def test_in_flight_requests(self):
+        results = []
+        t = threading.Thread(target=lambda: results.append(
+            Request.build('/wait/1').get_response(self.app)))
+        t.start()
+        self.assertTrue(self.started.wait(5))
+
+        try:
+            in_flight = self.app.introspector.in_flight()
+        finally:
+            self.release.set()
+            t.join()
+
+        self.assertEqual(len(in_flight), 1)
+        self.assertEqual(in_flight[0]['thread_id'], t.ident)
+        self.assertEqual(in_flight[0]['route'], '/wait/:id')
+        self.assertEqual(in_flight[0]['method'], 'GET')
+        self.assertTrue(in_flight[0]['age'] >= 0)
+
+    def test_pools(self):
+        self.app.background.submit(lambda: None)
+        self.app.background.drain(5)
+        names = [pool['name'] for pool in self.status()['pools']]
+        self.assertIn(self.app.background.name, names)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestHelpers))
+    suite.addTest(unittest.makeSuite(TestIntrospector))
+
+    return suite
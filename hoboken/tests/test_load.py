@@ -0,0 +1,147 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import os
+import json
+import random
+from hoboken.tests.compat import unittest
+
+from hoboken.application import Request, halt
+from hoboken.load import (LoadGenerator, RequestTemplate, choice, integers,
+                          run, zipf)
+from hoboken.timing import clock
+
+
+class TestDistributions(unittest.TestCase):
+    def test_choice(self):
+        rng = random.Random(1)
+        pick = choice(['a', 'b'])
+        self.assertEqual(set(pick(rng) for i in range(100)), set(['a', 'b']))
+
+        pick = choice(['a', 'b'], weights=[1, 0])
+        self.assertEqual(set(pick(rng) for i in range(100)), set(['a']))
+
+    def test_integers(self):
+        rng = random.Random(1)
+        pick = integers(1, 3)
+        self.assertEqual(set(pick(rng) for i in range(100)), set([1, 2, 3]))
+
+    def test_zipf(self):
+        rng = random.Random(1)
+        pick = zipf(range(10))
+        counts = [0] * 10
+        for i in range(2000):
+            counts[pick(rng)] += 1
+
+        self.assertTrue(counts[0] > counts[1] > counts[9])
+
+    def test_weights_must_match(self):
+        with self.assertRaises(ValueError):
+            choice(['a', 'b'], weights=[1])
+
+
+class TestRequestTemplate(unittest.TestCase):
+    def test_build(self):
+        template = RequestTemplate(
+            '/users/{id}', method='PUT', query={'q': '{term}', 'n': 5},
+            headers={'X-Term': '{term}'}, body='name={term}',
+            params={'id': 7, 'term': choice(['foo'])})
+        req = Request(template.build(random.Random(1)))
+
+        self.assertEqual(req.method, 'PUT')
+        self.assertEqual(req.path_info, b'/users/7')
+        self.assertEqual(req.environ['QUERY_STRING'], 'n=5&q=foo')
+        self.assertEqual(req.environ['HTTP_X_TERM'], 'foo')
+        self.assertEqual(req.input_stream.read(), b'name=foo')
+        self.assertEqual(req.environ['CONTENT_LENGTH'], '8')
+
+    def test_body_function(self):
+        template = RequestTemplate('/', method='POST', body=json.dumps,
+                                   params={'id': integers(1, 1)})
+        environ = template.build(random.Random(1))
+        self.assertEqual(json.loads(environ['wsgi.input'].read().decode()),
+                         {'id': 1})
+
+    def test_generator_is_repeatable(self):
+        generator = LoadGenerator([
+            RequestTemplate('/a/{n}', params={'n': integers(1, 1000)}),
+            RequestTemplate('/b/{n}', params={'n': integers(1, 1000)}),
+        ], seed=42)
+
+        def paths():
+            return [e['PATH_INFO'] for e in generator.environs(20)]
+
+        self.assertEqual(paths(), paths())
+        self.assertEqual(len(set(p[:3] for p in paths())), 2)
+
+    def test_weights(self):
+        generator = LoadGenerator([
+            RequestTemplate('/a', weight=3),
+            RequestTemplate('/b', weight=1),
+        ], seed=1)
+        paths = [e['PATH_INFO'] for e in generator.environs(1000)]
+        self.assertTrue(650 < paths.count('/a') < 850)
+
+    def test_requests_or_duration_is_required(self):
+        with self.assertRaises(ValueError):
+            LoadGenerator([RequestTemplate('/')]).environs()
+
+
+class TestRun(HobokenTestCase):
+    def after_setup(self):
+        @self.app.get("/users/:id")
+        def user(id):
+            if int(id) > 8:
+                halt(code=404)
+            return 'user'
+
+        @self.app.get("/fail")
+        def fail():
+            raise ValueError("oops")
+
+        self.templates = [
+            RequestTemplate('/users/{id}', params={'id': integers(1, 10)},
+                            weight=4),
+            RequestTemplate('/fail'),
+        ]
+
+    def test_threads(self):
+        report = run(self.app, self.templates, requests=200, threads=4,
+                     seed=1)
+
+        self.assertEqual(report.count, 200)
+        self.assertEqual(sum(report.statuses.values()), 200)
+        self.assertEqual(set(report.statuses), set([200, 404, 500]))
+        self.assertEqual(set(report.error_breakdown()), set(['404', '500']))
+        self.assertTrue(report.throughput > 0)
+        self.assertIn('Histogram:', report.format(histogram=True))
+
+    def test_duration(self):
+        start = clock()
+        report = run(self.app, self.templates, duration=0.1, threads=2)
+        self.assertTrue(0.1 <= clock() - start < 5)
+        self.assertTrue(report.count > 0)
+
+    def test_rate(self):
+        report = run(self.app, self.templates, requests=6, rate=100)
+        self.assertEqual(report.count, 6)
+        self.assertTrue(report.elapsed >= 0.045)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "requires os.fork()")
+    def test_processes(self):
+        report = run(self.app, self.templates, requests=101, threads=2,
+                     processes=3, seed=1)
+
+        self.assertEqual(report.count, 101)
+        self.assertEqual(sum(report.statuses.values()), 101)
+        self.assertTrue(all(isinstance(s, int) for s in report.statuses))
+        self.assertTrue(report.elapsed > 0)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDistributions))
+    suite.addTest(unittest.makeSuite(TestRequestTemplate))
+    suite.addTest(unittest.makeSuite(TestRun))
+
+    return suite
@@ -0,0 +1,170 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import re
+import threading
+from hoboken.tests.compat import unittest
+
+from hoboken.application import Request, halt
+from hoboken.metrics import MetricsRegistry, route_label
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_merges_threads(self):
+        counter = self.registry.counter('things_total', 'Things.', ('kind',))
+
+        def work():
+            for i in range(100):
+                counter.inc(('a',))
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.inc(('b',), 5)
+
+        self.assertEqual(counter.collect(), {('a',): 400, ('b',): 5})
+
+    def test_exited_threads_are_retired(self):
+        hist = self.registry.histogram('latency', 'Latency.',
+                                       buckets=(0.1, 1.0))
+
+        for i in range(10):
+            t = threading.Thread(target=hist.observe, args=(0.5,))
+            t.start()
+            t.join()
+        hist.observe(0.05)
+
+        self.assertEqual(len(hist._shards), 1)
+        self.assertEqual(hist.collect(), {(): [1, 10, 0, 5.05]})
+
+    def test_gauge_across_threads(self):
+        gauge = self.registry.gauge('in_flight', 'In flight.')
+        gauge.inc()
+        t = threading.Thread(target=gauge.dec)
+        t.start()
+        t.join()
+        self.assertEqual(gauge.collect(), {(): 0})
+
+    def test_gauge_set(self):
+        gauge = self.registry.gauge('size', 'Size.', ('kind',))
+        t = threading.Thread(target=gauge.set, args=(('a',), 10))
+        t.start()
+        t.join()
+        gauge.set(('a',), 3)
+        gauge.set(('b',), -2)
+        self.assertEqual(gauge.collect(), {('a',): 3, ('b',): -2})
+
+    def test_histogram(self):
+        hist = self.registry.histogram('latency', 'Latency.',
+                                       buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5):
+            hist.observe(value)
+
+        self.assertEqual(hist.collect(), {(): [2, 1, 1, 5.65]})
+
+    def test_same_name_returns_same_metric(self):
+        a = self.registry.counter('things_total', 'Things.')
+        self.assertIs(self.registry.counter('things_total', 'Things.'), a)
+        self.assertRaises(ValueError, self.registry.gauge, 'things_total',
+                          'Things.')
+
+    def test_render(self):
+        self.registry.counter('things_total', 'Things.', ('kind',)).inc(
+            ('a "quoted" kind',))
+        hist = self.registry.histogram('latency', 'Latency.',
+                                       buckets=(0.5,))
+        hist.observe(0.25)
+
+        self.assertEqual(self.registry.render().decode('utf-8'), '\n'.join([
+            '# HELP things_total Things.',
+            '# TYPE things_total counter',
+            'things_total{kind="a \\"quoted\\" kind"} 1',
+            '# HELP latency Latency.',
+            '# TYPE latency histogram',
+            'latency_bucket{le="0.5"} 1',
+            'latency_bucket{le="+Inf"} 1',
+            'latency_sum 0.25',
+            'latency_count 1',
+            '',
+        ]))
+
+    def test_wsgi_app(self):
+        resp = Request.build('/').get_response(self.registry)
+        self.assertEqual(resp.status_int, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith(
+            b'text/plain; version=0.0.4'))
+
+    def test_route_label(self):
+        self.assertEqual(route_label(None), '<unmatched>')
+
+
+class TestRequestMetrics(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['METRICS'] = True
+
+        @self.app.get("/users/:id")
+        def user(id):
+            return 'user'
+
+        @self.app.get("/forbidden")
+        def forbidden():
+            halt(code=403)
+
+        self.app.mount('/metrics', self.app.metrics)
+
+    def value(self, name):
+        return self.app.metrics.get(name).collect()
+
+    def test_labels_use_route_pattern(self):
+        for i in range(3):
+            self.call_app('/users/{0}'.format(i))
+        self.call_app('/forbidden')
+        self.call_app('/missing')
+
+        self.assertEqual(self.value('hoboken_requests_total'), {
+            ('GET', '/users/:id'): 3,
+            ('GET', '/forbidden'): 1,
+            ('GET', '<unmatched>'): 1,
+        })
+        self.assertEqual(self.value('hoboken_responses_total'), {
+            ('/users/:id', '2xx'): 3,
+            ('/forbidden', '4xx'): 1,
+            ('<unmatched>', '4xx'): 1,
+        })
+        self.assertEqual(self.value('hoboken_requests_in_flight'), {(): 0})
+
+    def test_unsupported_methods(self):
+        self.call_app('/users/1', method='BREW')
+        self.call_app('/users/1', method='POST')
+
+        self.assertEqual(self.value('hoboken_requests_total'), {
+            ('other', '<unmatched>'): 1,
+            ('POST', '<unmatched>'): 1,
+        })
+
+    def test_endpoint(self):
+        self.call_app('/users/1')
+        status, body = self.call_app('/metrics')
+        self.assertEqual(status, 200)
+        self.assertIn('hoboken_requests_total{method="GET",route="/users/:id"}'
+                      ' 1', body)
+        self.assertTrue(re.search(r'hoboken_request_duration_seconds_count'
+                                  r'\{route="/users/:id"\} 1', body))
+
+    def test_disabled(self):
+        self.app.config['METRICS'] = False
+        self.call_app('/users/1')
+        self.assertEqual(self.value('hoboken_requests_total'), {})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMetrics))
+    suite.addTest(unittest.makeSuite(TestRequestMetrics))
+
+    return suite
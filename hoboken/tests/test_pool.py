@@ -0,0 +1,194 @@
+from __future__ import with_statement, print_function
+
+import os
+import time
+import threading
+from hoboken.tests.compat import unittest
+
+from mock import patch
+
+from hoboken.pool import PoolClosed, PoolFull, TaskTimeout, ThreadPool, \
+    drain_all, _drain_at_exit
+
+
+class TestThreadPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPool(threads=2, queue_size=4)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_runs_work(self):
+        results = []
+        for i in range(4):
+            self.assertTrue(self.pool.submit(results.append, i))
+
+        self.assertTrue(self.pool.drain(5))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['submitted'], 4)
+        self.assertEqual(stats['completed'], 4)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_threads_start_lazily(self):
+        self.assertEqual(self.pool.stats()['threads'], 0)
+        self.pool.submit(lambda: None)
+        self.assertEqual(self.pool.stats()['threads'], 2)
+
+    def test_failures_are_counted(self):
+        def fail():
+            raise ValueError("failure")
+
+        self.pool.submit(fail)
+        self.pool.submit(lambda: None)
+        self.pool.drain(5)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['completed'], 1)
+
+    def test_rejects_when_full(self):
+        release = threading.Event()
+        for i in range(2):
+            self.pool.submit(release.wait)
+
+        # Wait for both threads to be busy, so the queue is empty.
+        for i in range(100):
+            if self.pool.stats()['busy'] == 2:
+                break
+            time.sleep(0.01)
+
+        for i in range(4):
+            self.assertTrue(self.pool.submit(lambda: None))
+        self.assertFalse(self.pool.submit(lambda: None))
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['queue_depth'], 4)
+        self.assertEqual(stats['rejected'], 1)
+
+        release.set()
+        self.assertTrue(self.pool.drain(5))
+
+    def test_drain_timeout(self):
+        release = threading.Event()
+        self.pool.submit(release.wait)
+
+        self.assertFalse(self.pool.drain(0.05))
+        release.set()
+        self.assertTrue(self.pool.drain(5))
+
+    def test_drain_all(self):
+        results = []
+        self.pool.submit(time.sleep, 0.05)
+        self.pool.submit(results.append, 1)
+
+        self.assertTrue(drain_all(5))
+        self.assertEqual(results, [1])
+
+    def test_shutdown_finishes_queued_work(self):
+        results = []
+        self.pool.submit(time.sleep, 0.05)
+        for i in range(3):
+            self.pool.submit(results.append, i)
+
+        self.assertTrue(self.pool.shutdown())
+        self.assertEqual(results, [0, 1, 2])
+        self.assertRaises(PoolClosed, self.pool.submit, lambda: None)
+
+    def test_exit_drain_is_bounded(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.pool.submit(release.wait)
+
+        with patch('hoboken.pool.EXIT_DRAIN_TIMEOUT', 0.05):
+            start = time.time()
+            _drain_at_exit()
+            self.assertLess(time.time() - start, 5)
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "requires fork()")
+    def test_restarts_after_fork(self):
+        self.pool.submit(lambda: None)
+        self.pool.drain(5)
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                results = []
+                self.pool.submit(results.append, 1)
+                if self.pool.drain(5) and results == [1] and \
+                        self.pool.stats()['submitted'] == 1:
+                    code = 0
+            finally:
+                os._exit(code)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+
+
+class TestTasks(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPool(threads=1, queue_size=1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_result(self):
+        task = self.pool.run(lambda a, b: a + b, 1, b=2)
+        self.assertEqual(task.result(5), 3)
+        self.assertTrue(task.done())
+        self.assertTrue(task.elapsed >= 0)
+
+    def test_in_worker(self):
+        other = ThreadPool(threads=1)
+        self.addCleanup(other.shutdown)
+
+        self.assertFalse(self.pool.in_worker())
+        self.assertTrue(self.pool.run(self.pool.in_worker).result(5))
+        self.assertFalse(other.run(self.pool.in_worker).result(5))
+
+    def test_run_now(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        running = self.pool.run_now(release.wait)
+
+        # The only thread is busy, so nothing else can start.
+        self.assertRaises(PoolFull, self.pool.run_now, lambda: 1)
+        release.set()
+        running.result(5)
+        self.assertTrue(self.pool.drain(5))
+        self.assertEqual(self.pool.run_now(lambda: 1).result(5), 1)
+
+    def test_exception_is_reraised(self):
+        def fail():
+            raise ValueError("failure")
+
+        task = self.pool.run(fail)
+        self.assertRaises(ValueError, task.result, 5)
+
+    def test_timeout_and_cancel(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        running = self.pool.run(release.wait)
+
+        # Wait for the worker to take the first task off the queue.
+        for i in range(500):
+            if running.started is not None:
+                break
+            time.sleep(0.01)
+        queued = self.pool.run(lambda: 1)
+
+        self.assertRaises(TaskTimeout, running.result, 0.01)
+        self.assertRaises(PoolFull, self.pool.run, lambda: 1)
+
+        self.assertTrue(queued.cancel())
+        self.assertFalse(running.cancel())
+        self.assertRaises(TaskTimeout, queued.result)
+
+        release.set()
+        self.assertTrue(running.result(5))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestThreadPool))
+    suite.addTest(unittest.makeSuite(TestTasks))
+
+    return suite
@@ -0,0 +1,176 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import os
+import shutil
+import signal
+import tempfile
+import pstats
+from hoboken.tests.compat import unittest
+
+from mock import patch
+
+from hoboken.application import Request
+from hoboken.profiling import RouteProfiler
+
+
+def work():
+    return sum(range(1000))
+
+
+class DummyMatcher(object):
+    def __init__(self, path):
+        self.path = path
+
+
+class DummyRoute(object):
+    def __init__(self, path):
+        self.matcher = DummyMatcher(path)
+
+
+class TestRouteProfiler(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'PROFILE_RATE': 1, 'PROFILE_BUDGET': 1}
+        self.profiler = RouteProfiler(self.settings)
+        self.route = DummyRoute('/work')
+
+    def call(self, route=None):
+        return self.profiler.call(route or self.route, work, (), {})
+
+    def test_profiles_sampled_calls(self):
+        self.assertEqual(self.call(), work())
+        self.call()
+
+        self.assertEqual(self.profiler.samples, {'/work': 2})
+        self.assertIn('work', self.profiler.report())
+        self.assertTrue(self.profiler.profiled_time > 0)
+
+    def test_rate(self):
+        self.settings['PROFILE_RATE'] = 0.5
+        with patch('hoboken.profiling.random.random', return_value=0.6):
+            self.call()
+        self.assertEqual(self.profiler.samples, {})
+
+        with patch('hoboken.profiling.random.random', return_value=0.4):
+            self.call()
+        self.assertEqual(self.profiler.samples, {'/work': 1})
+
+    def test_per_route_rate(self):
+        self.settings['PROFILE_RATE'] = 0
+        self.settings['PROFILE_ROUTES'] = {'/other': 1}
+        self.call()
+        self.call(DummyRoute('/other'))
+
+        self.assertEqual(self.profiler.samples, {'/other': 1})
+        self.assertTrue(self.profiler.total_time > self.profiler.profiled_time)
+
+    def test_budget(self):
+        self.settings['PROFILE_BUDGET'] = 0.5
+        self.call()
+        self.assertEqual(self.profiler.samples, {'/work': 1})
+
+        # Everything so far was profiled, so the budget is used up until
+        # enough unprofiled time has been spent.
+        self.call()
+        self.assertEqual(self.profiler.samples, {'/work': 1})
+
+        self.profiler.total_time += self.profiler.profiled_time * 4
+        self.call()
+        self.assertEqual(self.profiler.samples, {'/work': 2})
+
+    def test_one_call_at_a_time(self):
+        self.profiler._active.acquire()
+        try:
+            self.call()
+        finally:
+            self.profiler._active.release()
+        self.assertEqual(self.profiler.samples, {})
+
+    def test_exceptions_are_propagated(self):
+        def fail():
+            raise ValueError("failure")
+
+        self.assertRaises(ValueError, self.profiler.call, self.route, fail,
+                          (), {})
+        self.assertEqual(self.profiler.samples, {'/work': 1})
+        self.call()
+
+    def test_dump_and_signal(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.call()
+
+        paths = self.profiler.dump(directory)
+        self.assertEqual(paths, [os.path.join(directory, 'route_work.pstats')])
+        self.assertTrue(pstats.Stats(paths[0]).total_calls > 0)
+        os.unlink(paths[0])
+
+        if not hasattr(signal, 'SIGUSR2'):
+            return
+        previous = signal.getsignal(signal.SIGUSR2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+        self.profiler.install_signal_handler(directory)
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertEqual(os.listdir(directory), ['route_work.pstats'])
+
+    def test_reset(self):
+        self.call()
+        self.profiler.reset()
+        self.assertEqual(self.profiler.samples, {})
+        self.assertEqual(self.profiler.total_time, 0)
+
+
+class TestApplicationProfiling(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['PROFILE_BUDGET'] = 1
+
+        @self.app.get("/users/:id")
+        def user(id):
+            return 'user ' + str(work())
+
+        @self.app.get("/other")
+        def other():
+            return 'other'
+
+        self.app.mount('/_profile', self.app.profiler)
+
+    def test_disabled_by_default(self):
+        self.assert_body_is('user 499500', '/users/1')
+        self.assertEqual(self.app.profiler.total_time, 0)
+
+    def test_profiles_routes(self):
+        self.app.config['PROFILE_RATE'] = 1
+        self.call_app('/users/1')
+        self.call_app('/users/2')
+        self.call_app('/missing')
+        self.assertEqual(self.app.profiler.samples, {'/users/:id': 2})
+
+        status, body = self.call_app('/_profile')
+        self.assertEqual(status, 200)
+        self.assertIn('/users/:id (2 samples)', body)
+        self.assertIn('work', body)
+
+    def test_invalid_sort(self):
+        def get(query):
+            req = Request.build('/_profile', query_string=query)
+            return req.get_response(self.app)
+
+        self.assertEqual(get('sort=tottime').status_int, 200)
+
+        resp = get('sort=bogus')
+        self.assertEqual(resp.status_int, 400)
+        self.assertIn(b'cumulative', resp.body)
+
+    def test_route_rates(self):
+        self.app.config['PROFILE_ROUTES'] = {'/other': 1}
+        self.call_app('/users/1')
+        self.call_app('/other')
+        self.assertEqual(self.app.profiler.samples, {'/other': 1})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRouteProfiler))
+    suite.addTest(unittest.makeSuite(TestApplicationProfiling))
+
+    return suite
@@ -0,0 +1,422 @@
+from __future__ import with_statement, print_function
+
+import os
+import time
+import signal
+import socket
+import threading
+from hoboken.tests.compat import unittest, slow_test
+
+from hoboken.serving import HTTPConnection, HTTPParseError, PreforkServer, \
+    ThreadedServer, build_environ, get_rss, parse_chunk_size, \
+    parse_header_line, parse_request_line
+
+
+def echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    out = '{0} {1} {2}'.format(environ['REQUEST_METHOD'],
+                               environ['PATH_INFO'],
+                               environ['QUERY_STRING']).encode('latin-1')
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [out, b'|', body]
+
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+
+    def gen():
+        yield b'one'
+        yield b'two'
+    return gen()
+
+
+def failing_app(environ, start_response):
+    raise ValueError("failure")
+
+
+def read_response(f, head=False):
+    """
+    Read a single response from a file object, returning a tuple of (status
+    line, headers dict, body).
+    """
+    status = f.readline().rstrip(b'\r\n')
+    headers = {}
+    while True:
+        line = f.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.rstrip(b'\r\n').partition(b': ')
+        headers[name.lower()] = value
+
+    if head:
+        body = b''
+    elif b'content-length' in headers:
+        body = f.read(int(headers[b'content-length']))
+    elif headers.get(b'transfer-encoding') == b'chunked':
+        parts = []
+        while True:
+            size = int(f.readline().strip(), 16)
+            if size == 0:
+                f.readline()
+                break
+            parts.append(f.read(size))
+            f.readline()
+        body = b''.join(parts)
+    else:
+        body = f.read()
+
+    return status, headers, body
+
+
+class TestParsing(unittest.TestCase):
+    def test_request_line(self):
+        self.assertEqual(parse_request_line(b'GET /foo HTTP/1.1\r\n'),
+                         (b'GET', b'/foo', b'HTTP/1.1'))
+
+    def test_invalid_request_line(self):
+        self.assertRaises(HTTPParseError, parse_request_line, b'GET /foo\r\n')
+        try:
+            parse_request_line(b'GET / HTTP/2.0\r\n')
+        except HTTPParseError as e:
+            self.assertEqual(e.status, 505)
+        else:                   # pragma: no cover
+            self.fail("No exception raised")
+
+    def test_header_line(self):
+        self.assertEqual(parse_header_line(b'Content-Type:  text/html \r\n'),
+                         (b'CONTENT-TYPE', b'text/html'))
+        self.assertRaises(HTTPParseError, parse_header_line, b'Bad\r\n')
+
+    def test_chunk_size(self):
+        self.assertEqual(parse_chunk_size(b'1a\r\n'), 26)
+        self.assertEqual(parse_chunk_size(b'A;name=value\r\n'), 10)
+        for line in (b'-3\r\n', b'+5\r\n', b'0x10\r\n', b'1_0\r\n',
+                     b'\r\n'):
+            self.assertRaises(HTTPParseError, parse_chunk_size, line)
+
+    def test_build_environ(self):
+        headers = [(b'CONTENT-TYPE', b'text/plain'), (b'X-FOO', b'a'),
+                   (b'X-FOO', b'b')]
+        env = build_environ(b'GET', b'/a%20b?x=1', b'HTTP/1.1', headers,
+                            None, ('1.2.3.4', 5678), ('localhost', 80))
+
+        self.assertEqual(env['PATH_INFO'], '/a b')
+        self.assertEqual(env['QUERY_STRING'], 'x=1')
+        self.assertEqual(env['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(env['HTTP_X_FOO'], 'a,b')
+        self.assertEqual(env['REMOTE_ADDR'], '1.2.3.4')
+        self.assertEqual(env['SERVER_PORT'], '80')
+
+
+class TestHTTPConnection(unittest.TestCase):
+    def serve(self, app, data, keepalive_timeout=1.0):
+        server, client = socket.socketpair()
+        conn = HTTPConnection(app, server, ('127.0.0.1', 1234),
+                              ('localhost', 80),
+                              keepalive_timeout=keepalive_timeout)
+        t = threading.Thread(target=conn.handle)
+        t.start()
+
+        client.sendall(data)
+        client.shutdown(socket.SHUT_WR)
+        f = client.makefile('rb')
+        self.addCleanup(f.close)
+        self.addCleanup(client.close)
+        self.addCleanup(t.join)
+        return f
+
+    def test_simple_request(self):
+        f = self.serve(echo_app, b'GET /foo?a=b HTTP/1.1\r\nHost: x\r\n\r\n')
+        status, headers, body = read_response(f)
+
+        self.assertEqual(status, b'HTTP/1.1 200 OK')
+        self.assertEqual(headers[b'content-length'], b'13')
+        self.assertIn(b'date', headers)
+        self.assertEqual(body, b'GET /foo a=b|')
+
+    def test_pipelined_requests(self):
+        f = self.serve(echo_app,
+                       b'POST /one HTTP/1.1\r\nContent-Length: 3\r\n\r\nabc'
+                       b'GET /two HTTP/1.1\r\n\r\n')
+
+        self.assertEqual(read_response(f)[2], b'POST /one |abc')
+        self.assertEqual(read_response(f)[2], b'GET /two |')
+
+    def test_chunked_request_body(self):
+        f = self.serve(echo_app,
+                       b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                       b'3\r\nabc\r\n2;ext=1\r\nde\r\n0\r\n\r\n'
+                       b'GET /next HTTP/1.1\r\n\r\n')
+
+        self.assertEqual(read_response(f)[2], b'POST / |abcde')
+        self.assertEqual(read_response(f)[2], b'GET /next |')
+
+    def test_invalid_chunk_size(self):
+        f = self.serve(echo_app,
+                       b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                       b'-3\r\nabc\r\n0\r\n\r\n')
+
+        status, headers, body = read_response(f)
+        self.assertEqual(status, b'HTTP/1.1 400 Bad Request')
+        self.assertEqual(f.read(), b'')
+
+    def test_streaming_response_is_chunked(self):
+        f = self.serve(streaming_app, b'GET / HTTP/1.1\r\n\r\n')
+        status, headers, body = read_response(f)
+
+        self.assertEqual(headers[b'transfer-encoding'], b'chunked')
+        self.assertEqual(body, b'onetwo')
+
+    def test_streaming_response_on_http10_closes(self):
+        f = self.serve(streaming_app, b'GET / HTTP/1.0\r\n\r\n')
+        status, headers, body = read_response(f)
+
+        self.assertEqual(headers[b'connection'], b'close')
+        self.assertEqual(body, b'onetwo')
+
+    def test_http10_keep_alive(self):
+        f = self.serve(echo_app,
+                       b'GET /a HTTP/1.0\r\nConnection: keep-alive\r\n\r\n'
+                       b'GET /b HTTP/1.0\r\n\r\n')
+
+        status, headers, body = read_response(f)
+        self.assertEqual(headers[b'connection'], b'keep-alive')
+        self.assertEqual(body, b'GET /a |')
+
+        status, headers, body = read_response(f)
+        self.assertEqual(headers[b'connection'], b'close')
+        self.assertEqual(body, b'GET /b |')
+
+    def test_keep_alive_disabled(self):
+        f = self.serve(echo_app, b'GET /a HTTP/1.1\r\n\r\n'
+                                 b'GET /b HTTP/1.1\r\n\r\n',
+                       keepalive_timeout=None)
+
+        status, headers, body = read_response(f)
+        self.assertEqual(headers[b'connection'], b'close')
+        self.assertEqual(body, b'GET /a |')
+        self.assertEqual(f.read(), b'')
+
+    def test_head_request_has_no_body(self):
+        f = self.serve(echo_app, b'HEAD / HTTP/1.1\r\n\r\n'
+                                 b'GET /after HTTP/1.1\r\n\r\n')
+        status, headers, body = read_response(f, head=True)
+        self.assertEqual(headers[b'content-length'], b'8')
+
+        # The next response must start immediately after the HEAD headers.
+        self.assertEqual(f.readline(), b'HTTP/1.1 200 OK\r\n')
+
+    def test_bad_request(self):
+        f = self.serve(echo_app, b'NONSENSE\r\n\r\n')
+        status, headers, body = read_response(f)
+
+        self.assertEqual(status, b'HTTP/1.1 400 Bad Request')
+        self.assertEqual(f.read(), b'')
+
+    def test_application_error(self):
+        f = self.serve(failing_app, b'GET / HTTP/1.1\r\n\r\n')
+        status, headers, body = read_response(f)
+
+        self.assertEqual(status, b'HTTP/1.1 500 Internal Server Error')
+
+    def test_after_request_can_close(self):
+        server, client = socket.socketpair()
+        conn = HTTPConnection(echo_app, server, ('127.0.0.1', 1234),
+                              ('localhost', 80), keepalive_timeout=1.0)
+        client.sendall(b'GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\n')
+
+        conn.handle(lambda: False)
+        f = client.makefile('rb')
+        read_response(f)
+        self.assertEqual(f.read(), b'')
+        self.assertEqual(conn.requests, 1)
+
+        f.close()
+        client.close()
+
+
+class TestGetRSS(unittest.TestCase):
+    def test_get_rss(self):
+        rss = get_rss()
+        self.assertTrue(rss is None or rss > 0)
+
+
+def pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode('ascii')]
+
+
+class TestPreforkServer(unittest.TestCase):
+    def start_server(self, **kwargs):
+        server = PreforkServer(pid_app, port=0, **kwargs)
+        server.bind()
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.run()
+            finally:
+                os._exit(0)
+
+        server.socket.close()
+        self.server_pid = pid
+        self.port = server.address[1]
+        self.addCleanup(self.stop_server)
+
+        # Wait for the workers to start listening.
+        for i in range(50):
+            try:
+                self.get()
+                break
+            except socket.error:
+                time.sleep(0.1)
+
+    def stop_server(self):
+        os.kill(self.server_pid, signal.SIGTERM)
+        _, status = os.waitpid(self.server_pid, 0)
+        self.assertEqual(status, 0)
+
+    def get(self, retries=0):
+        for i in range(retries + 1):
+            try:
+                return self._get()
+            except (socket.error, ValueError):
+                if i == retries:
+                    raise
+                time.sleep(0.1)
+
+    def _get(self):
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=5)
+        try:
+            sock.sendall(b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+            f = sock.makefile('rb')
+            status, headers, body = read_response(f)
+            f.close()
+            return int(body)
+        finally:
+            sock.close()
+
+    @slow_test
+    def test_serves_requests(self):
+        self.start_server(workers=2)
+        pids = set(self.get() for i in range(10))
+        self.assertTrue(1 <= len(pids) <= 2)
+        self.assertNotIn(os.getpid(), pids)
+
+    @slow_test
+    def test_recycles_workers(self):
+        self.start_server(workers=1, max_requests=2)
+        # A worker may be restarting when we connect, so we retry.
+        pids = [self.get(retries=30) for i in range(6)]
+        self.assertTrue(len(set(pids)) >= 3)
+
+    @slow_test
+    def test_graceful_restart(self):
+        self.start_server(workers=1)
+        before = self.get()
+
+        os.kill(self.server_pid, signal.SIGHUP)
+        for i in range(50):
+            if self.get(retries=30) != before:
+                break
+            time.sleep(0.1)
+        else:                   # pragma: no cover
+            self.fail("Workers were not restarted")
+
+
+class TestThreadedServer(unittest.TestCase):
+    def start_server(self, app, **kwargs):
+        self.server = ThreadedServer(app, port=0, **kwargs)
+        self.server.bind()
+
+        t = threading.Thread(target=self.server.run)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.server.stop)
+
+    def connect(self):
+        sock = socket.create_connection(self.server.address, timeout=5)
+        f = sock.makefile('rb')
+        self.addCleanup(sock.close)
+        self.addCleanup(f.close)
+        return sock, f
+
+    def test_keep_alive(self):
+        self.start_server(echo_app, threads=2)
+        sock, f = self.connect()
+
+        sock.sendall(b'GET /one HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'GET /one |')
+
+        # The connection goes back to being idle between requests.
+        time.sleep(0.1)
+        self.assertEqual(self.server.stats()['idle_connections'], 1)
+
+        sock.sendall(b'GET /two HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'GET /two |')
+
+    def test_pipelining(self):
+        self.start_server(echo_app, threads=2)
+        sock, f = self.connect()
+
+        sock.sendall(b'GET /one HTTP/1.1\r\n\r\n'
+                     b'GET /two HTTP/1.1\r\n\r\n')
+        self.assertEqual(read_response(f)[2], b'GET /one |')
+        self.assertEqual(read_response(f)[2], b'GET /two |')
+
+        # Both requests were served by a single dispatch to a worker.
+        for i in range(50):
+            if self.server.stats()['idle_connections'] == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.stats()['requests'], 2)
+
+    def test_full_queue_is_rejected(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking_app(environ, start_response):
+            started.set()
+            release.wait()
+            start_response('200 OK', [])
+            return [b'done']
+
+        self.start_server(blocking_app, threads=1, queue_size=1)
+
+        # The first connection occupies the only worker, and the second
+        # fills the queue.
+        first, first_f = self.connect()
+        first.sendall(b'GET / HTTP/1.1\r\n\r\n')
+        started.wait()
+
+        second, second_f = self.connect()
+        second.sendall(b'GET / HTTP/1.1\r\n\r\n')
+        for i in range(50):
+            if self.server.stats()['queue_depth'] == 1:
+                break
+            time.sleep(0.01)
+
+        stats = self.server.stats()
+        self.assertEqual(stats['busy_threads'], 1)
+        self.assertEqual(stats['utilization'], 1.0)
+
+        third, third_f = self.connect()
+        status, headers, body = read_response(third_f)
+        self.assertEqual(status, b'HTTP/1.1 503 Service Unavailable')
+        self.assertEqual(headers[b'retry-after'], b'1')
+        self.assertEqual(self.server.stats()['rejected'], 1)
+
+        release.set()
+        self.assertEqual(read_response(first_f)[2], b'done')
+        self.assertEqual(read_response(second_f)[2], b'done')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestParsing))
+    suite.addTest(unittest.makeSuite(TestHTTPConnection))
+    suite.addTest(unittest.makeSuite(TestGetRSS))
+    suite.addTest(unittest.makeSuite(TestPreforkServer))
+    suite.addTest(unittest.makeSuite(TestThreadedServer))
+
+    return suite
@@ -0,0 +1,283 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import time
+import socket
+import threading
+from hoboken.tests.compat import unittest
+
+import hoboken
+from hoboken.application import Request
+from hoboken.serving import ThreadedServer
+from hoboken.sse import HEARTBEAT, Broker, Event, EventStream, encode_event
+
+try:
+    from hoboken.aioserving import AsyncServer
+except ImportError:         # pragma: no cover
+    AsyncServer = None
+
+
+class TestEncoding(unittest.TestCase):
+    def test_all_fields(self):
+        data = encode_event('hello', event='greeting', id=3, retry=1000)
+        self.assertEqual(data, b'id: 3\nevent: greeting\nretry: 1000\n'
+                               b'data: hello\n\n')
+
+    def test_multi_line_data(self):
+        self.assertEqual(encode_event(u'one\ntwo'),
+                         b'data: one\ndata: two\n\n')
+
+    def test_empty_data(self):
+        self.assertEqual(encode_event(''), b'data: \n\n')
+
+    def test_line_breaks_in_fields(self):
+        self.assertRaises(ValueError, encode_event, 'x', id='1\ndata: y')
+        self.assertRaises(ValueError, encode_event, 'x', event=u'a\rb')
+        self.assertRaises(ValueError, Event, 'x', event=b'a\r\nb')
+
+    def test_event_is_encoded_once(self):
+        e = Event('foo', event='bar')
+        self.assertEqual(e.encoded, b'event: bar\ndata: foo\n\n')
+
+
+class TestBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker(max_queue=3)
+
+    def test_fan_out_shares_encoding(self):
+        subs = [self.broker.subscribe('news') for i in range(3)]
+        self.assertEqual(self.broker.publish('news', 'hello'), 3)
+
+        events = [s.get_nowait() for s in subs]
+        self.assertEqual(events[0], b'data: hello\n\n')
+        for e in events[1:]:
+            self.assertIs(e, events[0])
+
+    def test_topics(self):
+        news = self.broker.subscribe('news')
+        both = self.broker.subscribe('news', 'sport')
+
+        self.broker.publish('sport', 'goal')
+        self.assertIsNone(news.get_nowait())
+        self.assertEqual(both.get_nowait(), b'data: goal\n\n')
+
+    def test_drops_oldest(self):
+        sub = self.broker.subscribe('news')
+        for i in range(5):
+            self.broker.publish('news', i)
+
+        self.assertEqual(sub.dropped, 2)
+        self.assertEqual(sub.get_nowait(), b'data: 2\n\n')
+        self.assertEqual(self.broker.stats()['dropped'], 2)
+
+    def test_close_unsubscribes(self):
+        sub = self.broker.subscribe('news', 'sport')
+        self.assertEqual(self.broker.subscribers(), 1)
+
+        sub.close()
+        self.assertEqual(self.broker.subscribers(), 0)
+        self.assertEqual(self.broker.publish('news', 'hello'), 0)
+
+    def test_get_wakes_on_publish(self):
+        sub = self.broker.subscribe('news')
+
+        def publisher():
+            time.sleep(0.05)
+            self.broker.publish('news', 'late')
+
+        t = threading.Thread(target=publisher)
+        t.start()
+        self.assertEqual(sub.get(timeout=5), b'data: late\n\n')
+        t.join()
+
+
+class TestEventStream(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker()
+
+    def test_heartbeat_when_idle(self):
+        stream = EventStream(self.broker.subscribe('news'), heartbeat=0.01)
+        self.assertEqual(next(stream), HEARTBEAT)
+        self.assertEqual(next(stream), HEARTBEAT)
+
+        self.broker.publish('news', 'hello')
+        self.assertEqual(next(stream), b'data: hello\n\n')
+
+    def test_retry_preamble(self):
+        stream = EventStream(iter([]), retry=500)
+        self.assertEqual(next(stream), b'retry: 500\n\n')
+        self.assertRaises(StopIteration, next, stream)
+
+    def test_iterable_source(self):
+        stream = EventStream([Event('a', id=1), b'data: raw\n\n', u'text'])
+        self.assertEqual(list(stream)[1:], [
+            b'id: 1\ndata: a\n\n', b'data: raw\n\n', b'data: text\n\n'])
+
+    def test_poll(self):
+        sub = self.broker.subscribe('news')
+        stream = EventStream(sub)
+        self.assertTrue(stream.pollable)
+
+        self.assertEqual(stream.poll(), HEARTBEAT)
+        self.assertIsNone(stream.poll())
+        self.broker.publish('news', 'hello')
+        self.assertEqual(stream.poll(), b'data: hello\n\n')
+
+        sub.close()
+        self.assertRaises(StopIteration, stream.poll)
+
+    def test_close_unsubscribes(self):
+        stream = EventStream(self.broker.subscribe('news'))
+        stream.close()
+        self.assertEqual(self.broker.subscribers('news'), 0)
+
+
+class TestEventStreamHelper(HobokenTestCase):
+    def after_setup(self):
+        @self.app.get("/events")
+        def events():
+            self.app.event_stream([Event('one'), Event('two')], retry=100)
+
+    def test_response(self):
+        resp = Request.build("/events").get_response(self.app)
+        self.assertEqual(resp.headers['Content-Type'], b'text/event-stream')
+        self.assertEqual(resp.headers['Cache-Control'], b'no-cache')
+        self.assertEqual(resp.body, b'retry: 100\n\ndata: one\n\n'
+                                    b'data: two\n\n')
+
+    def test_no_etag_for_streams(self):
+        self.app.config['AUTO_ETAG'] = True
+        resp = Request.build("/events").get_response(self.app)
+        self.assertIsNone(resp.etag)
+
+
+class ServerStreamingMixin(object):
+    """
+    Tests that a server sends events as they're published, rather than
+    buffering them.
+    """
+    def start_server(self):
+        raise NotImplementedError()
+
+    def setUp(self):
+        self.broker = Broker()
+        self.app = hoboken.HobokenApplication(self.__class__.__name__)
+
+        @self.app.get("/events")
+        def events():
+            self.app.event_stream(self.broker.subscribe('news'),
+                                  heartbeat=0.05)
+
+        self.start_server()
+
+    def connect(self):
+        sock = socket.create_connection(self.server.address, timeout=5)
+        f = sock.makefile('rb')
+        self.addCleanup(sock.close)
+        self.addCleanup(f.close)
+        return sock, f
+
+    def read_chunk(self, f):
+        size = int(f.readline().strip(), 16)
+        data = f.read(size)
+        f.readline()
+        return data
+
+    def wait_for_subscribers(self, count):
+        for i in range(100):
+            if self.broker.subscribers('news') == count:
+                return
+            time.sleep(0.01)
+        self.fail("Timed out waiting for subscribers")
+
+    def test_events_are_streamed(self):
+        sock, f = self.connect()
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+
+        self.assertEqual(f.readline(), b'HTTP/1.1 200 OK\r\n')
+        while f.readline() != b'\r\n':
+            pass
+        self.assertEqual(self.read_chunk(f), HEARTBEAT)
+
+        self.wait_for_subscribers(1)
+        self.broker.publish('news', 'hello')
+        data = self.read_chunk(f)
+        while data == HEARTBEAT:
+            data = self.read_chunk(f)
+        self.assertEqual(data, b'data: hello\n\n')
+
+        # Heartbeats are sent while nothing is published.
+        self.assertEqual(self.read_chunk(f), HEARTBEAT)
+
+    def test_disconnect_unsubscribes(self):
+        sock, f = self.connect()
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+        self.assertEqual(f.readline(), b'HTTP/1.1 200 OK\r\n')
+        self.wait_for_subscribers(1)
+
+        f.close()
+        sock.close()
+        self.wait_for_subscribers(0)
+
+
+class TestThreadedServerStreaming(ServerStreamingMixin, unittest.TestCase):
+    def start_server(self):
+        self.server = ThreadedServer(self.app, port=0, threads=2)
+        self.server.bind()
+
+        t = threading.Thread(target=self.server.run)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.server.stop)
+
+
+    def test_stop_closes_streams(self):
+        sock, f = self.connect()
+        sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+        self.assertEqual(f.readline(), b'HTTP/1.1 200 OK\r\n')
+        self.wait_for_subscribers(1)
+
+        start = time.time()
+        self.server.stop()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(self.broker.subscribers('news'), 0)
+
+
+@unittest.skipIf(AsyncServer is None, "asyncio is not available")
+class TestAsyncServerStreaming(ServerStreamingMixin, unittest.TestCase):
+    def start_server(self):
+        self.server = AsyncServer(self.app, port=0, threads=2)
+        self.server.bind()
+
+        t = threading.Thread(target=self.server.run)
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.server.stop)
+
+    def test_streams_do_not_hold_threads(self):
+        conns = [self.connect() for i in range(4)]
+        for sock, f in conns:
+            sock.sendall(b'GET /events HTTP/1.1\r\n\r\n')
+        self.wait_for_subscribers(4)
+
+        # All four streams are open, with only two threads.  A stream
+        # subscribes before its handler returns, so the threads may take a
+        # moment to become free.
+        for i in range(100):
+            if self.server.stats()['busy'] == 0:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.server.stats()['busy'], 0)
+        self.assertEqual(self.broker.publish('news', 'hello'), 4)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestEncoding))
+    suite.addTest(unittest.makeSuite(TestBroker))
+    suite.addTest(unittest.makeSuite(TestEventStream))
+    suite.addTest(unittest.makeSuite(TestEventStreamHelper))
+    suite.addTest(unittest.makeSuite(TestThreadedServerStreaming))
+    suite.addTest(unittest.makeSuite(TestAsyncServerStreaming))
+
+    return suite
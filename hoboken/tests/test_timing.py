@@ -0,0 +1,117 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+from hoboken.tests.compat import unittest
+
+from hoboken.application import Request, halt
+from hoboken.timing import TIMER_KEY, PhaseTimer, TimedBody
+
+
+class TestPhaseTimer(unittest.TestCase):
+    def test_phases_accumulate_in_order(self):
+        timer = PhaseTimer()
+        timer.add('match', 0.001)
+        timer.add('handler', 0.002)
+        timer.add('match', 0.003)
+
+        self.assertEqual(timer.order, ['match', 'handler'])
+        self.assertAlmostEqual(timer.durations['match'], 0.004)
+
+    def test_counts(self):
+        timer = PhaseTimer()
+        timer.count('routes_tried')
+        timer.count('routes_tried', 2)
+        self.assertEqual(timer.counts, {'routes_tried': 3})
+
+    def test_server_timing(self):
+        timer = PhaseTimer()
+        timer.add('handler', 0.0015)
+        value = timer.server_timing()
+        self.assertTrue(value.startswith('handler;dur=1.500, total;dur='))
+
+
+class TestTimedBody(unittest.TestCase):
+    def test_callback_once_exhausted(self):
+        timer = PhaseTimer()
+        timed = []
+        body = TimedBody([b'a', b'b'], timer, timed.append)
+
+        self.assertEqual(list(body), [b'a', b'b'])
+        self.assertEqual(timed, [timer])
+        self.assertIn('body', timer.durations)
+        self.assertIsNotNone(timer.finished)
+
+        body.close()
+        self.assertEqual(timed, [timer])
+
+
+class TestRequestTiming(HobokenTestCase):
+    def after_setup(self):
+        self.timed = []
+        self.app.on_request_timed = lambda environ, timer: \
+            self.timed.append(timer)
+
+        @self.app.before("/*")
+        def before(path):
+            pass
+
+        @self.app.get("/other")
+        def other():
+            return 'other'
+
+        @self.app.get("/timed")
+        def timed():
+            return 'timed'
+
+        @self.app.get("/halted")
+        def halted():
+            halt(code=403)
+
+    def get(self, path):
+        req = Request.build(path)
+        resp = req.get_response(self.app)
+        return req, resp
+
+    def test_disabled_by_default(self):
+        req, resp = self.get("/timed")
+        self.assertNotIn(TIMER_KEY, req.environ)
+        self.assertNotIn('Server-Timing', resp.headers)
+        self.assertEqual(self.timed, [])
+
+    def test_phases(self):
+        self.app.config['REQUEST_TIMING'] = True
+        req, resp = self.get("/timed")
+        self.assertEqual(resp.body, b'timed')
+
+        timer = req.environ[TIMER_KEY]
+        self.assertEqual(timer.order, ['request', 'before_filters', 'match',
+                                       'conditions', 'handler',
+                                       'returned_body', 'after_filters',
+                                       'body'])
+        self.assertEqual(timer.counts['routes_tried'], 2)
+        self.assertEqual(self.timed, [timer])
+        self.assertNotIn('Server-Timing', resp.headers)
+
+    def test_halted_handler_is_timed(self):
+        self.app.config['REQUEST_TIMING'] = True
+        req, resp = self.get("/halted")
+        self.assertEqual(resp.status_int, 403)
+        self.assertIn('handler', req.environ[TIMER_KEY].durations)
+
+    def test_server_timing_header(self):
+        self.app.config['REQUEST_TIMING'] = True
+        self.app.config['SERVER_TIMING_HEADER'] = True
+        req, resp = self.get("/timed")
+
+        header = resp.headers['Server-Timing']
+        for phase in (b'request;dur=', b'handler;dur=', b'total;dur='):
+            self.assertIn(phase, header)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestPhaseTimer))
+    suite.addTest(unittest.makeSuite(TestTimedBody))
+    suite.addTest(unittest.makeSuite(TestRequestTiming))
+
+    return suite
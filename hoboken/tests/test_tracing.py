@@ -0,0 +1,264 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import os
+import json
+import shutil
+import tempfile
+import threading
+from hoboken.tests.compat import unittest
+
+import hoboken
+from hoboken.application import Request
+from hoboken.tracing import (BatchExporter, Trace, TRACE_KEY,
+                             parse_traceparent, KIND_SERVER, STATUS_ERROR)
+
+
+class ListExporter(object):
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+def by_name(trace):
+    return dict((span.name, span) for span in trace.spans)
+
+
+class TestTrace(unittest.TestCase):
+    def test_spans_nest(self):
+        trace = Trace(parent_id='a' * 16)
+        root = trace.start('root')
+        with trace.span('child', key='value') as child:
+            grandchild = trace.start('grandchild')
+
+        self.assertEqual(root.parent_id, 'a' * 16)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(grandchild.parent_id, child.span_id)
+        self.assertEqual(child.attributes, {'key': 'value'})
+
+        # Ending the child also ended the grandchild, which was left open.
+        self.assertIsNotNone(grandchild.end_time)
+        self.assertIs(trace.current, root)
+        root.end()
+        self.assertIsNone(trace.current)
+
+    def test_threads_have_their_own_stacks(self):
+        trace = Trace()
+        root = trace.start('root')
+        child = trace.start('child')
+        spans = []
+
+        def work():
+            span = trace.start('worker')
+            spans.append((span, trace.current))
+            trace.end(span)
+            spans.append(trace.current)
+
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+
+        # The worker's span is a child of the root, and ending it didn't
+        # touch this thread's spans.
+        worker, current = spans[0]
+        self.assertIs(current, worker)
+        self.assertEqual(worker.parent_id, root.span_id)
+        self.assertIsNone(spans[1])
+        self.assertIs(trace.current, child)
+        self.assertIsNone(child.end_time)
+
+    def test_errors_are_recorded(self):
+        trace = Trace()
+        try:
+            with trace.span('fails'):
+                raise ValueError("failure")
+        except ValueError:
+            pass
+
+        span = trace.spans[0].to_otlp()
+        self.assertEqual(span['status'], {'code': STATUS_ERROR,
+                                          'message': 'ValueError: failure'})
+
+    def test_parse_traceparent(self):
+        trace_id, span_id = '0af7651916cd43dd8448eb211c80319c', \
+            'b7ad6b7169203331'
+        self.assertEqual(
+            parse_traceparent('00-{0}-{1}-01'.format(trace_id, span_id)),
+            (trace_id, span_id))
+        self.assertIsNone(parse_traceparent(None))
+        self.assertIsNone(parse_traceparent('00-xyz-{0}-01'.format(span_id)))
+        self.assertIsNone(parse_traceparent('00-{0}-{1}-01'.format(
+            '0' * 32, span_id)))
+
+
+class TestBatchExporter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'traces.json')
+        self.exporter = BatchExporter(self.path, 'service', batch_size=2,
+                                      interval=10)
+        self.addCleanup(self.exporter.close, 5)
+
+    def trace(self, *names):
+        trace = Trace()
+        for name in names:
+            trace.start(name).end()
+        return trace
+
+    def lines(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_writes_batches(self):
+        self.exporter.export(self.trace('one', 'two', 'three'))
+        self.assertTrue(self.exporter.flush(5))
+
+        lines = self.lines()
+        self.assertEqual(len(lines), 2)
+        resource = lines[0]['resourceSpans'][0]
+        self.assertEqual(resource['resource']['attributes'], [
+            {'key': 'service.name', 'value': {'stringValue': 'service'}}])
+
+        spans = [span for line in lines
+                 for span in line['resourceSpans'][0]['scopeSpans'][0]
+                 ['spans']]
+        self.assertEqual([s['name'] for s in spans], ['one', 'two', 'three'])
+        self.assertEqual(self.exporter.written, 3)
+
+    def test_drops_when_full(self):
+        self.exporter.queue_size = 2
+        self.assertFalse(self.exporter.export(self.trace('a', 'b', 'c')))
+        self.assertEqual(self.exporter.dropped, 3)
+
+
+class TestRequestTracing(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['TRACING'] = True
+        self.exporter = self.app.tracer.exporter = ListExporter()
+
+        sub = self.sub = hoboken.HobokenApplication('sub')
+        sub.config['TRACING'] = True
+        sub.tracer.exporter = self.exporter
+        seen = self.seen = []
+
+        @sub.get("/sub/*")
+        def sub_route(path):
+            seen.append(sub.request.environ)
+            with sub.span('sub_work'):
+                pass
+            return 'sub'
+
+        @self.app.before("/*")
+        def before(path):
+            pass
+
+        @self.app.get("/users/:id")
+        def user(id):
+            with self.app.span('load_user', user_id=int(id)) as span:
+                span.set_attribute('found', True)
+            return 'user'
+
+        @self.app.get("/sub/:name")
+        def delegated(name):
+            self.app.delegate(sub)
+
+        @self.app.get("/fetch")
+        def fetch():
+            return Request.build('/sub/fetched').get_response(sub).text
+
+    def test_phase_and_user_spans(self):
+        self.assert_body_is('user', '/users/1')
+
+        self.assertEqual(len(self.exporter.traces), 1)
+        trace = self.exporter.traces[0]
+        spans = by_name(trace)
+        root = spans['GET /users/:id']
+        self.assertIs(trace.root, root)
+        self.assertEqual(root.kind, KIND_SERVER)
+        self.assertEqual(root.attributes['http.status_code'], 200)
+
+        for name in ('before_filters', 'routes', 'after_filters'):
+            self.assertEqual(spans[name].parent_id, root.span_id)
+        self.assertEqual(spans['load_user'].parent_id,
+                         spans['routes'].span_id)
+        self.assertEqual(spans['load_user'].attributes,
+                         {'user_id': 1, 'found': True})
+        self.assertTrue(all(s.end_time is not None for s in trace.spans))
+
+    def test_delegated_app_joins_trace(self):
+        self.assert_body_is('sub', '/sub/name')
+
+        # Only the outer application exports the trace.
+        self.assertEqual(len(self.exporter.traces), 1)
+        trace = self.exporter.traces[0]
+        spans = by_name(trace)
+
+        # Both applications have a 'routes' span; the outer one's is the
+        # parent of the call to the other application.
+        self.assertEqual(trace.root.name, 'GET /sub/:name')
+        routes = [s for s in trace.spans if s.name == 'routes' and
+                  s.parent_id == trace.root.span_id]
+        self.assertEqual(spans['get_response'].parent_id, routes[0].span_id)
+        self.assertEqual(spans['GET /sub/*'].parent_id,
+                         spans['get_response'].span_id)
+        sub_routes = [s for s in trace.spans if s.name == 'routes' and
+                      s.parent_id == spans['GET /sub/*'].span_id]
+        self.assertEqual(spans['sub_work'].parent_id, sub_routes[0].span_id)
+        self.assertEqual(spans['get_response'].attributes['http.status_code'],
+                         200)
+
+    def test_sub_request_joins_trace(self):
+        self.assert_body_is('sub', '/fetch')
+
+        trace = self.exporter.traces[0]
+        spans = by_name(trace)
+        self.assertEqual(spans['GET /sub/*'].parent_id,
+                         spans['get_response'].span_id)
+
+        # The sub-request's environ is told about the trace.
+        self.assertEqual(parse_traceparent(self.seen[0]['HTTP_TRACEPARENT']),
+                         (trace.trace_id, spans['get_response'].span_id))
+
+    def test_continues_incoming_trace(self):
+        trace_id, span_id = '0af7651916cd43dd8448eb211c80319c', \
+            'b7ad6b7169203331'
+        req = Request.build('/users/1')
+        req.headers['traceparent'] = '00-{0}-{1}-01'.format(trace_id,
+                                                            span_id)
+        req.get_response(self.app)
+
+        trace = self.exporter.traces[0]
+        self.assertEqual(trace.trace_id, trace_id)
+        self.assertEqual(trace.root.parent_id, span_id)
+
+    def test_disabled(self):
+        self.app.config['TRACING'] = False
+        self.assert_body_is('user', '/users/1')
+        self.assertEqual(self.exporter.traces, [])
+
+    def test_trace_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'traces.json')
+        self.app.config['TRACE_FILE'] = path
+        self.app.tracer.exporter = None
+
+        self.call_app('/users/1')
+        self.assertTrue(self.app.tracer.exporter.close(5))
+        with open(path) as f:
+            data = json.loads(f.readline())
+        names = [s['name'] for s in
+                 data['resourceSpans'][0]['scopeSpans'][0]['spans']]
+        self.assertIn('GET /users/:id', names)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTrace))
+    suite.addTest(unittest.makeSuite(TestBatchExporter))
+    suite.addTest(unittest.makeSuite(TestRequestTracing))
+
+    return suite
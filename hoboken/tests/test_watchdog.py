@@ -0,0 +1,131 @@
+from __future__ import with_statement, print_function
+
+from . import HobokenTestCase
+import time
+import logging
+import threading
+from hoboken.tests.compat import unittest
+
+from mock import Mock
+
+from hoboken.watchdog import Watchdog
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.settings = {'SLOW_REQUEST_THRESHOLD': 0.5,
+                         'SLOW_REQUEST_HISTORY': 2}
+        self.logger = Mock()
+        self.watchdog = Watchdog(self.settings, self.logger)
+        self.addCleanup(self.watchdog.stop)
+
+    def environ(self, path='/slow'):
+        return {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '',
+                'PATH_INFO': path}
+
+    def test_reports_slow_requests_once(self):
+        entry = self.watchdog.register(self.environ())
+        self.assertEqual(self.watchdog.check(entry.started + 0.1), [])
+
+        slow = self.watchdog.check(entry.started + 1)
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0].path, '/slow')
+        self.assertEqual(slow[0].route, '<unmatched>')
+        self.assertIn('test_reports_slow_requests_once', slow[0].stack)
+        self.assertEqual(self.logger.warning.call_count, 1)
+
+        self.assertEqual(self.watchdog.check(entry.started + 2), [])
+        self.watchdog.unregister(entry)
+        self.assertEqual(self.watchdog.in_flight(), [])
+
+    def test_logs_request(self):
+        request = Mock()
+        entry = self.watchdog.register(self.environ(), request)
+        self.watchdog.check(entry.started + 1)
+        self.watchdog.unregister(entry)
+
+        extra = self.logger.warning.call_args[1]['extra']
+        self.assertIs(extra['request'], request)
+
+    def test_captures_other_threads(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def handler():
+            entry = self.watchdog.register(self.environ())
+            try:
+                release.wait()
+            finally:
+                self.watchdog.unregister(entry)
+
+        t = threading.Thread(target=handler)
+        t.start()
+        for i in range(100):
+            if self.watchdog.in_flight():
+                break
+            time.sleep(0.01)
+
+        slow = self.watchdog.check(time.time() + 1)
+        release.set()
+        t.join()
+
+        self.assertEqual(slow[0].thread_id, t.ident)
+        self.assertIn('release.wait()', slow[0].stack)
+
+    def test_history_is_bounded(self):
+        for path in ('/a', '/b', '/c'):
+            entry = self.watchdog.register(self.environ(path))
+            self.watchdog.check(entry.started + 1)
+            self.watchdog.unregister(entry)
+
+        self.assertEqual([s.path for s in self.watchdog.recent()],
+                         ['/b', '/c'])
+
+    def test_disabled(self):
+        entry = self.watchdog.register(self.environ())
+        self.settings['SLOW_REQUEST_THRESHOLD'] = None
+        self.assertEqual(self.watchdog.check(entry.started + 100), [])
+
+
+class TestSlowRequests(HobokenTestCase):
+    def after_setup(self):
+        self.app.config['SLOW_REQUEST_THRESHOLD'] = 0.05
+        self.addCleanup(self.app.watchdog.stop)
+
+        @self.app.get("/slow/:id")
+        def slow(id):
+            time.sleep(0.3)
+            return 'slow'
+
+        @self.app.get("/fast")
+        def fast():
+            return 'fast'
+
+    def test_slow_request_is_logged(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        self.app.logger.addHandler(handler)
+        self.addCleanup(self.app.logger.removeHandler, handler)
+
+        self.assert_body_is('fast', '/fast')
+        self.assert_body_is('slow', '/slow/1')
+
+        recent = self.app.watchdog.recent()
+        self.assertEqual([s.route for s in recent], ['/slow/:id'])
+        self.assertIn('time.sleep(0.3)', recent[0].stack)
+        self.assertEqual(self.app.watchdog.in_flight(), [])
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].app_name, self.app.name)
+        self.assertEqual(records[0].method, 'GET')
+        self.assertIs(records[0].slow_request, recent[0])
+        self.assertEqual(records[0].request.path_info, b'/slow/1')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestWatchdog))
+    suite.addTest(unittest.makeSuite(TestSlowRequests))
+
+    return suite
@@ -0,0 +1,111 @@
+"""
+Timing of the phases of handling a request.  When the REQUEST_TIMING config
+value is set, each request gets a PhaseTimer, which is stored in the
+request's environ, and which the application fills in as it goes.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import time
+
+from hoboken.objects.util import ClosingIterator
+from hoboken.six import advance_iterator
+
+
+# The environ key that holds a request's PhaseTimer.
+TIMER_KEY = 'hoboken.timer'
+
+# A high-resolution clock, where one is available.
+clock = getattr(time, 'perf_counter', time.time)
+
+# The CPU time used by the current thread, where that's available, or else
+# by the whole process.  Without either (on Python 2), it's the wall clock.
+cpu_clock = getattr(time, 'thread_time', None) or \
+    getattr(time, 'process_time', clock)
+
+
+class PhaseTimer(object):
+    """
+    The time spent in each phase of handling a request, in seconds, in the
+    order in which the phases first ran, along with some counts (e.g. of the
+    routes that were tried).  A phase that runs more than once - such as
+    matching, when several routes are tried - accumulates its time.
+    """
+    def __init__(self):
+        self.start = clock()
+        self.finished = None
+        self.order = []
+        self.durations = {}
+        self.counts = {}
+
+    def add(self, phase, seconds):
+        if phase in self.durations:
+            self.durations[phase] += seconds
+        else:
+            self.order.append(phase)
+            self.durations[phase] = seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = clock()
+
+    @property
+    def total(self):
+        """
+        The time from the start of the request until it finished, or until
+        now, if it hasn't.
+        """
+        end = self.finished if self.finished is not None else clock()
+        return end - self.start
+
+    def items(self):
+        return [(phase, self.durations[phase]) for phase in self.order]
+
+    def server_timing(self):
+        """
+        Format the phases, along with the total so far, as the value of a
+        Server-Timing header.  Durations are in milliseconds.
+        """
+        metrics = ['{0};dur={1:.3f}'.format(phase, seconds * 1000)
+                   for phase, seconds in self.items()]
+        metrics.append('total;dur={0:.3f}'.format(self.total * 1000))
+        return ', '.join(metrics)
+
+    def __repr__(self):
+        return "PhaseTimer({0})".format(', '.join(
+            '{0}={1:.6f}'.format(phase, seconds)
+            for phase, seconds in self.items()))
+
+
+class TimedBody(ClosingIterator):
+    """
+    Wraps a response body, adding the time spent producing it to a timer as
+    the 'body' phase.  Once the body has been exhausted or closed, the timer
+    is finished, and the callback is called with it.
+    """
+    def __init__(self, iterable, timer, callback):
+        super(TimedBody, self).__init__(iterable, [self._finished])
+        self._timer = timer
+        self._callback = callback
+
+    def next(self):
+        start = clock()
+        try:
+            return advance_iterator(self._iter)
+        except StopIteration:
+            self._timer.add('body', clock() - start)
+            start = None
+            self._run_callbacks()
+            raise
+        finally:
+            if start is not None:
+                self._timer.add('body', clock() - start)
+
+    # For Python 3.X
+    __next__ = next
+
+    def _finished(self):
+        self._timer.finish()
+        self._callback(self._timer)
@@ -0,0 +1,444 @@
+"""
+Tracing of requests as trees of spans.  When the TRACING config value is
+set, each request gets a Trace, which is stored in its environ.  The
+application adds spans for the phases of handling the request, handlers can
+add their own with app.span(), and sub-requests made with get_response()
+(and so delegate()) get a child span.  A sub-application that's called with
+the same environ, or with a sub-request's environ, adds its spans to the
+same trace.
+
+Finished traces are handed to an exporter; if the TRACE_FILE config value is
+set, a BatchExporter writes them to that file from a background thread, in
+the OpenTelemetry (OTLP) JSON format, one batch per line.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import json
+import time
+import random
+import logging
+from collections import deque
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.six import binary_type, integer_types, string_types
+
+
+logger = logging.getLogger(__name__)
+
+# The environ key that holds the Trace for the request in progress.
+TRACE_KEY = 'hoboken.trace'
+
+# The OTLP span kinds that we use.
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP status codes.
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+_random = random.SystemRandom()
+
+
+def new_trace_id():
+    return '{0:032x}'.format(_random.getrandbits(128))
+
+
+def new_span_id():
+    return '{0:016x}'.format(_random.getrandbits(64))
+
+
+def parse_traceparent(value):
+    """
+    Parse a W3C traceparent header, returning a (trace_id, span_id) tuple, or
+    None if it isn't valid.
+    """
+    parts = value.strip().split('-') if value else ()
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    trace_id, span_id = parts[1].lower(), parts[2].lower()
+    try:
+        if not int(trace_id, 16) or not int(span_id, 16):
+            return None
+    except ValueError:
+        return None
+    return trace_id, span_id
+
+
+def format_traceparent(span):
+    return '00-{0}-{1}-01'.format(span.trace.trace_id, span.span_id)
+
+
+class Span(object):
+    """
+    A timed operation within a trace.  Times are in seconds since the epoch.
+    """
+    def __init__(self, trace, name, parent_id, kind=KIND_INTERNAL,
+                 attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.end_time = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.error = message
+
+    def end(self):
+        self.trace.end(self)
+
+    @property
+    def duration(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end_time or self.start) * 1e9)),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': STATUS_UNSET},
+        }
+        if self.parent_id is not None:
+            span['parentSpanId'] = self.parent_id
+        if self.error is not None:
+            span['status'] = {'code': STATUS_ERROR, 'message': self.error}
+        return span
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None and self.error is None:
+            self.set_error('{0}: {1}'.format(exc_type.__name__, exc_value))
+        self.end()
+
+    def __repr__(self):
+        return "Span({0!r}, span_id={1}, parent_id={2})".format(
+            self.name, self.span_id, self.parent_id)
+
+
+class NullSpan(object):
+    """
+    Stands in for a Span when there's no trace, so that code can add spans
+    whether or not tracing is enabled.
+    """
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+class Trace(object):
+    """
+    The spans recorded for a request.  A new span is a child of the most
+    recent span that the same thread started and hasn't ended - so that
+    concurrent work (e.g. from gather()) doesn't nest under another
+    thread's spans.  On a thread with no open spans, it's a child of the
+    root span, or of the given parent if there's none.
+    """
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or new_trace_id()
+        self.parent_id = parent_id
+        self.root = None
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            stack = self._local.stack = []
+            return stack
+
+    @property
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start(self, name, attributes=None, kind=KIND_INTERNAL):
+        stack = self._stack()
+        with self._lock:
+            if stack:
+                parent = stack[-1].span_id
+            elif self.root is not None:
+                parent = self.root.span_id
+            else:
+                parent = self.parent_id
+            span = Span(self, name, parent, kind, attributes)
+            if self.root is None:
+                self.root = span
+            self.spans.append(span)
+        stack.append(span)
+        return span
+
+    def span(self, name, **attributes):
+        """
+        Start a span, for use as a context manager.
+        """
+        return self.start(name, attributes)
+
+    def end(self, span):
+        """
+        End a span, along with any spans started after it on this thread
+        that are still open (e.g. because an exception skipped over their
+        end).
+        """
+        now = time.time()
+        stack = self._stack()
+        if span in stack:
+            while stack:
+                open_span = stack.pop()
+                if open_span.end_time is None:
+                    open_span.end_time = now
+                if open_span is span:
+                    break
+        elif span.end_time is None:
+            span.end_time = now
+
+    def to_otlp(self):
+        return [span.to_otlp() for span in self.spans]
+
+    def __repr__(self):
+        return "Trace({0}, spans={1})".format(self.trace_id, len(self.spans))
+
+
+class Tracer(object):
+    """
+    Starts and finishes the traces for an application's requests.  The
+    settings are read from a mapping (normally the application's config);
+    if TRACE_FILE is set, and no exporter has been given, finished traces
+    are written to it by a BatchExporter.
+    """
+    def __init__(self, service_name, settings=None, exporter=None):
+        self.service_name = service_name
+        self.settings = settings if settings is not None else {}
+        self.exporter = exporter
+        self._lock = threading.Lock()
+
+    def begin(self, environ, name='request'):
+        """
+        Start the span for a request.  If the environ already has a trace
+        (because this application was called by another one), the span is
+        added to it; otherwise, a new trace is started, continuing the one
+        in the request's traceparent header, if there is one.
+        """
+        trace = environ.get(TRACE_KEY)
+        kind = KIND_INTERNAL
+        if trace is None:
+            parent = parse_traceparent(environ.get('HTTP_TRACEPARENT'))
+            trace = environ[TRACE_KEY] = Trace(*(parent or ()))
+            kind = KIND_SERVER
+        return trace.start(name, {'hoboken.app': self.service_name}, kind)
+
+    def end(self, span, method=None, route=None, status=None):
+        """
+        End a request's span, naming it after its route.  If it's the root
+        of its trace, the trace is exported.
+        """
+        if method is not None:
+            span.set_attribute('http.method', method)
+            span.name = method
+        if route is not None:
+            span.set_attribute('http.route', route)
+            span.name = '{0} {1}'.format(method, route)
+        if status is not None:
+            span.set_attribute('http.status_code', status)
+            if status >= 500:
+                span.set_error('HTTP {0}'.format(status))
+        span.end()
+
+        if span is span.trace.root:
+            self.export(span.trace)
+
+    def _get_exporter(self):
+        if self.exporter is None and self.settings.get('TRACE_FILE'):
+            with self._lock:
+                if self.exporter is None:
+                    self.exporter = BatchExporter(self.settings['TRACE_FILE'],
+                                                  self.service_name)
+        return self.exporter
+
+    def export(self, trace):
+        exporter = self._get_exporter()
+        if exporter is not None:
+            exporter.export(trace)
+
+
+class BatchExporter(object):
+    """
+    Writes finished traces to a file, in batches, from a background thread.
+    Each batch is written as one line of OTLP JSON.  If more than queue_size
+    spans are waiting to be written, new traces are dropped (and counted)
+    rather than blocking requests.
+    """
+    def __init__(self, path, service_name, batch_size=512, interval=1.0,
+                 queue_size=16384):
+        self.path = path
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue_size = queue_size
+
+        self.written = 0
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._pending = deque()
+        self._writing = False
+        self._flushing = 0
+        self._closed = False
+        self._pid = None
+
+    def export(self, trace):
+        """
+        Queue a trace's spans to be written.  Returns False if they were
+        dropped.
+        """
+        spans = trace.to_otlp()
+        with self._lock:
+            if self._closed:
+                return False
+            if self._pid != os.getpid():
+                self._start()
+
+            if len(self._pending) + len(spans) > self.queue_size:
+                self.dropped += len(spans)
+                return False
+
+            self._pending.extend(spans)
+            if len(self._pending) >= self.batch_size:
+                self._work.notify()
+        return True
+
+    def _start(self):
+        # Must be called with the lock held.
+        self._pid = os.getpid()
+        self._pending.clear()
+        self._writing = False
+        t = threading.Thread(target=self._run, name='hoboken-trace-export')
+        t.daemon = True
+        t.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                # Wait for a full batch, but write whatever we have once the
+                # interval passes, or if we've been asked to flush.
+                deadline = time.time() + self.interval
+                while len(self._pending) < self.batch_size and \
+                        not self._closed and not self._flushing:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._work.wait(remaining)
+
+                if not self._pending:
+                    if self._closed:
+                        return
+                    continue
+
+                count = min(len(self._pending), self.batch_size)
+                batch = [self._pending.popleft() for i in range(count)]
+                self._writing = True
+
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Error writing traces to %s", self.path)
+
+            with self._lock:
+                self._writing = False
+                self.written += len(batch)
+                if not self._pending:
+                    self._idle.notify_all()
+
+    def _write(self, spans):
+        data = {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes(
+                {'service.name': self.service_name})},
+            'scopeSpans': [{'scope': {'name': 'hoboken'}, 'spans': spans}],
+        }]}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(data, separators=(',', ':')) + '\n')
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued span has been written.  Returns False if the
+        timeout expired first.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self._lock:
+            self._flushing += 1
+            self._work.notify()
+            try:
+                while (self._pending or self._writing) and \
+                        self._pid == os.getpid():
+                    if timeout is None:
+                        self._idle.wait()
+                        continue
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._idle.wait(remaining)
+            finally:
+                self._flushing -= 1
+        return True
+
+    def close(self, timeout=None):
+        flushed = self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._work.notify_all()
+        return flushed
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, integer_types):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, binary_type):
+        value = value.decode('utf-8', 'replace')
+    elif not isinstance(value, string_types):
+        value = str(value)
+    return {'stringValue': value}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)}
+            for key, value in sorted(attributes.items())]
@@ -0,0 +1,187 @@
+"""
+Detection of slow requests.  When the SLOW_REQUEST_THRESHOLD config value is
+set, each request is registered with the application's Watchdog while it's in
+progress.  A background thread checks on them, and when a request has taken
+longer than the threshold, it captures the stack of the thread handling the
+request, logs it, and keeps it in a bounded history of recent slow requests.
+"""
+from __future__ import with_statement, absolute_import, print_function
+
+import os
+import sys
+import time
+import traceback
+from collections import deque
+try:
+    import threading
+except:                     # pragma: no cover
+    import dummy_threading as threading
+
+from hoboken.metrics import ROUTE_KEY, route_label
+
+
+class InFlight(object):
+    """
+    A request that's in progress.
+    """
+    __slots__ = ('environ', 'request', 'thread_id', 'started', 'reported')
+
+    def __init__(self, environ, thread_id, started, request=None):
+        self.environ = environ
+        self.request = request
+        self.thread_id = thread_id
+        self.started = started
+        self.reported = False
+
+    @property
+    def route(self):
+        return route_label(self.environ.get(ROUTE_KEY))
+
+
+class SlowRequest(object):
+    """
+    A request that took longer than the threshold, with the stack of its
+    thread at the time it was caught.
+    """
+    def __init__(self, method, path, route, thread_id, started, elapsed,
+                 stack):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.thread_id = thread_id
+        self.started = started
+        self.elapsed = elapsed
+        self.stack = stack
+
+    def __repr__(self):
+        return "SlowRequest({0} {1}, route={2!r}, elapsed={3:.3f})".format(
+            self.method, self.path, self.route, self.elapsed)
+
+
+class Watchdog(object):
+    """
+    Tracks the requests in progress, and reports those that are slow.  The
+    settings are read from a mapping (normally the application's config):
+      - SLOW_REQUEST_THRESHOLD: the time, in seconds, after which a request
+        is reported.
+      - SLOW_REQUEST_HISTORY: the number of slow requests to keep.
+
+    The checking thread is started when the first request is registered, and
+    is restarted in a forked child.
+    """
+    def __init__(self, settings, logger):
+        self.settings = settings
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._history = deque(maxlen=settings.get('SLOW_REQUEST_HISTORY', 50))
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+
+    def register(self, environ, request=None):
+        """
+        Start watching a request on the current thread, returning a token
+        to pass to unregister().  If the request object isn't available yet,
+        it can be set on the token's `request` attribute later.
+        """
+        entry = InFlight(environ, threading.current_thread().ident,
+                         time.time(), request)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._start()
+            self._in_flight[id(entry)] = entry
+        return entry
+
+    def unregister(self, entry):
+        with self._lock:
+            self._in_flight.pop(id(entry), None)
+
+    def in_flight(self):
+        with self._lock:
+            return list(self._in_flight.values())
+
+    def recent(self):
+        """
+        Return the recent slow requests, oldest first.
+        """
+        with self._lock:
+            return list(self._history)
+
+    def _start(self):
+        # Must be called with the lock held.
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='hoboken-watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        with self._lock:
+            self._pid = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            threshold = self.settings.get('SLOW_REQUEST_THRESHOLD')
+            interval = min(threshold / 4.0, 1.0) if threshold else 1.0
+            self._stopping.wait(interval)
+            if self._stopping.is_set():
+                return
+
+            try:
+                self.check()
+            except Exception:
+                self.logger.exception("Error checking for slow requests")
+
+    def check(self, now=None):
+        """
+        Report every request that has taken longer than the threshold, and
+        hasn't been reported yet.  Returns the SlowRequests.
+        """
+        threshold = self.settings.get('SLOW_REQUEST_THRESHOLD')
+        if not threshold:
+            return []
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            slow = [e for e in self._in_flight.values()
+                    if not e.reported and now - e.started > threshold]
+            for entry in slow:
+                entry.reported = True
+        if not slow:
+            return []
+
+        frames = sys._current_frames()
+        found = []
+        for entry in slow:
+            frame = frames.get(entry.thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else ''
+            found.append(self._report(entry, now - entry.started, stack))
+        return found
+
+    def _report(self, entry, elapsed, stack):
+        environ = entry.environ
+        method = environ.get('REQUEST_METHOD', '')
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        slow = SlowRequest(method, path, entry.route, entry.thread_id,
+                           entry.started, elapsed, stack)
+        with self._lock:
+            self._history.append(slow)
+
+        # The request isn't on this thread, so the application's
+        # InjectingFilter can't find it; we add its details ourselves.
+        extra = {'method': method, 'slow_request': slow}
+        if entry.request is not None:
+            extra['request'] = entry.request
+        self.logger.warning(
+            "Slow request: %s %s (route %s) has taken %.3fs so far, on "
+            "thread %s:\n%s", method, path, slow.route, elapsed,
+            entry.thread_id, stack, extra=extra)
+        return slow